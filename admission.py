@@ -0,0 +1,148 @@
+import threading
+
+from flask import g, jsonify, request
+
+from config import ADMISSION_LANES
+from metrics import REGISTRY
+
+ADMISSION_ACTIVE = REGISTRY.gauge(
+    "phonedash_admission_active_requests",
+    "Requests currently admitted, per lane.",
+    ("lane",),
+)
+ADMISSION_QUEUED = REGISTRY.gauge(
+    "phonedash_admission_queued_requests",
+    "Requests waiting for a slot, per lane.",
+    ("lane",),
+)
+ADMISSION_REJECTED = REGISTRY.counter(
+    "phonedash_admission_rejected_total",
+    "Requests rejected by admission control, per lane and reason.",
+    ("lane", "reason"),
+)
+
+
+def _export_requested():
+    return request.args.get("export_all", "false").lower() == "true"
+
+
+def _all_companies_requested():
+    # GET /api/companies without parameters returns the whole table
+    return not request.args
+
+
+def _bulk_filter_requested():
+    data = request.get_json(silent=True)
+    return isinstance(data, dict) and data.get("filter") is not None
+
+
+# Endpoints that can hold a thread for a long time: imports, exports, unpaginated
+# lists and whole-table scans. A value of True always counts as heavy; a callable
+# decides per request.
+HEAVY_ENDPOINTS = {
+    ("contacts_routes.import_contacts", "POST"): True,
+    ("contacts_routes.search_contacts", "GET"): _export_requested,
+    ("contacts_routes.handle_contacts", "GET"): True,
+    ("contacts_routes.bulk_delete_contacts", "POST"): _bulk_filter_requested,
+    ("contacts_routes.bulk_update_contacts", "POST"): _bulk_filter_requested,
+    ("companies_routes.handle_companies", "GET"): _all_companies_requested,
+    ("companies_routes.get_unique_companies_from_contacts", "GET"): True,
+    ("duplicates_routes.get_duplicate_clusters", "GET"): True,
+    ("duplicates_routes.scan_duplicates", "POST"): True,
+}
+
+# Never queued or rejected
+EXEMPT_ENDPOINTS = {"static", "assets"}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a lane has no free slot and its queue is full or timed out."""
+
+    def __init__(self, lane, reason):
+        super().__init__(f"{lane.name} lane {reason}")
+        self.lane = lane
+        self.reason = reason
+
+
+class Lane:
+    """A concurrency budget with a bounded, time-limited queue in front of it."""
+
+    def __init__(self, name, concurrency, queue_size, queue_timeout, retry_after):
+        self.name = name
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self._waiting = 0
+
+    def acquire(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self._waiting >= self.queue_size:
+                    ADMISSION_REJECTED.inc((self.name, "queue_full"))
+                    raise AdmissionRejected(self, "queue_full")
+                self._waiting += 1
+            ADMISSION_QUEUED.inc((self.name,))
+            try:
+                admitted = self._slots.acquire(timeout=self.queue_timeout)
+            finally:
+                ADMISSION_QUEUED.dec((self.name,))
+                with self._lock:
+                    self._waiting -= 1
+            if not admitted:
+                ADMISSION_REJECTED.inc((self.name, "queue_timeout"))
+                raise AdmissionRejected(self, "queue_timeout")
+        ADMISSION_ACTIVE.inc((self.name,))
+
+    def release(self):
+        ADMISSION_ACTIVE.dec((self.name,))
+        self._slots.release()
+
+
+LANES = {name: Lane(name, **settings) for name, settings in ADMISSION_LANES.items()}
+
+
+def classify_request():
+    """Returns the lane name of the current request, or None if it is exempt."""
+    if request.endpoint in EXEMPT_ENDPOINTS:
+        return None
+    rule = HEAVY_ENDPOINTS.get((request.endpoint, request.method))
+    if rule is True or (callable(rule) and rule()):
+        return "heavy"
+    return "light"
+
+
+def init_admission_control(app):
+    """Registers the hooks that admit requests into their lane or reject them quickly."""
+
+    @app.before_request
+    def admit_request():
+        lane_name = classify_request()
+        if lane_name is None:
+            return None
+        lane = LANES[lane_name]
+        try:
+            lane.acquire()
+        except AdmissionRejected as e:
+            app.logger.warning(
+                "Request rejected by admission control: %s %s (%s)",
+                request.method,
+                request.path,
+                e,
+            )
+            # A full queue means the client should back off; a timeout means we are overloaded
+            status = 429 if e.reason == "queue_full" else 503
+            return (
+                jsonify({"error": "Server is busy, please try again shortly"}),
+                status,
+                {"Retry-After": str(lane.retry_after)},
+            )
+        g.admission_lane = lane
+        return None
+
+    @app.teardown_request
+    def release_admission(exc):
+        lane = g.pop("admission_lane", None)
+        if lane is not None:
+            lane.release()
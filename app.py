@@ -1,8 +1,26 @@
-import webbrowser
+# Imported first so the startup report measures everything after it
+from startup import init_startup_report, mark_startup_phase
 from flask import Flask
-from waitress import serve
-from config import SECRET_KEY, setup_logging
+from config import (
+    BACKGROUND_JOBS,
+    SECRET_KEY,
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_THREADS,
+    setup_logging,
+)
+from audit import init_audit_log
 from database import init_db
+from duplicates import start_duplicate_scanner
+from maintenance import start_maintenance_scheduler
+from admission import init_admission_control
+from assets import init_assets
+from metrics import init_metrics
+from query_budget import init_query_budgets
+from profiler import init_profiler
+from serialization import FastJSONProvider
+from snapshot import init_read_snapshot
+from writer import init_write_coordinator
 
 # Import route modules
 from routes.main import main_routes
@@ -10,16 +28,51 @@ from routes.auth import auth_routes
 from routes.contacts import contacts_routes
 from routes.companies import companies_routes
 from routes.users import users_routes
+from routes.duplicates import duplicates_routes
+from routes.admin import admin_routes
+
+mark_startup_phase("imports")
 
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
+app.json = FastJSONProvider(app)
 
 # Setup logging
 setup_logging()
 
-# Initialize the database when the application starts
+# Record per-route request metrics
+init_metrics(app)
+
+# Profile requests flagged by an admin (X-Profile header or ?profile=1)
+init_profiler(app)
+
+# Separate concurrency budgets for heavy (import/export/list) and light requests
+init_admission_control(app)
+
+# Abort SQL that runs past its endpoint's time budget
+init_query_budgets(app)
+
+mark_startup_phase("setup")
+
+# Initialize the database when the application starts (a single PRAGMA once migrated)
 with app.app_context():
     init_db()
+mark_startup_phase("schema")
+
+# Write the audit trail of changes in batches from a background thread
+init_audit_log(app)
+
+# Apply contact and company writes on one thread, committing concurrent writes together
+init_write_coordinator(app)
+
+# Serve reads from an in-memory copy of the database (PHONEBOOK_READ_SNAPSHOT=1)
+init_read_snapshot(app)
+
+mark_startup_phase("services")
+
+# Serve static files under content-hashed names, precompressed and cached for a year
+init_assets(app)
+mark_startup_phase("assets")
 
 # Register blueprints
 app.register_blueprint(main_routes)
@@ -27,8 +80,24 @@ app.register_blueprint(auth_routes, url_prefix="/api")
 app.register_blueprint(contacts_routes, url_prefix="/api")
 app.register_blueprint(companies_routes, url_prefix="/api")
 app.register_blueprint(users_routes, url_prefix="/api")
+app.register_blueprint(duplicates_routes, url_prefix="/api")
+app.register_blueprint(admin_routes, url_prefix="/api")
+mark_startup_phase("blueprints")
 
+# Scan for duplicate contacts and maintain the database file in the background
+if BACKGROUND_JOBS:
+    start_duplicate_scanner(app)
+    start_maintenance_scheduler(app)
+mark_startup_phase("background_jobs")
 
+# Log how long startup took and time the first request
+init_startup_report(app)
+
+
+# Desktop launcher; use server.py for server deployments and multi-process mode
 if __name__ == "__main__":
-    webbrowser.open("http://127.0.0.1:5000/login.html")
-    serve(app, host="0.0.0.0", port=5000)
+    import webbrowser
+    from waitress import serve
+
+    webbrowser.open(f"http://127.0.0.1:{SERVER_PORT}/login.html")
+    serve(app, host=SERVER_HOST, port=SERVER_PORT, threads=SERVER_THREADS)
@@ -0,0 +1,530 @@
+"""Static asset pipeline.
+
+Every file under static/ is copied to static/dist/ under a name that contains
+a hash of its content (``js/utils.3f2a9c41d0be.js``), with references between
+files (CSS ``url()``, ES module imports) rewritten to the hashed names. Text
+files also get gzip and, when the optional ``brotli`` package is installed,
+brotli variants. /assets/ serves the best variant the browser accepts with a
+year of immutable caching, so a page load after the first downloads nothing
+that has not changed.
+
+Templates reference files through ``asset_url('styles.css')`` and load ES
+modules with ``module_scripts('js/contacts.js', ...)``, which adds
+modulepreload links for the whole import graph or, with
+PHONEBOOK_ASSET_BUNDLE=1, loads one bundle of the page's modules.
+
+The build runs on startup when a source file, template or option changed
+since the last one (server.py runs it once before starting workers). It can
+also be run by hand:
+
+    python assets.py build
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import sys
+
+from flask import abort, request, send_file, url_for
+from markupsafe import Markup
+
+from config import (
+    ASSET_BROTLI_QUALITY,
+    ASSET_BUNDLE_JS,
+    ASSET_GZIP_LEVEL,
+    ASSET_MAX_AGE,
+    ASSET_MINIFY,
+    ASSET_PIPELINE,
+    setup_logging,
+)
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:  # optional dependency
+    rjsmin = None
+
+try:
+    import rcssmin
+except ImportError:  # optional dependency
+    rcssmin = None
+
+logger = logging.getLogger("phonedash.assets")
+
+BUILD_DIR = "dist"
+MANIFEST_NAME = "manifest.json"
+HASH_LENGTH = 12
+# Variants in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+COMPRESSIBLE_TYPES = {"text/css", "text/javascript", "image/svg+xml", "application/json"}
+# Variants that save less than this fraction are not kept (fonts and images are compressed already)
+MIN_COMPRESSION_SAVING = 0.1
+
+_TYPES = {".js": "text/javascript", ".css": "text/css", ".woff2": "font/woff2", ".woff": "font/woff"}
+_HASHED_NAME = re.compile(r"\.[0-9a-f]{%d}(?=\.[^./]+$)" % HASH_LENGTH)
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+_JS_SPECIFIER = re.compile(
+    r"""(\bimport\s*(?:\{[^}]*\}\s*from\s*)?|\bexport\s*\{[^}]*\}\s*from\s*)(['"])(\.{1,2}/[^'"]+)\2"""
+)
+_MODULE_SCRIPTS_CALL = re.compile(r"module_scripts\(([^)]*)\)")
+_QUOTED = re.compile(r"""['"]([^'"]+)['"]""")
+
+# Module syntax the bundler understands: named imports and exported declarations
+_IMPORT_BINDINGS = re.compile(
+    r"""^[ \t]*import\s*\{([^}]*)\}\s*from\s*(['"])(\.{1,2}/[^'"]+)\2[ \t]*;?""", re.M
+)
+_IMPORT_SIDE_EFFECT = re.compile(r"""^[ \t]*import\s*(['"])(\.{1,2}/[^'"]+)\1[ \t]*;?""", re.M)
+_EXPORT_DECLARATION = re.compile(
+    r"^([ \t]*)export\s+((?:async\s+)?function\s*\*?\s*|const\s+|class\s+)([A-Za-z_$][\w$]*)", re.M
+)
+_UNSUPPORTED_MODULE_SYNTAX = re.compile(r"""^[ \t]*(?:import[\s{*'"]|export\b)|\bimport\s*[(.]""", re.M)
+
+_manifest = None
+_build_dir = None
+
+
+class AssetError(Exception):
+    """Raised when modules cannot be bundled; the page then loads them separately."""
+
+
+def _mimetype(name):
+    extension = posixpath.splitext(name)[1]
+    return _TYPES.get(extension) or mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+def _hashed_name(name, data):
+    stem, extension = posixpath.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{extension}"
+
+
+def _resolve(base, reference):
+    """Returns the static/-relative name ``reference`` points to from file ``base``."""
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base), reference))
+
+
+def _relative(base, target):
+    path = posixpath.relpath(target, posixpath.dirname(base) or ".")
+    return path if path.startswith(".") else f"./{path}"
+
+
+def _read_sources(static_dir):
+    sources = {}
+    for root, dirs, files in os.walk(static_dir):
+        if root == static_dir and BUILD_DIR in dirs:
+            dirs.remove(BUILD_DIR)
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for file_name in sorted(files):
+            if file_name.startswith("."):
+                continue
+            path = os.path.join(root, file_name)
+            name = os.path.relpath(path, static_dir).replace(os.sep, "/")
+            with open(path, "rb") as f:
+                sources[name] = f.read()
+    return sources
+
+
+def _page_module_groups(template_dir):
+    """Returns the module lists passed to module_scripts() by the templates."""
+    groups = set()
+    for file_name in sorted(os.listdir(template_dir)):
+        if not file_name.endswith(".html"):
+            continue
+        with open(os.path.join(template_dir, file_name), encoding="utf-8") as f:
+            for call in _MODULE_SCRIPTS_CALL.finditer(f.read()):
+                groups.add(tuple(_QUOTED.findall(call.group(1))))
+    return sorted(groups)
+
+
+def _options():
+    # Anything that changes the build output; a change triggers a rebuild
+    return {
+        "bundle": ASSET_BUNDLE_JS,
+        "minify_js": bool(ASSET_MINIFY and rjsmin),
+        "minify_css": bool(ASSET_MINIFY and rcssmin),
+        "brotli": brotli is not None,
+        "gzip_level": ASSET_GZIP_LEVEL,
+        "brotli_quality": ASSET_BROTLI_QUALITY,
+    }
+
+
+def _inputs_digest(sources, groups, options):
+    digest = hashlib.sha256(json.dumps([groups, options], sort_keys=True).encode())
+    for name, data in sources.items():
+        digest.update(name.encode() + b"\0" + hashlib.sha256(data).digest())
+    return digest.hexdigest()
+
+
+def module_imports(name, code):
+    """Returns the static/-relative names of the modules ``code`` imports statically."""
+    return [_resolve(name, match.group(3)) for match in _JS_SPECIFIER.finditer(code)]
+
+
+def _minify(name, data):
+    if name.endswith(".js") and ASSET_MINIFY and rjsmin:
+        return rjsmin.jsmin(data.decode("utf-8")).encode("utf-8")
+    if name.endswith(".css") and ASSET_MINIFY and rcssmin:
+        return rcssmin.cssmin(data.decode("utf-8")).encode("utf-8")
+    return data
+
+
+def _fingerprint(sources):
+    """Returns ``(files, contents)``: hashed name per source name, and each hashed file's bytes.
+
+    A file is hashed after the files it references, whose hashed names are
+    written into it, so a change to a font or module also renames every file
+    that refers to it. References inside an import cycle keep their plain
+    names and are served uncached.
+    """
+    files, contents = {}, {}
+
+    def process(name, visiting):
+        if name in files:
+            return files[name]
+        if name in visiting or name not in sources:
+            return None
+        visiting = visiting | {name}
+        data = sources[name]
+
+        def rewrite(reference, quote, prefix=""):
+            target = process(_resolve(name, reference), visiting)
+            return None if target is None else f"{prefix}{quote}{_relative(name, target)}{quote}"
+
+        if name.endswith(".css"):
+            text = data.decode("utf-8")
+
+            def css_url(match):
+                quote, reference = match.groups()
+                if re.match(r"^(?:[a-z]+:|/|#)", reference):
+                    return match.group(0)
+                rewritten = rewrite(reference, quote)
+                return f"url({rewritten})" if rewritten else match.group(0)
+
+            data = _CSS_URL.sub(css_url, text).encode("utf-8")
+        elif name.endswith(".js"):
+            text = data.decode("utf-8")
+
+            def js_import(match):
+                prefix, quote, reference = match.groups()
+                return rewrite(reference, quote, prefix) or match.group(0)
+
+            data = _JS_SPECIFIER.sub(js_import, text).encode("utf-8")
+
+        data = _minify(name, data)
+        files[name] = _hashed_name(name, data)
+        contents[files[name]] = data
+        return files[name]
+
+    for name in sources:
+        process(name, frozenset())
+    return files, contents
+
+
+def _import_bindings(specifiers):
+    bindings = []
+    specifiers = re.sub(r"//[^\n]*|/\*.*?\*/", "", specifiers, flags=re.S)
+    for specifier in specifiers.split(","):
+        parts = specifier.split()
+        if len(parts) == 1:
+            bindings.append(parts[0])
+        elif len(parts) == 3 and parts[1] == "as":
+            bindings.append(f"{parts[0]}: {parts[2]}")
+        elif parts:
+            raise AssetError(f"Unsupported import binding: {specifier.strip()}")
+    return ", ".join(bindings)
+
+
+def bundle_modules(entries, sources):
+    """Combines ES modules and everything they import into one module's source.
+
+    Modules are evaluated in the order a browser would evaluate them, each
+    exactly once, inside its own function scope; imports become reads of the
+    exporting module's object. Only named imports and exported function,
+    class and const declarations are supported (exported bindings are never
+    reassigned, so copying them keeps import semantics); anything else raises
+    AssetError.
+    """
+    order = []
+
+    def visit(name, stack):
+        if name in order:
+            return
+        if name in stack:
+            raise AssetError(f"Import cycle through {name}")
+        if name not in sources:
+            raise AssetError(f"Module {name} not found")
+        for dependency in module_imports(name, sources[name].decode("utf-8")):
+            visit(dependency, stack + (name,))
+        order.append(name)
+
+    for entry in entries:
+        visit(entry, ())
+
+    variables = {name: "__module_" + re.sub(r"\W", "_", name[: -len(".js")]) for name in order}
+    parts = []
+    for name in order:
+        code = sources[name].decode("utf-8")
+        exports = []
+
+        def strip_export(match):
+            exports.append(match.group(3))
+            return match.group(1) + match.group(2) + match.group(3)
+
+        def import_bindings(match):
+            dependency = variables[_resolve(name, match.group(3))]
+            return f"const {{ {_import_bindings(match.group(1))} }} = {dependency};"
+
+        code = _EXPORT_DECLARATION.sub(strip_export, code)
+        code = _IMPORT_BINDINGS.sub(import_bindings, code)
+        code = _IMPORT_SIDE_EFFECT.sub("", code)
+        unsupported = _UNSUPPORTED_MODULE_SYNTAX.search(code)
+        if unsupported:
+            raise AssetError(f"{name}: cannot bundle {unsupported.group(0).strip()!r}")
+        parts.append(
+            f"// {name}\nconst {variables[name]} = (() => {{\n{code}\n"
+            f"return {{ {', '.join(exports)} }};\n}})();\n"
+        )
+    return "".join(parts)
+
+
+def _compressed_variants(name, data):
+    if _mimetype(name) not in COMPRESSIBLE_TYPES:
+        return {}
+    variants = {"gzip": gzip.compress(data, compresslevel=ASSET_GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(data, quality=ASSET_BROTLI_QUALITY)
+    limit = len(data) * (1 - MIN_COMPRESSION_SAVING)
+    return {encoding: body for encoding, body in variants.items() if len(body) <= limit}
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def build_assets(static_dir, template_dir):
+    """Writes the fingerprinted, compressed files and the manifest to static/dist/; returns the manifest.
+
+    Files are content-addressed, so ones already written by an earlier build
+    are kept as they are; files no longer referenced are removed. Concurrent
+    builds of the same sources write identical files.
+    """
+    sources = _read_sources(static_dir)
+    groups = _page_module_groups(template_dir)
+    options = _options()
+    files, contents = _fingerprint(sources)
+
+    bundles = {}
+    if ASSET_BUNDLE_JS:
+        for entries in groups:
+            try:
+                code = bundle_modules(entries, sources).encode("utf-8")
+            except AssetError as e:
+                logger.warning("Not bundling %s: %s", ", ".join(entries), e)
+                continue
+            code = _minify("bundle.js", code)
+            bundle_name = _hashed_name("js/bundle.js", code)
+            bundles[",".join(entries)] = bundle_name
+            contents[bundle_name] = code
+
+    build_dir = os.path.join(static_dir, BUILD_DIR)
+    encodings, written = {}, 0
+    for hashed, data in contents.items():
+        path = os.path.join(build_dir, *hashed.split("/"))
+        variants = _compressed_variants(hashed, data)
+        encodings[hashed] = [encoding for encoding, _ in ENCODINGS if encoding in variants]
+        if os.path.exists(path) and all(
+            os.path.exists(path + suffix) for encoding, suffix in ENCODINGS if encoding in variants
+        ):
+            continue
+        for encoding, suffix in ENCODINGS:
+            if encoding in variants:
+                _write_atomic(path + suffix, variants[encoding])
+        # The plain file last: its presence marks the set as complete
+        _write_atomic(path, data)
+        written += 1
+
+    imports = {
+        name: module_imports(name, sources[name].decode("utf-8"))
+        for name in sources
+        if name.endswith(".js")
+    }
+    manifest = {
+        "digest": _inputs_digest(sources, groups, options),
+        "options": options,
+        "files": files,
+        "bundles": bundles,
+        "imports": imports,
+        "encodings": encodings,
+    }
+    _write_atomic(
+        os.path.join(build_dir, MANIFEST_NAME),
+        json.dumps(manifest, indent=1, sort_keys=True).encode("utf-8"),
+    )
+
+    # Files of earlier builds; pages still referring to them get the current version
+    keep = {MANIFEST_NAME} | {
+        hashed + suffix for hashed in contents for suffix in ("",) + tuple(s for _, s in ENCODINGS)
+    }
+    removed = 0
+    for root, _, file_names in os.walk(build_dir):
+        for file_name in file_names:
+            path = os.path.join(root, file_name)
+            if os.path.relpath(path, build_dir).replace(os.sep, "/") not in keep:
+                os.remove(path)
+                removed += 1
+    logger.info(
+        "Built %d assets (%d written, %d bundles, %d stale files removed).",
+        len(contents),
+        written,
+        len(bundles),
+        removed,
+    )
+    return manifest
+
+
+def load_assets(static_dir, template_dir):
+    """Returns the current manifest, rebuilding first if any input changed since the last build."""
+    manifest_path = os.path.join(static_dir, BUILD_DIR, MANIFEST_NAME)
+    digest = _inputs_digest(
+        _read_sources(static_dir), _page_module_groups(template_dir), _options()
+    )
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("digest") == digest:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return build_assets(static_dir, template_dir)
+
+
+def asset_url(filename):
+    """Returns the URL of a static file: its fingerprinted copy, or the plain file without a build."""
+    manifest = _manifest
+    if manifest is not None and filename in manifest["files"]:
+        return url_for("assets", filename=manifest["files"][filename])
+    return url_for("static", filename=filename)
+
+
+def _module_graph(entries):
+    graph, pending = [], list(entries)
+    while pending:
+        name = pending.pop(0)
+        if name not in graph:
+            graph.append(name)
+            pending.extend(_manifest["imports"].get(name, []))
+    return graph
+
+
+def module_scripts(*entries):
+    """Returns the script tags that load a page's ES modules, in the given order."""
+    manifest = _manifest
+    if manifest is not None:
+        bundle = manifest["bundles"].get(",".join(entries))
+        if bundle is not None:
+            src = url_for("assets", filename=bundle)
+            return Markup('<script type="module" src="{}"></script>').format(src)
+    tags = []
+    if manifest is not None:
+        # Fetched in parallel instead of one import level at a time
+        tags += [
+            Markup('<link rel="modulepreload" href="{}">').format(asset_url(name))
+            for name in _module_graph(entries)
+        ]
+    tags += [
+        Markup('<script type="module" src="{}"></script>').format(asset_url(name))
+        for name in entries
+    ]
+    return Markup("\n    ").join(tags)
+
+
+def _send_asset(hashed, immutable):
+    encodings = _manifest["encodings"].get(hashed, [])
+    accepted = request.accept_encodings
+    encoding = next((encoding for encoding in encodings if accepted[encoding]), None)
+    suffix = dict(ENCODINGS)[encoding] if encoding else ""
+    response = send_file(
+        os.path.join(_build_dir, *hashed.split("/")) + suffix,
+        mimetype=_mimetype(hashed),
+        conditional=True,
+        max_age=ASSET_MAX_AGE if immutable else 0,
+    )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if encodings:
+        response.vary.add("Accept-Encoding")
+    if immutable:
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def serve_asset(filename):
+    """Serves a fingerprinted file in the best encoding the browser accepts."""
+    if _manifest is None:
+        abort(404)
+    if filename in _manifest["encodings"]:
+        return _send_asset(filename, immutable=True)
+    # A name from an earlier build, e.g. a page loaded before a deploy:
+    # serve the current version, but do not let it be cached under the old name
+    current = _manifest["files"].get(_HASHED_NAME.sub("", filename, count=1))
+    if current is None:
+        abort(404)
+    return _send_asset(current, immutable=False)
+
+
+def init_assets(app):
+    """Serves /assets/, adds asset_url() and module_scripts() to templates and loads the build."""
+    global _manifest, _build_dir
+    app.add_url_rule("/assets/<path:filename>", "assets", serve_asset)
+    app.jinja_env.globals.update(asset_url=asset_url, module_scripts=module_scripts)
+    if not ASSET_PIPELINE:
+        return
+    template_dir = os.path.join(app.root_path, app.template_folder)
+    try:
+        _manifest = load_assets(app.static_folder, template_dir)
+        _build_dir = os.path.join(app.static_folder, BUILD_DIR)
+    except (OSError, ValueError) as e:
+        # Pages then load the plain files from /static/
+        logger.error("Asset build failed, serving plain static files: %s", e, exc_info=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the fingerprinted static assets.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("build", help="Rebuild static/dist/ from static/ and the templates")
+    parser.parse_args(argv)
+    setup_logging()
+
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    static_dir = os.path.join(package_dir, "static")
+    manifest = build_assets(static_dir, os.path.join(package_dir, "templates"))
+    build_dir = os.path.join(static_dir, BUILD_DIR)
+    names = sorted(manifest["encodings"])
+    for hashed in names:
+        path = os.path.join(build_dir, *hashed.split("/"))
+        sizes = [f"{os.path.getsize(path):>8}"]
+        for encoding, suffix in ENCODINGS:
+            if encoding in manifest["encodings"][hashed]:
+                sizes.append(f"{encoding} {os.path.getsize(path + suffix):>7}")
+        print(f"{hashed:<48} {'  '.join(sizes)}")
+    print(f"options: {json.dumps(manifest['options'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from flask import has_request_context, session
+
+from config import (
+    AUDIT_BATCH_SIZE,
+    AUDIT_ENQUEUE_TIMEOUT,
+    AUDIT_FLUSH_INTERVAL,
+    AUDIT_MAX_PENDING,
+)
+from database import get_db_connection
+from metrics import REGISTRY
+
+logger = logging.getLogger("phonedash.audit")
+
+AUDIT_PENDING = REGISTRY.gauge(
+    "phonedash_audit_pending",
+    "Audit records buffered in memory and not yet written.",
+)
+AUDIT_WRITTEN = REGISTRY.counter(
+    "phonedash_audit_written_total",
+    "Audit records written to the audit_log table.",
+)
+AUDIT_DROPPED = REGISTRY.counter(
+    "phonedash_audit_dropped_total",
+    "Audit records dropped because the buffer stayed full.",
+)
+AUDIT_FLUSH_TIME = REGISTRY.histogram(
+    "phonedash_audit_flush_seconds",
+    "Time taken to write one batch of audit records, in seconds.",
+)
+
+# Bookkeeping columns left out of diffs
+IGNORED_COLUMNS = {"id", "version", "identity_key", "name_key", "auth_version"}
+# Columns whose values are never stored; a change is recorded without them
+REDACTED_COLUMNS = {"password"}
+REDACTED = "***"
+
+_INSERT = """
+    INSERT INTO audit_log (occurred_at, user_id, username, entity, entity_id, action, changes)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _is_empty(value):
+    return value is None or value == ""
+
+
+def diff_rows(before, after):
+    """Returns ``{column: [old, new]}`` for the columns that differ between two rows.
+
+    Either row may be None (a create or a delete). None and the empty string
+    count as the same value.
+    """
+    before = dict(before) if before is not None else {}
+    after = dict(after) if after is not None else {}
+    changes = {}
+    for column in list(after) + [column for column in before if column not in after]:
+        if column in IGNORED_COLUMNS:
+            continue
+        old, new = before.get(column), after.get(column)
+        if old == new or (_is_empty(old) and _is_empty(new)):
+            continue
+        if column in REDACTED_COLUMNS:
+            changes[column] = [REDACTED, REDACTED]
+        else:
+            changes[column] = [old, new]
+    return changes
+
+
+class AuditWriter:
+    """Buffers audit records and writes them in batches from a background thread.
+
+    Records become durable at most AUDIT_FLUSH_INTERVAL seconds after they are
+    buffered, or sooner once AUDIT_BATCH_SIZE are waiting. A failed write is
+    retried with the records kept in memory. When AUDIT_MAX_PENDING records are
+    waiting, requests block for up to AUDIT_ENQUEUE_TIMEOUT seconds before their
+    records are dropped and counted.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._pending = []
+        self._oldest_at = None
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=10):
+        """Writes the remaining records and stops the thread."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def add(self, records):
+        deadline = time.monotonic() + AUDIT_ENQUEUE_TIMEOUT
+        with self._condition:
+            while len(self._pending) + len(records) > AUDIT_MAX_PENDING and self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stopping:
+                    AUDIT_DROPPED.inc(amount=len(records))
+                    logger.error("Audit buffer full; dropped %d records.", len(records))
+                    return False
+                self._condition.notify_all()
+                self._condition.wait(remaining)
+            # The writer is woken to start the flush interval, or to flush a full batch
+            wake = not self._pending or len(self._pending) + len(records) >= AUDIT_BATCH_SIZE
+            if not self._pending:
+                self._oldest_at = time.monotonic()
+            self._pending.extend(records)
+            AUDIT_PENDING.set(len(self._pending))
+            if wake:
+                self._condition.notify_all()
+        return True
+
+    def _take_batch(self):
+        # Called with the condition held; waits until a batch is due
+        while True:
+            if self._pending:
+                waited = time.monotonic() - self._oldest_at
+                if (
+                    self._stopping
+                    or len(self._pending) >= AUDIT_BATCH_SIZE
+                    or waited >= AUDIT_FLUSH_INTERVAL
+                ):
+                    batch, self._pending = self._pending, []
+                    return batch
+                self._condition.wait(AUDIT_FLUSH_INTERVAL - waited)
+            elif self._stopping:
+                return None
+            else:
+                self._condition.wait()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                batch = self._take_batch()
+            if batch is None:
+                return
+            try:
+                self._write(batch)
+            except sqlite3.Error as e:
+                logger.error("Writing %d audit records failed: %s", len(batch), e, exc_info=True)
+                with self._condition:
+                    # Oldest first again; retried after one interval
+                    self._pending[:0] = batch
+                    self._oldest_at = time.monotonic()
+                    AUDIT_PENDING.set(len(self._pending))
+                    stopping = self._stopping
+                if stopping:
+                    return
+                time.sleep(AUDIT_FLUSH_INTERVAL)
+            else:
+                with self._condition:
+                    AUDIT_PENDING.set(len(self._pending))
+                    # Wake requests waiting for buffer space
+                    self._condition.notify_all()
+
+    def _write(self, batch):
+        start = time.perf_counter()
+        conn = get_db_connection()
+        try:
+            conn.executemany(_INSERT, batch)
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        AUDIT_FLUSH_TIME.observe(time.perf_counter() - start)
+        AUDIT_WRITTEN.inc(amount=len(batch))
+
+
+_writer = None
+
+
+def _current_user():
+    if has_request_context():
+        return session.get("user_id"), session.get("username")
+    return None, None
+
+
+def _write_records(records):
+    if _writer is not None:
+        _writer.add(records)
+        return
+    # No writer thread (e.g. command line tools): write straight away
+    conn = get_db_connection()
+    try:
+        conn.executemany(_INSERT, records)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def record_change(entity, action, entity_id=None, before=None, after=None, details=None):
+    """Buffers one audit record for a committed change.
+
+    The recorded changes are the diff of the ``before`` and ``after`` rows, or
+    ``details`` for changes without a single row (e.g. an import). An update
+    that changed nothing is not recorded.
+    """
+    changes = details if details is not None else diff_rows(before, after)
+    if not changes and action == "update":
+        return
+    user_id, username = _current_user()
+    changes_json = json.dumps(changes, ensure_ascii=False)
+    _write_records([(time.time(), user_id, username, entity, entity_id, action, changes_json)])
+
+
+def record_changes(entity, action, rows):
+    """Buffers one audit record per ``(entity_id, before, after)`` of a bulk change."""
+    user_id, username = _current_user()
+    now = time.time()
+    records = []
+    for entity_id, before, after in rows:
+        changes = diff_rows(before, after)
+        if changes or action != "update":
+            changes_json = json.dumps(changes, ensure_ascii=False)
+            records.append((now, user_id, username, entity, entity_id, action, changes_json))
+    if records:
+        _write_records(records)
+
+
+def query_audit_log(cursor, filters, before_id=None, limit=50):
+    """Returns audit records matching ``filters``, newest first, and the next page's cursor.
+
+    ``filters`` may hold entity, entity_id, user_id, action, since and until
+    (Unix timestamps). Pages are keyed on the record id, so ``before_id`` is
+    the cursor returned with the previous page.
+    """
+    clauses, params = [], []
+    for column in ("entity", "entity_id", "user_id", "action"):
+        if filters.get(column) is not None:
+            clauses.append(f"{column} = ?")
+            params.append(filters[column])
+    if filters.get("since") is not None:
+        clauses.append("occurred_at >= ?")
+        params.append(filters["since"])
+    if filters.get("until") is not None:
+        clauses.append("occurred_at < ?")
+        params.append(filters["until"])
+    if before_id is not None:
+        clauses.append("id < ?")
+        params.append(before_id)
+    where_clause = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    cursor.execute(
+        f"""
+        SELECT id, occurred_at, user_id, username, entity, entity_id, action, changes
+        FROM audit_log{where_clause}
+        ORDER BY id DESC LIMIT ?
+    """,
+        params + [limit + 1],
+    )
+    rows = cursor.fetchall()
+    entries = [dict(row, changes=json.loads(row["changes"])) for row in rows[:limit]]
+    next_cursor = entries[-1]["id"] if len(rows) > limit else None
+    return entries, next_cursor
+
+
+def init_audit_log(app):
+    """Starts the background thread that writes buffered audit records."""
+    global _writer
+    _writer = AuditWriter()
+    _writer.start()
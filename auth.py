@@ -1,8 +1,98 @@
 from functools import wraps
 from flask import session, flash, redirect, url_for, jsonify, current_app, request
 import sqlite3
+import threading
+import time
+from config import AUTH_CACHE_TTL
 from database import get_db_connection
 
+# user_id -> (is_admin, auth_version, cached_at)
+_auth_cache = {}
+_auth_cache_lock = threading.Lock()
+# Bumped by every invalidation, so a read that raced one is not cached
+_auth_cache_generation = 0
+
+
+def get_user_authorization(user_id):
+    """Returns ``(is_admin, auth_version)`` for a user, or None if the user no longer exists.
+
+    Results are cached in process. Changes made through this process invalidate
+    the cache immediately; the TTL bounds how long another process may keep
+    serving a stale entry.
+    """
+    now = time.monotonic()
+    with _auth_cache_lock:
+        cached = _auth_cache.get(user_id)
+        generation = _auth_cache_generation
+    if cached is not None and now - cached[2] < AUTH_CACHE_TTL:
+        return cached[0], cached[1]
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT is_admin, auth_version FROM users WHERE id = ?", (user_id,)
+        )
+        user = cursor.fetchone()
+    finally:
+        conn.close()
+
+    with _auth_cache_lock:
+        if user is None:
+            _auth_cache.pop(user_id, None)
+            return None
+        # An invalidation since the read may have revoked what it returned
+        if generation == _auth_cache_generation:
+            _auth_cache[user_id] = (user["is_admin"], user["auth_version"], now)
+    return user["is_admin"], user["auth_version"]
+
+
+def invalidate_user_authorization(user_id):
+    """Drops a user's cached authorization after their role, password or account changed."""
+    global _auth_cache_generation
+    with _auth_cache_lock:
+        _auth_cache_generation += 1
+        _auth_cache.pop(user_id, None)
+
+
+def _clear_user_session():
+    session.pop("user_id", None)
+    session.pop("username", None)
+    session.pop("role", None)
+    session.pop("auth_version", None)
+
+
+def _session_revoked_response():
+    if request.path.startswith("/api/"):
+        return jsonify({"error": "Session expired, please log in again"}), 401
+    flash("نشست شما منقضی شده است. لطفاً دوباره وارد شوید.", "error")
+    return redirect(url_for("main_routes.login_page"))
+
+
+def _check_session_authorization():
+    """Returns the user's is_admin flag, or None after revoking a stale session.
+
+    A session is stale when its user was deleted or its auth version no longer
+    matches, i.e. the role or password changed since login.
+    """
+    current_user_id = session["user_id"]
+    authorization = get_user_authorization(current_user_id)
+    if authorization is None:
+        current_app.logger.warning(
+            "Access denied: User ID %s not found in database.", current_user_id
+        )
+        _clear_user_session()
+        return None
+
+    is_admin, auth_version = authorization
+    if session.get("auth_version") != auth_version:
+        current_app.logger.warning(
+            "Access denied: Session of user ID %s was revoked.", current_user_id
+        )
+        _clear_user_session()
+        return None
+    return is_admin
+
 
 def login_required(f):
     """Decorator to protect routes that require a logged-in user."""
@@ -18,6 +108,22 @@ def login_required(f):
             else:
                 flash("برای دسترسی به این صفحه، ابتدا وارد شوید.", "error")
                 return redirect(url_for("main_routes.login_page"))
+
+        try:
+            if _check_session_authorization() is None:
+                return _session_revoked_response()
+        except sqlite3.Error as e:
+            current_app.logger.error(
+                "Database error during authorization check for user_id %s: %s",
+                session.get("user_id"),
+                e,
+                exc_info=True,
+            )
+            if request.path.startswith("/api/"):
+                return jsonify({"error": "Database error during authorization check"}), 500
+            else:
+                flash("خطای پایگاه داده در بررسی دسترسی.", "error")
+                return redirect(url_for("main_routes.login_page"))
         return f(*args, **kwargs)
 
     return decorated_function
@@ -40,41 +146,27 @@ def admin_required(f):
                 flash("برای دسترسی به این صفحه، ابتدا وارد شوید.", "error")
                 return redirect(url_for("main_routes.login_page"))
 
-        conn = None
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
             current_user_id = session["user_id"]
-            current_app.logger.info(
-                f"Admin check for session user_id: {current_user_id}"
-            )
-            cursor.execute(
-                "SELECT is_admin FROM users WHERE id = ?", (current_user_id,)
+            current_app.logger.debug(
+                "Admin check for session user_id: %s", current_user_id
             )
-            user = cursor.fetchone()
-
-            if not user:
-                current_app.logger.warning(
-                    f"Access denied: User ID {current_user_id} not found in database."
-                )
-                session.pop("user_id", None)
-                session.pop("username", None)
-                session.pop("role", None)
-
-                if request.path.startswith("/api/"):
-                    return jsonify({"error": "User not found"}), 401
-                else:
-                    flash("کاربر یافت نشد. لطفاً دوباره وارد شوید.", "error")
-                    return redirect(url_for("main_routes.login_page"))
-
-            db_is_admin = user["is_admin"]
-            current_app.logger.info(
-                f"User '{session.get('username', 'N/A')}' (ID: {current_user_id}) has is_admin status from DB: {db_is_admin}"
+            db_is_admin = _check_session_authorization()
+            if db_is_admin is None:
+                return _session_revoked_response()
+
+            current_app.logger.debug(
+                "User '%s' (ID: %s) has is_admin status from DB: %s",
+                session.get("username", "N/A"),
+                current_user_id,
+                db_is_admin,
             )
 
             if db_is_admin != 1:
                 current_app.logger.warning(
-                    f"Access denied: User {session.get('username', 'N/A')} (ID: {current_user_id}) is not an admin."
+                    "Access denied: User %s (ID: %s) is not an admin.",
+                    session.get("username", "N/A"),
+                    current_user_id,
                 )
 
                 if request.path.startswith("/api/"):
@@ -83,13 +175,17 @@ def admin_required(f):
                     flash("شما اجازه دسترسی به این صفحه را ندارید.", "error")
                     return redirect(url_for("main_routes.dashboard_page"))
 
-            current_app.logger.info(
-                f"User {session.get('username', 'N/A')} (ID: {current_user_id}) is an admin. Granting access."
+            current_app.logger.debug(
+                "User %s (ID: %s) is an admin. Granting access.",
+                session.get("username", "N/A"),
+                current_user_id,
             )
             return f(*args, **kwargs)
         except sqlite3.Error as e:
             current_app.logger.error(
-                f"Database error during admin check for user_id {session.get('user_id')}: {e}",
+                "Database error during admin check for user_id %s: %s",
+                session.get("user_id"),
+                e,
                 exc_info=True,
             )
             if request.path.startswith("/api/"):
@@ -99,7 +195,9 @@ def admin_required(f):
                 return redirect(url_for("main_routes.dashboard_page"))
         except Exception as e:
             current_app.logger.error(
-                f"Unexpected error during admin check for user_id {session.get('user_id')}: {e}",
+                "Unexpected error during admin check for user_id %s: %s",
+                session.get("user_id"),
+                e,
                 exc_info=True,
             )
             if request.path.startswith("/api/"):
@@ -107,8 +205,5 @@ def admin_required(f):
             else:
                 flash("خطای غیرمنتظره در بررسی دسترسی.", "error")
                 return redirect(url_for("main_routes.dashboard_page"))
-        finally:
-            if conn:
-                conn.close()
 
     return decorated_function
@@ -0,0 +1,339 @@
+"""Online backups of the database.
+
+Backups are taken with SQLite's backup API a few pages at a time, so requests
+keep being served while a large database is copied. Each backup is gzip
+compressed, has a SHA-256 checksum file next to it, and only the newest
+BACKUP_KEEP are kept. Admins can start and download backups through the API;
+restoring is done from the command line:
+
+    python backup.py create
+    python backup.py list
+    python backup.py verify phonebook-20250902-031500.db.gz
+    python backup.py restore phonebook-20250902-031500.db.gz
+"""
+
+import argparse
+import gzip
+import hashlib
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+from config import (
+    BACKUP_COMPRESS_LEVEL,
+    BACKUP_DIR,
+    BACKUP_KEEP,
+    BACKUP_PAGES_PER_STEP,
+    BACKUP_STEP_PAUSE,
+    DATABASE,
+    setup_logging,
+)
+from metrics import REGISTRY
+
+logger = logging.getLogger("phonedash.backup")
+
+BACKUPS_TOTAL = REGISTRY.counter(
+    "phonedash_backups_total",
+    "Database backups taken, by outcome.",
+    ("outcome",),
+)
+BACKUP_DURATION = REGISTRY.histogram(
+    "phonedash_backup_duration_seconds",
+    "Time taken to copy, check and compress a database backup, in seconds.",
+)
+
+BACKUP_NAME_PATTERN = re.compile(r"^phonebook-\d{8}-\d{6}(-[a-z0-9-]+)?\.db\.gz$")
+CHECKSUM_SUFFIX = ".sha256"
+CHUNK_SIZE = 1024 * 1024
+
+_backup_lock = threading.Lock()
+_progress = None
+
+
+class BackupInProgress(Exception):
+    """Raised when a backup is requested while another one is running."""
+
+
+class BackupError(Exception):
+    """Raised when a backup file is missing, damaged or does not match its checksum."""
+
+
+def backup_path(name):
+    """Returns the path of a backup in BACKUP_DIR, or None if the name is not a backup's."""
+    if not BACKUP_NAME_PATTERN.match(name):
+        return None
+    path = os.path.join(BACKUP_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_checksum(path):
+    """Returns the checksum recorded next to a backup, or None."""
+    try:
+        with open(path + CHECKSUM_SUFFIX, encoding="ascii") as f:
+            return f.read().split()[0]
+    except (OSError, IndexError):
+        return None
+
+
+def _new_backup_name(label):
+    base = f"phonebook-{time.strftime('%Y%m%d-%H%M%S')}" + (f"-{label}" if label else "")
+    name, counter = f"{base}.db.gz", 1
+    while os.path.exists(os.path.join(BACKUP_DIR, name)):
+        counter += 1
+        name = f"{base}-{counter}.db.gz"
+    return name
+
+
+def _copy_database(target_path):
+    """Copies the live database into ``target_path`` with the backup API, in small steps."""
+    source = sqlite3.connect(DATABASE)
+    target = sqlite3.connect(target_path)
+    try:
+        # Held across the steps, the read transaction pins one WAL snapshot: writers
+        # carry on, and their commits no longer restart the copy from the first page
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+        def report(status, remaining, total):
+            _progress.update(pages_total=total, pages_remaining=remaining)
+
+        source.backup(
+            target, pages=BACKUP_PAGES_PER_STEP, progress=report, sleep=BACKUP_STEP_PAUSE
+        )
+        source.rollback()
+        result = target.execute("PRAGMA quick_check").fetchone()[0]
+        if result != "ok":
+            raise BackupError(f"Backup copy failed its integrity check: {result}")
+    finally:
+        target.close()
+        source.close()
+
+
+def _compress(source_path, target_path):
+    with open(source_path, "rb") as source, open(target_path, "wb") as raw:
+        # No file name or time in the gzip header, so equal databases compress identically
+        with gzip.GzipFile(
+            filename="", mode="wb", fileobj=raw, compresslevel=BACKUP_COMPRESS_LEVEL, mtime=0
+        ) as target:
+            shutil.copyfileobj(source, target, CHUNK_SIZE)
+
+
+def create_backup(label=None, rotate=True):
+    """Writes a compressed backup of the live database to BACKUP_DIR and returns its info.
+
+    Older backups beyond BACKUP_KEEP are deleted afterwards unless ``rotate``
+    is False. Raises BackupInProgress if another backup is running in this process.
+    """
+    global _progress
+    if not _backup_lock.acquire(blocking=False):
+        raise BackupInProgress()
+    start = time.perf_counter()
+    try:
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        name = _new_backup_name(label)
+        path = os.path.join(BACKUP_DIR, name)
+        copy_path = os.path.join(BACKUP_DIR, f".{name}.db.tmp")
+        compressed_path = f"{path}.tmp"
+        _progress = {
+            "name": name,
+            "started_at": time.time(),
+            "pages_total": None,
+            "pages_remaining": None,
+        }
+        try:
+            _copy_database(copy_path)
+            _compress(copy_path, compressed_path)
+            checksum = file_sha256(compressed_path)
+            with open(path + CHECKSUM_SUFFIX, "w", encoding="ascii") as f:
+                f.write(f"{checksum}  {name}\n")
+            os.replace(compressed_path, path)
+        except BaseException:
+            for leftover in (compressed_path, path + CHECKSUM_SUFFIX):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            raise
+        finally:
+            if os.path.exists(copy_path):
+                os.remove(copy_path)
+    except BaseException:
+        BACKUPS_TOTAL.inc(("error",))
+        raise
+    finally:
+        _progress = None
+        _backup_lock.release()
+
+    elapsed = time.perf_counter() - start
+    BACKUPS_TOTAL.inc(("ok",))
+    BACKUP_DURATION.observe(elapsed)
+    info = backup_info(name)
+    logger.info(
+        "Backup %s written in %.1fs (%s bytes).", name, elapsed, info['size_bytes']
+    )
+    removed = rotate_backups() if rotate else []
+    if removed:
+        logger.info("Removed old backups: %s", ', '.join(removed))
+    return info
+
+
+def rotate_backups(keep=None):
+    """Deletes all but the newest ``keep`` backups. Returns the deleted names."""
+    keep = BACKUP_KEEP if keep is None else keep
+    removed = []
+    for info in list_backups()[keep:]:
+        path = os.path.join(BACKUP_DIR, info["name"])
+        for file_path in (path, path + CHECKSUM_SUFFIX):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        removed.append(info["name"])
+    return removed
+
+
+def backup_info(name):
+    path = os.path.join(BACKUP_DIR, name)
+    stat = os.stat(path)
+    return {
+        "name": name,
+        "size_bytes": stat.st_size,
+        "created_at": stat.st_mtime,
+        "sha256": read_checksum(path),
+    }
+
+
+def list_backups():
+    """Returns the backups in BACKUP_DIR, newest first."""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    names = [name for name in os.listdir(BACKUP_DIR) if BACKUP_NAME_PATTERN.match(name)]
+    backups = [backup_info(name) for name in names]
+    backups.sort(key=lambda info: (info["created_at"], info["name"]), reverse=True)
+    return backups
+
+
+def backup_progress():
+    """Returns the running backup's name and page counts, or None."""
+    progress = _progress
+    return dict(progress) if progress else None
+
+
+def verify_backup(path):
+    """Checks a backup file against its checksum file. Raises BackupError on mismatch."""
+    expected = read_checksum(path)
+    if expected is None:
+        raise BackupError(f"No checksum file for {path}")
+    actual = file_sha256(path)
+    if actual != expected:
+        raise BackupError(f"Checksum mismatch for {path}: expected {expected}, got {actual}")
+    return actual
+
+
+def restore_backup(path, safety_backup=True):
+    """Replaces the live database's contents with a backup.
+
+    The backup is verified, decompressed and integrity-checked first, and the
+    current database is backed up with the "pre-restore" label unless
+    ``safety_backup`` is False. The copy into the live file goes through the
+    backup API in one step, so it is atomic for other connections and works
+    while the server is running.
+    """
+    verify_backup(path)
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    restored_path = os.path.join(BACKUP_DIR, f".restore-{os.getpid()}.db.tmp")
+    try:
+        with gzip.open(path, "rb") as source, open(restored_path, "wb") as target:
+            shutil.copyfileobj(source, target, CHUNK_SIZE)
+        source = sqlite3.connect(restored_path)
+        try:
+            result = source.execute("PRAGMA quick_check").fetchone()[0]
+            if result != "ok":
+                raise BackupError(f"{path} failed its integrity check: {result}")
+            if safety_backup:
+                # Not rotated, which could delete the very backup being restored
+                create_backup(label="pre-restore", rotate=False)
+            target = sqlite3.connect(DATABASE, timeout=30)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+        finally:
+            source.close()
+    finally:
+        for file_path in (restored_path, restored_path + "-wal", restored_path + "-shm"):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+    logger.info("Database restored from %s.", path)
+
+
+def _resolve(name_or_path):
+    if os.path.isfile(name_or_path):
+        return name_or_path
+    path = backup_path(name_or_path)
+    if path is None:
+        raise BackupError(f"Backup {name_or_path} not found in {BACKUP_DIR}")
+    return path
+
+
+def _run_migrations():
+    # A backup taken by an older version gets the current schema straight away
+    from flask import Flask
+    from database import init_db
+
+    with Flask("phonedash").app_context():
+        init_db()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Back up and restore the phone book database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create", help="Write a new backup to the backup directory")
+    create.add_argument("--label", help="Suffix for the backup's name (lowercase letters, digits, -)")
+    commands.add_parser("list", help="List the kept backups, newest first")
+    verify = commands.add_parser("verify", help="Check a backup against its checksum")
+    verify.add_argument("backup", help="Backup name or file path")
+    restore = commands.add_parser("restore", help="Replace the database's contents with a backup")
+    restore.add_argument("backup", help="Backup name or file path")
+    restore.add_argument(
+        "--no-safety-backup",
+        action="store_true",
+        help="Do not back up the current database before restoring",
+    )
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    try:
+        if args.command == "create":
+            if args.label and not re.fullmatch(r"[a-z0-9-]+", args.label):
+                parser.error("--label may only contain lowercase letters, digits and '-'")
+            info = create_backup(label=args.label)
+            print(f"{info['name']}  {info['size_bytes']} bytes  sha256 {info['sha256']}")
+        elif args.command == "list":
+            for info in list_backups():
+                created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(info["created_at"]))
+                print(f"{info['name']}  {created}  {info['size_bytes']} bytes")
+        elif args.command == "verify":
+            path = _resolve(args.backup)
+            print(f"{path}: OK (sha256 {verify_backup(path)})")
+        elif args.command == "restore":
+            restore_backup(_resolve(args.backup), safety_backup=not args.no_safety_backup)
+            _run_migrations()
+            print(f"Restored {args.backup} into {DATABASE}.")
+    except (BackupError, BackupInProgress, sqlite3.Error, OSError) as e:
+        print(f"error: {e or 'a backup is already running'}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+"""Seeded generator of realistic Persian contacts and companies for benchmarks.
+
+The same seed and row count always produce the same database, so results can
+be compared across commits. Run from the repository root:
+
+    python -m bench.datagen --size 100k
+    python -m bench.datagen --rows 25000 --seed 7 --output bench/data/custom.db
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+# Named dataset sizes used by the benchmark runner
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+DEFAULT_SEED = 1403
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# Credentials of the admin user created in every generated database
+BENCH_USERNAME = "bench"
+BENCH_PASSWORD = "bench-password"
+
+# Rows inserted per transaction while generating
+INSERT_BATCH_SIZE = 10_000
+
+# (Persian, Latin) pairs so emails look like they belong to the person
+FIRST_NAMES = [
+    ("علی", "ali"), ("محمد", "mohammad"), ("حسین", "hossein"), ("رضا", "reza"),
+    ("مهدی", "mahdi"), ("امیر", "amir"), ("حسن", "hassan"), ("سعید", "saeed"),
+    ("مجید", "majid"), ("حمید", "hamid"), ("کامران", "kamran"), ("بهزاد", "behzad"),
+    ("فرهاد", "farhad"), ("پویا", "pouya"), ("آرش", "arash"), ("کیوان", "keyvan"),
+    ("مصطفی", "mostafa"), ("یاسر", "yaser"), ("نیما", "nima"), ("سینا", "sina"),
+    ("فاطمه", "fatemeh"), ("زهرا", "zahra"), ("مریم", "maryam"), ("سارا", "sara"),
+    ("نرگس", "narges"), ("لیلا", "leila"), ("مینا", "mina"), ("الهام", "elham"),
+    ("شیرین", "shirin"), ("پریسا", "parisa"), ("نازنین", "nazanin"), ("مهسا", "mahsa"),
+    ("سمیرا", "samira"), ("آزاده", "azadeh"), ("ندا", "neda"), ("هانیه", "haniyeh"),
+    ("کیمیا", "kimia"), ("یگانه", "yeganeh"), ("رویا", "roya"), ("طاهره", "tahereh"),
+]
+LAST_NAMES = [
+    ("محمدی", "mohammadi"), ("حسینی", "hosseini"), ("احمدی", "ahmadi"),
+    ("رضایی", "rezaei"), ("موسوی", "mousavi"), ("کریمی", "karimi"),
+    ("جعفری", "jafari"), ("صادقی", "sadeghi"), ("رحیمی", "rahimi"),
+    ("کاظمی", "kazemi"), ("قاسمی", "ghasemi"), ("ابراهیمی", "ebrahimi"),
+    ("هاشمی", "hashemi"), ("نوری", "nouri"), ("طاهری", "taheri"),
+    ("عباسی", "abbasi"), ("اکبری", "akbari"), ("یزدانی", "yazdani"),
+    ("شریفی", "sharifi"), ("نجفی", "najafi"), ("سلطانی", "soltani"),
+    ("بهرامی", "bahrami"), ("فرهادی", "farhadi"), ("زارعی", "zarei"),
+    ("کرمانی", "kermani"), ("تهرانی", "tehrani"), ("شیرازی", "shirazi"),
+    ("اصفهانی", "esfahani"), ("مرادی", "moradi"), ("جلالی", "jalali"),
+    ("خسروی", "khosravi"), ("میرزایی", "mirzaei"), ("وحیدی", "vahidi"),
+    ("پاکزاد", "pakzad"), ("نیک\u200cنام", "niknam"), ("امیری", "amiri"),
+    ("سبحانی", "sobhani"), ("بابایی", "babaei"), ("قربانی", "ghorbani"),
+    ("توکلی", "tavakoli"), ("حیدری", "heidari"), ("ملکی", "maleki"),
+]
+JOB_TITLES = [
+    "مدیرعامل", "مدیر فروش", "کارشناس فروش", "مدیر مالی", "حسابدار",
+    "مدیر بازرگانی", "کارشناس خرید", "مدیر فنی", "مهندس پروژه", "مدیر منابع انسانی",
+    "کارشناس بازاریابی", "مدیر تولید", "سرپرست انبار", "مشاور حقوقی", "مدیر دفتر",
+    "کارشناس فناوری اطلاعات", "رئیس هیئت مدیره", "معاون اجرایی", "کارشناس کنترل کیفیت",
+    "نماینده فروش",
+]
+COMPANY_PREFIXES = ["شرکت", "گروه صنعتی", "هلدینگ", "صنایع", "بازرگانی", "مجتمع"]
+COMPANY_NAMES = [
+    "پارس", "آریا", "سپهر", "البرز", "دماوند", "کیان", "پارسیان", "تابان",
+    "نوین", "ایرانیان", "خلیج فارس", "زاگرس", "سپاهان", "مهر", "آفتاب", "رهاورد",
+    "پیشگامان", "آینده\u200cسازان", "فراز", "نگین",
+]
+COMPANY_INDUSTRIES = [
+    "فولاد", "پتروشیمی", "دارویی", "نساجی", "الکترونیک", "ساختمانی", "غذایی",
+    "خودرو", "نرم\u200cافزار", "حمل و نقل", "معدنی", "کشاورزی", "بیمه", "انرژی",
+    "پلیمر", "تجهیزات پزشکی",
+]
+SUBJECT_CATEGORIES = [
+    "تامین کننده", "مشتری", "پیمانکار", "مشاور", "همکار تجاری", "دولتی",
+    "بانک", "رسانه", "نمایشگاه", "صادرات",
+]
+CITIES = [
+    "تهران", "اصفهان", "مشهد", "شیراز", "تبریز", "کرج", "اهواز", "قم",
+    "رشت", "یزد", "کرمان", "بندرعباس",
+]
+STREETS = [
+    "ولیعصر", "آزادی", "انقلاب", "شریعتی", "مطهری", "بهشتی", "جمهوری",
+    "فردوسی", "حافظ", "سعدی", "چمران", "کارگر", "میرداماد", "ونک",
+]
+# Mostly Iran, with a tail of foreign partners
+COUNTRIES = ["ایران"] * 16 + ["امارات", "ترکیه", "آلمان", "چین"]
+MOBILE_PREFIXES = ["0912", "0913", "0915", "0919", "0921", "0935", "0936", "0937", "0938", "0939", "0901", "0990"]
+AREA_CODES = ["021", "031", "051", "071", "041", "026", "061", "025"]
+EMAIL_DOMAINS = ["gmail.com", "yahoo.com", "outlook.com", "chmail.ir", "mail.ir"]
+
+# Share of generated contacts that re-enter an earlier person with small variations
+DUPLICATE_RATE = 0.02
+
+_PERSIAN_DIGITS = str.maketrans("0123456789", "۰۱۲۳۴۵۶۷۸۹")
+# Arabic letter forms that users and imported sheets often contain
+_ARABIC_LETTERS = str.maketrans({"ی": "ي", "ک": "ك"})
+
+
+class DataGenerator:
+    """Produces deterministic companies and contacts from a seed."""
+
+    def __init__(self, seed=DEFAULT_SEED):
+        self.random = random.Random(seed)
+        self.companies = []
+        self._emitted = []
+
+    def _digits(self, count):
+        return "".join(self.random.choice("0123456789") for _ in range(count))
+
+    def mobile_phone(self):
+        number = self.random.choice(MOBILE_PREFIXES) + self._digits(7)
+        # Phone numbers arrive in the formats people actually type
+        style = self.random.random()
+        if style < 0.1:
+            return f"+98 {number[1:4]} {number[4:7]} {number[7:]}"
+        if style < 0.2:
+            return f"{number[:4]}-{number[4:7]}-{number[7:]}"
+        if style < 0.25:
+            return number.translate(_PERSIAN_DIGITS)
+        return number
+
+    def office_phone(self):
+        return self.random.choice(AREA_CODES) + self._digits(8)
+
+    def company_rows(self, count):
+        """Returns ``count`` unique companies, some pointing at sub-companies."""
+        names = set()
+        while len(names) < count:
+            name = " ".join(
+                [
+                    self.random.choice(COMPANY_PREFIXES),
+                    self.random.choice(COMPANY_INDUSTRIES),
+                    self.random.choice(COMPANY_NAMES),
+                ]
+            )
+            if name in names:
+                name = f"{name} {len(names)}"
+            names.add(name)
+        self.companies = sorted(names)
+        rows = []
+        for name in self.companies:
+            subs = [
+                self.random.choice(self.companies) if self.random.random() < 0.3 else None
+                for _ in range(2)
+            ]
+            rows.append((name, subs[0], subs[1]))
+        return rows
+
+    def _person(self):
+        first_fa, first_en = self.random.choice(FIRST_NAMES)
+        last_fa, last_en = self.random.choice(LAST_NAMES)
+        return f"{first_fa} {last_fa}", f"{first_en}.{last_en}{self.random.randint(1, 999)}"
+
+    def contact(self):
+        """Returns one contact as a dict of contacts table columns."""
+        if self._emitted and self.random.random() < DUPLICATE_RATE:
+            return self._duplicate(self.random.choice(self._emitted))
+
+        full_name, handle = self._person()
+        company = self.random.choice(self.companies) if self.companies else ""
+        has_office = self.random.random() < 0.8
+        contact = {
+            "full_name": full_name,
+            "main_company": company,
+            "job_title": self.random.choice(JOB_TITLES),
+            "mobile_phone": self.mobile_phone(),
+            "office_phone1": self.office_phone() if has_office else "",
+            "extension1": str(self.random.randint(100, 999)) if has_office else "",
+            "office_phone2": self.office_phone() if self.random.random() < 0.3 else "",
+            "extension2": "",
+            "office_phone3": self.office_phone() if self.random.random() < 0.05 else "",
+            "extension3": "",
+            "email": f"{handle}@{self.random.choice(EMAIL_DOMAINS)}"
+            if self.random.random() < 0.7
+            else "",
+            "office_manager_name1": self._person()[0] if self.random.random() < 0.3 else "",
+            "office_manager_mobile1": "",
+            "office_manager_name2": "",
+            "office_manager_mobile2": "",
+            "office_manager_name3": "",
+            "office_manager_mobile3": "",
+            "office_email": f"info{self.random.randint(1, 99)}@example.ir" if has_office else "",
+            "subject_category": self.random.choice(SUBJECT_CATEGORIES),
+            "country": self.random.choice(COUNTRIES),
+            "address": (
+                f"{self.random.choice(CITIES)}، خیابان {self.random.choice(STREETS)}، "
+                f"پلاک {self.random.randint(1, 400)}"
+            ),
+            "postal_code": self._digits(10),
+            "description": "",
+        }
+        if contact["office_manager_name1"]:
+            contact["office_manager_mobile1"] = self.mobile_phone()
+        # Keep a bounded sample to draw duplicates from
+        if len(self._emitted) < 5000:
+            self._emitted.append(contact)
+        elif self.random.random() < 0.01:
+            self._emitted[self.random.randrange(len(self._emitted))] = contact
+        return contact
+
+    def _duplicate(self, original):
+        contact = dict(original)
+        variation = self.random.random()
+        if variation < 0.4:
+            contact["full_name"] = contact["full_name"].translate(_ARABIC_LETTERS)
+        elif variation < 0.7:
+            contact["full_name"] = " ".join(reversed(contact["full_name"].split(" ", 1)))
+        else:
+            contact["email"] = contact["email"].upper()
+        if self.random.random() < 0.5:
+            contact["job_title"] = self.random.choice(JOB_TITLES)
+        return contact
+
+
+def generate_database(path, rows, seed=DEFAULT_SEED, keep_duplicate_queue=False):
+    """Creates a database at ``path`` holding ``rows`` generated contacts.
+
+    The schema is created by the application's own init_db so the file matches
+    what the server expects, triggers included.
+    """
+    # Point the application at the generated file before database is imported
+    os.environ["PHONEBOOK_DATABASE"] = path
+
+    from flask import Flask
+    from werkzeug.security import generate_password_hash
+
+    from database import get_db_connection, init_db
+    from routes.contacts import IMPORT_COLUMNS
+
+    app = Flask(__name__)
+    generator = DataGenerator(seed)
+    with app.app_context():
+        init_db()
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.executemany(
+                "INSERT INTO companies (company_name, sub_company1, sub_company2) VALUES (?, ?, ?)",
+                generator.company_rows(max(rows // 50, 20)),
+            )
+            cursor.execute(
+                "INSERT INTO users (username, password, is_admin) VALUES (?, ?, 1)",
+                (BENCH_USERNAME, generate_password_hash(BENCH_PASSWORD)),
+            )
+            conn.commit()
+
+            insert_sql = (
+                f"INSERT INTO contacts ({', '.join(IMPORT_COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in IMPORT_COLUMNS)})"
+            )
+            written = 0
+            while written < rows:
+                batch_size = min(INSERT_BATCH_SIZE, rows - written)
+                batch = []
+                for _ in range(batch_size):
+                    contact = generator.contact()
+                    batch.append([contact[column] for column in IMPORT_COLUMNS])
+                cursor.executemany(insert_sql, batch)
+                conn.commit()
+                written += batch_size
+                print(f"  {written:,}/{rows:,} contacts", end="\r", file=sys.stderr)
+            print(file=sys.stderr)
+
+            # A freshly generated dataset would otherwise keep the duplicate scanner
+            # busy for the whole benchmark run
+            if not keep_duplicate_queue:
+                cursor.execute("DELETE FROM duplicate_queue")
+                conn.commit()
+        finally:
+            conn.close()
+
+
+def dataset_path(size):
+    return os.path.join(DATA_DIR, f"phonebook-{size}.db")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--size", choices=sorted(SIZES), default="10k", help="Named dataset size")
+    group.add_argument("--rows", type=int, help="Exact number of contacts to generate")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--output", help="Database file to create (default: bench/data/)")
+    parser.add_argument("--force", action="store_true", help="Overwrite an existing file")
+    parser.add_argument(
+        "--keep-duplicate-queue",
+        action="store_true",
+        help="Leave every contact queued for the duplicate scanner",
+    )
+    args = parser.parse_args(argv)
+
+    rows = args.rows if args.rows is not None else SIZES[args.size]
+    output = args.output or dataset_path(args.size if args.rows is None else str(rows))
+    if os.path.exists(output):
+        if not args.force:
+            parser.error(f"{output} already exists; use --force to regenerate it")
+        os.remove(output)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+    start = time.perf_counter()
+    print(f"Generating {rows:,} contacts (seed {args.seed}) into {output}", file=sys.stderr)
+    generate_database(output, rows, args.seed, args.keep_duplicate_queue)
+    print(f"Done in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
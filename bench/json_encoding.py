@@ -0,0 +1,95 @@
+"""Micro-benchmark of the JSON serialization paths for contact rows.
+
+Compares the original path (dict per row, Flask's default provider) with the
+FastJSONProvider and the RowEncoder, for a page of rows and for a full export:
+
+    python -m bench.datagen --size 100k
+    python -m bench.json_encoding --size 100k --page 50 --repeat 20
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import time
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from bench.datagen import SIZES, dataset_path
+from serialization import FastJSONProvider, RowEncoder, orjson
+
+
+def _timed(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = func()
+        timings.append(time.perf_counter() - start)
+    return timings, len(output.encode() if isinstance(output, str) else output)
+
+
+def build_candidates(app, default_provider, columns):
+    fast_provider = app.json
+    template_encoder = RowEncoder(columns, use_orjson=False)
+    candidates = {
+        "dict + default provider": lambda rows: default_provider.dumps([dict(row) for row in rows]),
+        "dict + fast provider": lambda rows: fast_provider.dumps([dict(row) for row in rows]),
+        "row encoder (template)": template_encoder.encode,
+    }
+    if orjson is not None:
+        candidates["row encoder (orjson)"] = RowEncoder(columns, use_orjson=True).encode
+    return candidates
+
+
+def run(database, page, repeat):
+    conn = sqlite3.connect(database)
+    conn.row_factory = sqlite3.Row
+    try:
+        cursor = conn.execute("SELECT * FROM contacts")
+        columns = [column[0] for column in cursor.description]
+        all_rows = cursor.fetchall()
+    finally:
+        conn.close()
+
+    app = Flask("phonedash-bench")
+    default_provider = DefaultJSONProvider(app)
+    app.json = FastJSONProvider(app)
+    candidates = build_candidates(app, default_provider, columns)
+
+    workloads = {f"page of {page}": all_rows[:page], f"export of {len(all_rows)}": all_rows}
+    with app.app_context():
+        for workload, rows in workloads.items():
+            print(f"\n{workload} rows", file=sys.stderr)
+            baseline = None
+            for name, encode in candidates.items():
+                timings, size = _timed(lambda: encode(rows), repeat)
+                median = statistics.median(timings)
+                baseline = baseline or median
+                print(
+                    f"  {name:<26} median {median * 1000:9.2f} ms"
+                    f"  min {min(timings) * 1000:9.2f} ms"
+                    f"  {size / 1024:9.0f} KiB  x{baseline / median:.2f}",
+                    file=sys.stderr,
+                )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--size", choices=sorted(SIZES), default="10k", help="Generated dataset to use")
+    group.add_argument("--db", help="Explicit dataset file")
+    parser.add_argument("--page", type=int, default=50, help="Rows in the page workload")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed runs per candidate")
+    args = parser.parse_args(argv)
+
+    database = args.db or dataset_path(args.size)
+    if not os.path.exists(database):
+        parser.error(f"{database} not found; generate it with: python -m bench.datagen --size {args.size}")
+    print(f"orjson: {'installed' if orjson is not None else 'not installed'}", file=sys.stderr)
+    run(database, args.page, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
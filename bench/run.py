@@ -0,0 +1,491 @@
+"""Load benchmark of the API against a generated dataset served by waitress.
+
+Each scenario is run by concurrent clients for a fixed duration against a
+scratch copy of the dataset, and reports p50/p95/p99 latency and throughput.
+Reports are written as JSON keyed by git commit so runs can be compared:
+
+    python -m bench.datagen --size 100k
+    python -m bench.run --size 100k --concurrency 10 --duration 20
+    python -m bench.run --size 100k --baseline bench/results/<old report>.json
+"""
+
+import argparse
+import http.cookiejar
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+from bench.datagen import (
+    BENCH_PASSWORD,
+    BENCH_USERNAME,
+    COMPANY_INDUSTRIES,
+    DEFAULT_SEED,
+    LAST_NAMES,
+    SIZES,
+    DataGenerator,
+    dataset_path,
+)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "bench", "results")
+
+SERVER_SCRIPT = (
+    "import sys; from waitress import serve; from app import app; "
+    "serve(app, host='127.0.0.1', port=int(sys.argv[1]), threads=int(sys.argv[2]))"
+)
+
+SORT_COLUMNS = ["full_name", "main_company", "job_title", "mobile_phone", "email", "country"]
+PAGE_SIZE = 50
+
+# Rows in the spreadsheet posted by the excel_import scenario
+IMPORT_ROWS = 500
+
+# Spreadsheet headers understood by /api/contacts/import
+IMPORT_HEADERS = {
+    "full_name": "نام کامل",
+    "main_company": "شرکت اصلی",
+    "job_title": "سمت",
+    "mobile_phone": "موبایل",
+    "office_phone1": "تلفن دفتر 1",
+    "email": "ایمیل شخصی",
+    "subject_category": "دسته بندی موضوعی",
+    "country": "کشور",
+    "address": "آدرس",
+}
+
+
+class Client:
+    """A logged-in HTTP session with its own cookies, recording request latencies."""
+
+    def __init__(self, base_url, recorder):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, method, path, body=None, headers=None, record=True):
+        request = urllib.request.Request(
+            self.base_url + path, data=body, method=method, headers=headers or {}
+        )
+        start = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=120) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+        except (urllib.error.URLError, OSError):
+            status, payload = 0, b""
+        if record:
+            self.recorder.record(time.perf_counter() - start, status)
+        return status, payload
+
+    def get_json(self, path, params=None, record=True):
+        if params:
+            path = f"{path}?{urllib.parse.urlencode(params)}"
+        status, payload = self.request("GET", path, record=record)
+        return status, json.loads(payload) if status == 200 else None
+
+    def send_json(self, method, path, data, record=True):
+        status, payload = self.request(
+            method,
+            path,
+            json.dumps(data).encode(),
+            {"Content-Type": "application/json"},
+            record,
+        )
+        try:
+            return status, json.loads(payload)
+        except ValueError:
+            return status, None
+
+    def login(self, record=False):
+        status, _ = self.send_json(
+            "POST",
+            "/api/login",
+            {"username": BENCH_USERNAME, "password": BENCH_PASSWORD},
+            record,
+        )
+        return status == 200
+
+
+class Recorder:
+    """Collects latencies and status codes from every client thread."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = 0
+
+    def record(self, elapsed, status):
+        with self.lock:
+            self.latencies.append(elapsed)
+            if not 200 <= status < 300:
+                self.errors += 1
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(recorder, wall_seconds):
+    latencies = sorted(recorder.latencies)
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": recorder.errors,
+        "throughput_rps": round(count / wall_seconds, 2) if wall_seconds else 0.0,
+        "mean_ms": round(sum(latencies) * 1000 / count, 2) if count else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if count else 0.0,
+    }
+
+
+def build_import_workbook(seed):
+    """Builds the .xlsx posted by the excel_import scenario."""
+    import pandas as pd
+
+    generator = DataGenerator(seed)
+    generator.company_rows(20)
+    records = []
+    for _ in range(IMPORT_ROWS):
+        contact = generator.contact()
+        records.append({header: contact[column] for column, header in IMPORT_HEADERS.items()})
+    buffer = io.BytesIO()
+    pd.DataFrame(records).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def multipart_body(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    for name, (filename, content) in files.items():
+        parts.append(
+            (
+                f"--{boundary}\r\n"
+                f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                "Content-Type: application/vnd.openxmlformats-officedocument.spreadsheetml.sheet\r\n\r\n"
+            ).encode()
+            + content
+            + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+# --- Scenarios ---
+# Each scenario step performs one user action, which may issue several requests.
+
+
+def search_keystrokes(client, rng, context):
+    """Types a name one character at a time, searching after every keystroke."""
+    term = rng.choice(LAST_NAMES)[0]
+    for length in range(1, len(term) + 1):
+        client.get_json(
+            "/api/contacts/search",
+            {"term": term[:length], "offset": 0, "limit": PAGE_SIZE},
+        )
+
+
+def phone_fragments(client, rng, context):
+    """Types six digits from the middle of a phone number, searching after every keystroke."""
+    number = DataGenerator(rng.random()).office_phone()
+    start = rng.randrange(0, len(number) - 6)
+    for length in range(1, 7):
+        client.get_json(
+            "/api/contacts/search",
+            {"term": number[start : start + length], "offset": 0, "limit": PAGE_SIZE},
+        )
+
+
+def deep_pagination(client, rng, context):
+    """Jumps to a random page anywhere in the unfiltered list."""
+    offset = rng.randrange(0, max(context["total_count"] - PAGE_SIZE, 1))
+    client.get_json("/api/contacts/search", {"offset": offset, "limit": PAGE_SIZE})
+
+
+def sorted_pages(client, rng, context):
+    """Fetches one of the first pages sorted by a random column."""
+    client.get_json(
+        "/api/contacts/search",
+        {
+            "offset": rng.randrange(0, 10) * PAGE_SIZE,
+            "limit": PAGE_SIZE,
+            "sort_by": rng.choice(SORT_COLUMNS),
+            "sort_direction": rng.choice(["asc", "desc"]),
+        },
+    )
+
+
+def export_all(client, rng, context):
+    """Exports every contact matching an industry keyword, as the export button does."""
+    client.get_json(
+        "/api/contacts/search",
+        {"term": rng.choice(COMPANY_INDUSTRIES), "export_all": "true"},
+    )
+
+
+def excel_import(client, rng, context):
+    """Re-imports the same spreadsheet in upsert mode."""
+    body, content_type = multipart_body(
+        {"mode": "upsert"}, {"file": ("bench.xlsx", context["workbook"])}
+    )
+    client.request("POST", "/api/contacts/import", body, {"Content-Type": content_type})
+
+
+def crud_mix(client, rng, context):
+    """Creates, reads, edits and deletes one contact."""
+    generator = DataGenerator(rng.random())
+    contact = generator.contact()
+    status, created = client.send_json(
+        "POST",
+        "/api/contacts",
+        {"fullName": contact["full_name"], "mobilePhone": contact["mobile_phone"],
+         "mainCompany": contact["main_company"], "email": contact["email"]},
+    )
+    if status != 201:
+        return
+    contact_id = created["id"]
+    status, stored = client.get_json(f"/api/contacts/{contact_id}")
+    client.send_json(
+        "PATCH",
+        f"/api/contacts/{contact_id}",
+        {"jobTitle": rng.choice(["مدیر فروش", "حسابدار"]),
+         "version": (stored or {}).get("version", 1)},
+    )
+    client.request("DELETE", f"/api/contacts/{contact_id}")
+
+
+def logins(client, rng, context):
+    """Logs in with a fresh session; dominated by password hash verification."""
+    fresh = Client(client.base_url, client.recorder)
+    fresh.login(record=True)
+
+
+SCENARIOS = {
+    "search_keystrokes": search_keystrokes,
+    "phone_fragments": phone_fragments,
+    "deep_pagination": deep_pagination,
+    "sorted_pages": sorted_pages,
+    "export_all": export_all,
+    "excel_import": excel_import,
+    "crud_mix": crud_mix,
+    "logins": logins,
+}
+
+# Scenarios too heavy to run at full concurrency without drowning the others
+CONCURRENCY_CAPS = {"export_all": 4, "excel_import": 2}
+
+
+def run_scenario(name, base_url, concurrency, duration, seed, context):
+    """Runs one scenario with ``concurrency`` clients for ``duration`` seconds."""
+    step = SCENARIOS[name]
+    recorder = Recorder()
+    clients = [Client(base_url, recorder) for _ in range(min(concurrency, CONCURRENCY_CAPS.get(name, concurrency)))]
+    for client in clients:
+        if not client.login():
+            raise RuntimeError("Benchmark user could not log in")
+
+    deadline = time.perf_counter() + duration
+
+    def worker(index, client):
+        rng = random.Random(f"{seed}-{name}-{index}")
+        while time.perf_counter() < deadline:
+            step(client, rng, context)
+
+    threads = [
+        threading.Thread(target=worker, args=(index, client), daemon=True)
+        for index, client in enumerate(clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = summarize(recorder, time.perf_counter() - start)
+    result["concurrency"] = len(clients)
+    return result
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(base_url, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Server exited during startup; see the server log")
+        try:
+            with urllib.request.urlopen(base_url + "/login.html", timeout=2):
+                return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError("Server did not start in time")
+
+
+def git_revision():
+    def git(*args):
+        try:
+            return subprocess.run(
+                ["git", *args], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ""
+
+    return {
+        "commit": git("rev-parse", "--short", "HEAD") or "unknown",
+        "subject": git("log", "-1", "--format=%s"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+    }
+
+
+def print_report(report, baseline=None):
+    meta = report["meta"]
+    print(
+        f"\nphonedash benchmark @ {meta['git']['commit']}{' (dirty)' if meta['git']['dirty'] else ''}"
+        f" - {meta['rows']:,} contacts, {meta['concurrency']} clients, {meta['duration']}s per scenario"
+    )
+    header = f"{'scenario':<18} {'req':>7} {'err':>5} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    if baseline:
+        header += f" {'p95 Δ':>8} {'rps Δ':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, result in report["scenarios"].items():
+        line = (
+            f"{name:<18} {result['requests']:>7} {result['errors']:>5} {result['throughput_rps']:>9}"
+            f" {result['p50_ms']:>9} {result['p95_ms']:>9} {result['p99_ms']:>9}"
+        )
+        previous = (baseline or {}).get("scenarios", {}).get(name)
+        if previous:
+            line += f" {_change(previous['p95_ms'], result['p95_ms']):>8}"
+            line += f" {_change(previous['throughput_rps'], result['throughput_rps']):>8}"
+        print(line)
+    if baseline:
+        print(f"Δ relative to {baseline['meta']['git']['commit']}")
+
+
+def _change(old, new):
+    if not old:
+        return "n/a"
+    return f"{(new - old) * 100 / old:+.1f}%"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--size", choices=sorted(SIZES), default="10k", help="Generated dataset to use")
+    group.add_argument("--db", help="Explicit dataset file (never modified)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma separated scenario names")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent clients per scenario")
+    parser.add_argument("--duration", type=float, default=15, help="Seconds per scenario")
+    parser.add_argument("--threads", type=int, default=4, help="waitress worker threads")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--output", help="Report file (default: bench/results/<commit>-<size>.json)")
+    parser.add_argument("--baseline", help="Earlier report to compare against")
+    args = parser.parse_args(argv)
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+
+    source = args.db or dataset_path(args.size)
+    if not os.path.exists(source):
+        parser.error(f"{source} not found; generate it with: python -m bench.datagen --size {args.size}")
+
+    workdir = tempfile.mkdtemp(prefix="phonedash-bench-")
+    database = os.path.join(workdir, "phonebook.db")
+    # Write scenarios must never touch the dataset, so every run starts from the same state
+    shutil.copyfile(source, database)
+    with sqlite3.connect(database) as conn:
+        rows = conn.execute("SELECT COUNT(*) FROM contacts").fetchone()[0]
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    log_path = os.path.join(workdir, "server.log")
+    with open(log_path, "w") as log_file:
+        process = subprocess.Popen(
+            [sys.executable, "-c", SERVER_SCRIPT, str(port), str(args.threads)],
+            cwd=REPO_ROOT,
+            env=dict(os.environ, PHONEBOOK_DATABASE=database),
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+        )
+    try:
+        wait_for_server(base_url, process)
+        context = {"total_count": rows}
+        if "excel_import" in scenarios:
+            context["workbook"] = build_import_workbook(args.seed)
+
+        results = {}
+        for name in scenarios:
+            print(f"Running {name}...", file=sys.stderr)
+            results[name] = run_scenario(
+                name, base_url, args.concurrency, args.duration, args.seed, context
+            )
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    report = {
+        "meta": {
+            "git": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "dataset": os.path.basename(source),
+            "rows": rows,
+            "seed": args.seed,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "server_threads": args.threads,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "scenarios": results,
+    }
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{report['meta']['git']['commit']}-{os.path.splitext(report['meta']['dataset'])[0]}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    print(f"\nReport written to {output}", file=sys.stderr)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
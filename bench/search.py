@@ -0,0 +1,167 @@
+"""Micro-benchmark of contact search: the trigram index against a table scan.
+
+Runs the queries of GET /api/contacts/search (a page of rows and the total
+count) for kinds of terms operators type, taken from the dataset itself:
+through the contact_trigrams index, scanning the contacts table with the same
+matching rules (PHONEBOOK_TRIGRAM_SEARCH=0), and with the plain LIKE scan used
+before the index existed. It checks that the index and the scan find the same
+rows:
+
+    python -m bench.datagen --size 100k
+    python -m bench.search --size 100k --terms 20
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+
+from bench.datagen import DEFAULT_SEED, SIZES, dataset_path
+from database import SEARCH_COLUMNS
+from normalize import phone_digits
+from routes.contacts import build_search_where
+
+# Contact columns sampled for each kind of term
+_PHONE_COLUMNS = ("mobile_phone", "office_phone1")
+_PERSIAN_DIGITS = str.maketrans("0123456789", "۰۱۲۳۴۵۶۷۸۹")
+
+
+def _fragment(rng, text, length):
+    start = rng.randrange(0, max(len(text) - length, 0) + 1)
+    return text[start : start + length]
+
+
+def sample_terms(conn, rng, count):
+    """Returns ``{kind: [term, ...]}`` with ``count`` terms of each kind."""
+    max_id = conn.execute("SELECT MAX(id) FROM contacts").fetchone()[0]
+    sample = rng.sample(range(1, max_id + 1), min(count * 20, max_id))
+    rows = conn.execute(
+        "SELECT full_name, main_company, email, mobile_phone, office_phone1 FROM contacts "
+        "WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps(sample),),
+    ).fetchall()
+    phones = [phone_digits(row[column]) for row in rows for column in _PHONE_COLUMNS]
+    phones = [phone for phone in phones if len(phone) >= 8]
+    names = [row["full_name"] for row in rows if row["full_name"]]
+    companies = [row["main_company"] for row in rows if row["main_company"]]
+    emails = [row["email"] for row in rows if row["email"]]
+    return {
+        "phone fragment (4 digits)": [_fragment(rng, rng.choice(phones), 4) for _ in range(count)],
+        "phone fragment (6 digits)": [_fragment(rng, rng.choice(phones), 6) for _ in range(count)],
+        "phone fragment, Persian digits": [
+            _fragment(rng, rng.choice(phones), 5).translate(_PERSIAN_DIGITS) for _ in range(count)
+        ],
+        "name substring (3 chars)": [_fragment(rng, rng.choice(names), 3) for _ in range(count)],
+        "name substring (6 chars)": [_fragment(rng, rng.choice(names), 6) for _ in range(count)],
+        "company word": [rng.choice(rng.choice(companies).split()) for _ in range(count)],
+        "email fragment": [_fragment(rng, rng.choice(emails).split("@")[0], 5) for _ in range(count)],
+        "no match": ["".join(rng.choice("qxzjvw") for _ in range(6)) for _ in range(count)],
+    }
+
+
+def _like_scan_where(term):
+    conditions = " OR ".join(f"{column} LIKE ?" for column in SEARCH_COLUMNS)
+    return f" WHERE ({conditions})", [f"%{term}%"] * len(SEARCH_COLUMNS)
+
+
+def _search(conn, term, mode, page):
+    """The statements run by search_contacts for one page; returns (ids, total_count)."""
+    if mode == "like":
+        where_clause, params = _like_scan_where(term)
+    else:
+        where_clause, params = build_search_where(term, use_index=mode == "index")
+    ids = [row[0] for row in conn.execute(f"SELECT id FROM contacts{where_clause} LIMIT {page}", params)]
+    total = conn.execute(f"SELECT COUNT(*) FROM contacts{where_clause}", params).fetchone()[0]
+    return ids, total
+
+
+def _timed(conn, terms, mode, page, repeat):
+    timings, results = [], []
+    for term in terms:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = _search(conn, term, mode, page)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append(best)
+        results.append(result)
+    return timings, results
+
+
+def _index_size(conn):
+    try:
+        return conn.execute(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name LIKE 'contact_trigrams%'"
+        ).fetchone()[0]
+    except sqlite3.OperationalError:  # dbstat is an optional SQLite extension
+        return None
+
+
+def run(database, count, page, repeat, seed):
+    # A plain connection, so SQL tracing and query budgets do not skew the timings
+    conn = sqlite3.connect(database)
+    conn.row_factory = sqlite3.Row
+    conn.create_function("phone_digits", -1, phone_digits, deterministic=True)
+    try:
+        if conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'contact_trigrams'"
+        ).fetchone() is None:
+            sys.exit(f"{database} has no trigram index; regenerate it with python -m bench.datagen")
+        rows = conn.execute("SELECT COUNT(*) FROM contacts").fetchone()[0]
+        size = _index_size(conn)
+        print(
+            f"{rows:,} contacts"
+            + (f", trigram index {size / 2**20:.1f} MiB" if size else ""),
+            file=sys.stderr,
+        )
+
+        terms = sample_terms(conn, random.Random(seed), count)
+        print(
+            f"\n{'term kind':<32} {'matches':>8} {'LIKE p50':>10} {'scan p50':>10}"
+            f" {'index p50':>10} {'index p95':>10} {'vs LIKE':>8}",
+            file=sys.stderr,
+        )
+        for kind, kind_terms in terms.items():
+            like, _ = _timed(conn, kind_terms, "like", page, repeat)
+            scan, scan_results = _timed(conn, kind_terms, "scan", page, repeat)
+            index, index_results = _timed(conn, kind_terms, "index", page, repeat)
+            for term, expected, found in zip(kind_terms, scan_results, index_results):
+                if expected[1] != found[1]:
+                    print(f"  MISMATCH for {term!r}: scan {expected[1]}, index {found[1]}", file=sys.stderr)
+            matches = statistics.median(result[1] for result in index_results)
+            like_p50, index_p50 = statistics.median(like), statistics.median(index)
+            index_p95 = statistics.quantiles(index, n=20)[-1] if len(index) > 1 else index[0]
+            print(
+                f"{kind:<32} {matches:>8.0f} {like_p50 * 1000:>8.1f}ms"
+                f" {statistics.median(scan) * 1000:>8.1f}ms {index_p50 * 1000:>8.1f}ms"
+                f" {index_p95 * 1000:>8.1f}ms {like_p50 / index_p50:>7.1f}x",
+                file=sys.stderr,
+            )
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--size", choices=sorted(SIZES), default="10k", help="Generated dataset to use")
+    group.add_argument("--db", help="Explicit dataset file")
+    parser.add_argument("--terms", type=int, default=20, help="Terms sampled per kind")
+    parser.add_argument("--page", type=int, default=50, help="Rows in the page query")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per term (the fastest counts)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Term sampling seed")
+    args = parser.parse_args(argv)
+
+    database = args.db or dataset_path(args.size)
+    if not os.path.exists(database):
+        parser.error(f"{database} not found; generate it with: python -m bench.datagen --size {args.size}")
+    run(database, args.terms, args.page, args.repeat, args.seed)
+
+
+if __name__ == "__main__":
+    main()
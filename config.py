@@ -1,14 +1,183 @@
 import logging
+import os
 
 # Database configuration
-DATABASE = "phonebook.db"
+DATABASE = os.environ.get("PHONEBOOK_DATABASE", "phonebook.db")
+# WAL lets readers run alongside a writer, including across worker processes
+SQLITE_JOURNAL_MODE = "WAL"
+
+# Read snapshot: serve read endpoints from an in-memory copy of the database,
+# reloaded after writes. Each worker process holds its own copy.
+READ_SNAPSHOT = os.environ.get("PHONEBOOK_READ_SNAPSHOT", "0") == "1"
+# Seconds reads may keep using the copy after a write before they go to disk
+READ_SNAPSHOT_MAX_STALENESS = float(os.environ.get("PHONEBOOK_READ_SNAPSHOT_MAX_STALENESS", "2.0"))
+READ_SNAPSHOT_POLL_INTERVAL = 0.5  # Seconds between checks for writes by other processes
+READ_SNAPSHOT_REFRESH_DELAY = 0.2  # Seconds to wait after a change so bursts reload once
+
+# Server configuration (defaults for server.py command line options)
+SERVER_HOST = "0.0.0.0"
+SERVER_PORT = 5000
+SERVER_THREADS = int(os.environ.get("PHONEBOOK_SERVER_THREADS", "8"))
+SERVER_CONNECTION_LIMIT = 100
+SERVER_BACKLOG = 1024
+SERVER_CHANNEL_TIMEOUT = 120
+# Set to 0 in all but one worker process so background jobs run only once
+BACKGROUND_JOBS = os.environ.get("PHONEBOOK_BACKGROUND_JOBS", "1") != "0"
 
 # Flask configuration
 SECRET_KEY = "your_super_secret_key_here_replace_me"
+# JSON encoder: "auto" uses orjson when installed, "orjson" requires it, "json" forces the stdlib
+JSON_ENCODER = os.environ.get("PHONEBOOK_JSON_ENCODER", "auto")
+
+# Static assets: files under static/ are served from content-hashed copies with
+# gzip (and brotli, when installed) variants and a year of immutable caching
+ASSET_PIPELINE = os.environ.get("PHONEBOOK_ASSET_PIPELINE", "1") != "0"
+# Combine each page's ES modules into one file (see assets.py for the supported syntax)
+ASSET_BUNDLE_JS = os.environ.get("PHONEBOOK_ASSET_BUNDLE", "0") == "1"
+# Minify CSS and JavaScript when the optional rcssmin/rjsmin packages are installed
+ASSET_MINIFY = os.environ.get("PHONEBOOK_ASSET_MINIFY", "1") != "0"
+ASSET_MAX_AGE = 365 * 24 * 3600  # Seconds browsers may cache a fingerprinted file
+ASSET_GZIP_LEVEL = 9
+ASSET_BROTLI_QUALITY = 11
+
+# Contact search: terms of at least TRIGRAM_MIN_LENGTH characters are looked up in
+# the trigram index; PHONEBOOK_TRIGRAM_SEARCH=0 scans the contacts table instead
+TRIGRAM_SEARCH = os.environ.get("PHONEBOOK_TRIGRAM_SEARCH", "1") != "0"
+TRIGRAM_MIN_LENGTH = 3  # Shorter terms have no trigram to look up
+
+# Duplicate detection configuration
+DUPLICATE_SCAN_INTERVAL = 300  # Seconds between background duplicate scans
+DUPLICATE_SCORE_THRESHOLD = 0.7  # Minimum score for a pair to be reported
+DUPLICATE_MAX_BLOCK_SIZE = 200  # Blocks larger than this are too generic to compare
+
+# SQL tracing configuration
+SLOW_QUERY_THRESHOLD_MS = 200  # Statements slower than this are logged with their plan
+SQL_TRACE_MAX_SHAPES = 500  # Upper bound on distinct statement shapes kept in memory
+
+# Authorization cache configuration
+AUTH_CACHE_TTL = 5  # Seconds a cached role/auth version is trusted before re-reading users
+
+# Password hashing configuration
+# Full werkzeug method string; stored hashes using other parameters are upgraded on login
+PASSWORD_HASH_METHOD = os.environ.get("PHONEBOOK_PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+PASSWORD_SALT_LENGTH = 16
+PASSWORD_HASH_WORKERS = 2  # Concurrent hash operations; keep below the server's thread count
+# Operations allowed to wait for a worker. Each waiting login holds a server thread,
+# so workers + queue stay below the light admission lane's concurrency and other
+# requests keep running; a short burst queues and PASSWORD_HASH_QUEUE_TIMEOUT sheds
+# whatever waits too long
+PASSWORD_HASH_QUEUE_SIZE = max(1, SERVER_THREADS // 8)
+PASSWORD_HASH_QUEUE_TIMEOUT = 3  # Seconds an operation may wait for a worker before a 503
+
+# Admission control: concurrent requests per lane, how many may wait for a slot,
+# how long they wait (seconds) and the Retry-After sent when they are turned away.
+# Both lanes are sized from SERVER_THREADS (server.py exports its --threads value
+# before this module is imported). A request waiting in a lane still holds a waitress
+# thread, so the running and queued slots of both lanes add up to the thread count:
+# the lanes reject load before waitress itself runs out of threads.
+ADMISSION_HEAVY_CONCURRENCY = max(1, SERVER_THREADS // 4)
+ADMISSION_HEAVY_QUEUE_SIZE = 1
+ADMISSION_LIGHT_QUEUE_SIZE = 1
+ADMISSION_LANES = {
+    "heavy": {
+        "concurrency": ADMISSION_HEAVY_CONCURRENCY,
+        "queue_size": ADMISSION_HEAVY_QUEUE_SIZE,
+        "queue_timeout": 10,
+        "retry_after": 5,
+    },
+    "light": {
+        "concurrency": max(
+            1,
+            SERVER_THREADS
+            - ADMISSION_HEAVY_CONCURRENCY
+            - ADMISSION_HEAVY_QUEUE_SIZE
+            - ADMISSION_LIGHT_QUEUE_SIZE,
+        ),
+        "queue_size": ADMISSION_LIGHT_QUEUE_SIZE,
+        "queue_timeout": 2,
+        "retry_after": 1,
+    },
+}
 
+# Query time budgets: seconds of wall time a request's SQL may run before it is
+# aborted with a "query too expensive" response. Keyed by admission lane, with
+# per-endpoint overrides; 0 disables the budget.
+QUERY_TIME_BUDGETS = {
+    "light": 3,
+    "heavy": 30,
+    "contacts_routes.import_contacts": 120,
+    "duplicates_routes.scan_duplicates": 0,
+}
+QUERY_BUDGET_CHECK_INTERVAL = 10000  # SQLite VM instructions between deadline checks
+
+# Database maintenance: seconds between runs of each task; 0 disables it.
+# Tasks only start once the server has been idle for MAINTENANCE_IDLE_SECONDS.
+MAINTENANCE_INTERVALS = {
+    "analyze": 6 * 3600,  # Refresh query planner statistics
+    "vacuum": 24 * 3600,  # Return free pages to the file system (incremental vacuum)
+    "checkpoint": 600,  # Copy the WAL into the database file and truncate it
+    "backup": 24 * 3600,  # Write a compressed backup to BACKUP_DIR
+}
+MAINTENANCE_IDLE_SECONDS = 60  # Quiet time (no requests, no writes) before a task may run
+MAINTENANCE_POLL_INTERVAL = 15  # Seconds between scheduler checks
+MAINTENANCE_ANALYSIS_LIMIT = 1000  # Rows sampled per index by ANALYZE (0 = exact, slow)
+MAINTENANCE_ANALYZE_DRIFT = 0.25  # Re-analyze early once a table's row count drifts this much
+MAINTENANCE_VACUUM_MIN_FREE_PAGES = 256  # Free pages below which vacuuming is skipped
+MAINTENANCE_BUSY_TIMEOUT_MS = 2000  # How long a task waits for a lock before giving up
+MAINTENANCE_HISTORY_SIZE = 200  # Runs kept in the maintenance_runs table
+
+# Write coordinator: contact and company writes run on one writer thread per
+# process, and writes that arrive together are committed in one transaction
+WRITE_COORDINATOR = os.environ.get("PHONEBOOK_WRITE_COORDINATOR", "1") != "0"
+WRITE_BATCH_WINDOW = 0.001  # Seconds the writer waits for more writes to join a batch
+WRITE_BATCH_MAX = 64  # Writes committed together at most
+WRITE_QUEUE_TIMEOUT = 10  # Seconds a write may wait to start before the request gets 503
+
+# Audit trail: changes are buffered in memory and written in batches by a
+# background thread, so at most AUDIT_FLUSH_INTERVAL seconds of changes are
+# lost if the process dies; a clean shutdown writes everything.
+AUDIT_FLUSH_INTERVAL = 1.0  # Seconds a change may wait in memory before it is written
+AUDIT_BATCH_SIZE = 500  # Buffered changes that trigger an immediate write
+AUDIT_MAX_PENDING = 200000  # Changes buffered at most; writers then wait for the flush
+AUDIT_ENQUEUE_TIMEOUT = 5  # Seconds a request waits for buffer space before dropping changes
+
+# Backups: gzip-compressed online copies of the database with a SHA-256 checksum
+BACKUP_DIR = os.environ.get("PHONEBOOK_BACKUP_DIR", "backups")
+BACKUP_KEEP = int(os.environ.get("PHONEBOOK_BACKUP_KEEP", "7"))  # Newest backups kept
+BACKUP_PAGES_PER_STEP = 256  # Pages copied per backup step (1 MiB with 4 KiB pages)
+BACKUP_STEP_PAUSE = 0.005  # Seconds between steps so requests keep the disk and CPU
+BACKUP_COMPRESS_LEVEL = 6
+
+# Request profiler configuration
+PROFILE_HISTORY_SIZE = 20  # Profiles kept in memory for download
+PROFILE_TOP_FUNCTIONS = 40  # Functions listed in a profile's text summary
 
 # Logging configuration
+LOG_LEVEL = os.environ.get("PHONEBOOK_LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("PHONEBOOK_LOG_FORMAT", "json")  # "json" or "text"
+LOG_FILE = os.environ.get("PHONEBOOK_LOG_FILE")  # Optional rotating log file
+LOG_QUEUE_SIZE = 10000  # Records buffered for the log writer thread before dropping
+LOG_SAMPLE_LIMIT = 20  # Records of one INFO/DEBUG message template let through per window
+LOG_SAMPLE_WINDOW = 1.0  # Seconds
+# Per-logger levels, overridable with PHONEBOOK_LOG_LEVELS="app=DEBUG,waitress=WARNING"
+LOG_LEVELS = {"waitress": "INFO", "werkzeug": "WARNING"}
+LOG_LEVELS.update(
+    item.split("=", 1)
+    for item in os.environ.get("PHONEBOOK_LOG_LEVELS", "").split(",")
+    if "=" in item
+)
+
+
 def setup_logging():
-    logging.basicConfig(
-        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    """Sends log records through a queue so log I/O never runs on a request thread."""
+    from structured_logging import setup_queue_logging
+
+    setup_queue_logging(
+        level=LOG_LEVEL,
+        logger_levels=LOG_LEVELS,
+        log_format=LOG_FORMAT,
+        log_file=LOG_FILE,
+        queue_size=LOG_QUEUE_SIZE,
+        sample_limit=LOG_SAMPLE_LIMIT,
+        sample_window=LOG_SAMPLE_WINDOW,
     )
@@ -1,20 +1,178 @@
 import sqlite3
-from config import DATABASE
+import time
+from config import DATABASE, SQLITE_JOURNAL_MODE
 from flask import current_app
+from metrics import DB_CONNECT_TIME, record_sql_time
+from normalize import (
+    contact_identity_key,
+    name_words_json,
+    normalize_name,
+    phone_digits,
+    search_text,
+)
+from query_budget import install_query_budget
+from sqltrace import trace_fetch, trace_statement
 
 
-def get_db_connection():
-    """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DATABASE)
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports the time spent in SQLite to the metrics and SQL trace modules."""
+
+    _trace = None
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            record_sql_time(elapsed)
+            self._trace = trace_statement(self.connection, sql, parameters, elapsed)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            record_sql_time(elapsed)
+            # Parameters of a batch cannot be replayed, so no plan is captured
+            self._trace = trace_statement(self.connection, sql, None, elapsed)
+
+    # SQLite does most of the work lazily while rows are stepped through
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._record_fetch(time.perf_counter() - start)
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._record_fetch(time.perf_counter() - start)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._record_fetch(time.perf_counter() - start)
+
+    def _record_fetch(self, elapsed):
+        record_sql_time(elapsed, statements=0)
+        trace_fetch(self._trace, elapsed)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors and commits are timed."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            record_sql_time(time.perf_counter() - start, statements=0)
+
+
+def get_db_connection(database=None, uri=False):
+    """Establishes a connection to the SQLite database.
+
+    ``database`` defaults to the configured database file; the read snapshot
+    passes the URI of its in-memory copy instead.
+    """
+    start = time.perf_counter()
+    conn = sqlite3.connect(database or DATABASE, factory=InstrumentedConnection, uri=uri)
+    DB_CONNECT_TIME.observe(time.perf_counter() - start)
     conn.row_factory = sqlite3.Row
+    # Used by the contacts identity triggers; writes to contacts need this function registered
+    conn.create_function(
+        "contact_identity_key", 2, contact_identity_key, deterministic=True
+    )
+    # Used by the companies search triggers
+    conn.create_function("normalize_name", 1, normalize_name, deterministic=True)
+    conn.create_function("name_words_json", 1, name_words_json, deterministic=True)
+    # Used by the contacts trigram search triggers
+    conn.create_function("search_text", -1, search_text, deterministic=True)
+    conn.create_function("phone_digits", -1, phone_digits, deterministic=True)
+    install_query_budget(conn)
     return conn
 
 
+# Stored in the database file's user_version once init_db() has brought it up to
+# date. Bump it with every schema change so existing files are migrated again.
+SCHEMA_VERSION = 2
+
+# Contact columns matched by the free-text search term, and the phone columns also
+# matched by their digits alone; both are kept in the contact_trigrams index
+SEARCH_COLUMNS = [
+    "full_name",
+    "main_company",
+    "job_title",
+    "mobile_phone",
+    "office_phone1",
+    "office_phone2",
+    "office_phone3",
+    "email",
+    "office_email",
+    "subject_category",
+    "country",
+    "address",
+    "description",
+]
+PHONE_SEARCH_COLUMNS = ["mobile_phone", "office_phone1", "office_phone2", "office_phone3"]
+
+
+def _trigram_values(row):
+    """The body and phones values indexed for a contacts row (``new``, ``old`` or the table)."""
+    body = ", ".join(f"{row}.{column}" for column in SEARCH_COLUMNS)
+    phones = ", ".join(f"{row}.{column}" for column in PHONE_SEARCH_COLUMNS)
+    return f"search_text({body}), phone_digits({phones})"
+
+
+def schema_version():
+    """Returns the schema version recorded in the database file (0 for a new or older file)."""
+    conn = get_db_connection()
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
 def init_db():
-    """Initializes the database by creating the contacts, companies, and users tables if they don't exist."""
+    """Initializes the database by creating the contacts, companies, and users tables if they don't exist.
+
+    A file already stamped with SCHEMA_VERSION is left alone, which makes
+    process start a single PRAGMA instead of dozens of schema checks.
+    """
+    if schema_version() >= SCHEMA_VERSION:
+        current_app.logger.info(
+            "Database schema is current (version %s).", SCHEMA_VERSION
+        )
+        return
+
+    migration_failed = False
     conn = get_db_connection()
     cursor = conn.cursor()
 
+    # Only takes effect on a new, empty file; existing files are converted once with
+    # python maintenance.py convert-vacuum (a full VACUUM) so free pages can be reclaimed
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+    # The journal mode is stored in the database file, so this only changes it once
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    current_app.logger.info("SQLite journal mode: %s", cursor.fetchone()[0])
+
     # --- Migration for contacts table: Remove affiliated_company1 and affiliated_company2 ---
     cursor.execute("PRAGMA table_info(contacts)")
     existing_columns = [col[1] for col in cursor.fetchall()]
@@ -53,7 +211,9 @@ def init_db():
                     country TEXT,
                     address TEXT,
                     postal_code TEXT,
-                    description TEXT
+                    description TEXT,
+                    version INTEGER NOT NULL DEFAULT 1,
+                    identity_key TEXT
                 )
             """
             )
@@ -100,7 +260,8 @@ def init_db():
             current_app.logger.info("Contacts table migration complete.")
             conn.commit()
         except sqlite3.Error as e:
-            current_app.logger.error(f"Error during contacts table migration: {e}")
+            migration_failed = True
+            current_app.logger.error("Error during contacts table migration: %s", e)
             conn.rollback()
         finally:
             conn.close()
@@ -135,13 +296,16 @@ def init_db():
                     country TEXT,
                     address TEXT,
                     postal_code TEXT,
-                    description TEXT
+                    description TEXT,
+                    version INTEGER NOT NULL DEFAULT 1,
+                    identity_key TEXT
                 )
             """
             )
             conn.commit()
         except sqlite3.Error as e:
-            current_app.logger.error(f"Error creating contacts table: {e}")
+            migration_failed = True
+            current_app.logger.error("Error creating contacts table: %s", e)
             conn.rollback()
         finally:
             conn.close()
@@ -150,29 +314,400 @@ def init_db():
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
+        # --- Migration for contacts table: Add row version for optimistic concurrency ---
+        cursor.execute("PRAGMA table_info(contacts)")
+        contact_columns = [col[1] for col in cursor.fetchall()]
+        if "version" not in contact_columns:
+            current_app.logger.info("Migrating contacts table: Adding version column.")
+            cursor.execute(
+                "ALTER TABLE contacts ADD COLUMN version INTEGER NOT NULL DEFAULT 1"
+            )
+
+        # --- Migration for contacts table: Add identity key for idempotent imports ---
+        if "identity_key" not in contact_columns:
+            current_app.logger.info("Migrating contacts table: Adding identity_key column.")
+            cursor.execute("ALTER TABLE contacts ADD COLUMN identity_key TEXT")
+            # The oldest contact owns a key; later duplicates keep a NULL key
+            cursor.execute("SELECT id, mobile_phone, email FROM contacts ORDER BY id")
+            seen_keys = set()
+            identity_updates = []
+            for row in cursor.fetchall():
+                key = contact_identity_key(row["mobile_phone"], row["email"])
+                if key and key not in seen_keys:
+                    seen_keys.add(key)
+                    identity_updates.append((key, row["id"]))
+            cursor.executemany(
+                "UPDATE contacts SET identity_key = ? WHERE id = ?", identity_updates
+            )
+        cursor.execute(
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_contacts_identity_key
+            ON contacts (identity_key) WHERE identity_key IS NOT NULL
+        """
+        )
+        # Keys are assigned first come, first served; a contact whose key is already
+        # taken keeps a NULL key and is left to the duplicate scanner.
+        cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS contacts_identity_insert AFTER INSERT ON contacts
+            WHEN new.identity_key IS NULL
+            BEGIN
+                UPDATE contacts SET identity_key = NULLIF(
+                    contact_identity_key(new.mobile_phone, new.email),
+                    (SELECT identity_key FROM contacts
+                     WHERE identity_key = contact_identity_key(new.mobile_phone, new.email))
+                )
+                WHERE id = new.id;
+            END
+        """
+        )
+        cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS contacts_identity_update
+            AFTER UPDATE OF mobile_phone, email ON contacts
+            BEGIN
+                UPDATE contacts SET identity_key = NULLIF(
+                    contact_identity_key(new.mobile_phone, new.email),
+                    (SELECT identity_key FROM contacts
+                     WHERE identity_key = contact_identity_key(new.mobile_phone, new.email)
+                       AND id != new.id)
+                )
+                WHERE id = new.id;
+            END
+        """
+        )
+
         cursor.execute(
             """
             CREATE TABLE IF NOT EXISTS companies (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 company_name TEXT NOT NULL UNIQUE,
                 sub_company1 TEXT,
-                sub_company2 TEXT
+                sub_company2 TEXT,
+                name_key TEXT
             )
         """
         )
+
+        # --- Migration for companies table: Add normalized name key for sorting and search ---
+        cursor.execute("PRAGMA table_info(companies)")
+        company_columns = [col[1] for col in cursor.fetchall()]
+        if "name_key" not in company_columns:
+            current_app.logger.info("Migrating companies table: Adding name_key column.")
+            cursor.execute("ALTER TABLE companies ADD COLUMN name_key TEXT")
+            cursor.execute("UPDATE companies SET name_key = normalize_name(company_name)")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_companies_name_key ON companies (name_key)"
+        )
+        # Parent lookups when building a company's hierarchy
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_companies_sub_company1 ON companies (sub_company1)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_companies_sub_company2 ON companies (sub_company2)"
+        )
+
+        # Every word of a normalized company name, so a prefix of any word is an index range
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'company_name_words'"
+        )
+        needs_word_backfill = cursor.fetchone() is None
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS company_name_words (
+                word TEXT NOT NULL,
+                company_id INTEGER NOT NULL,
+                PRIMARY KEY (word, company_id)
+            ) WITHOUT ROWID
+        """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_company_name_words_company ON company_name_words (company_id)"
+        )
+        cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS companies_name_insert AFTER INSERT ON companies
+            BEGIN
+                UPDATE companies SET name_key = normalize_name(new.company_name)
+                WHERE id = new.id;
+                INSERT INTO company_name_words (word, company_id)
+                SELECT DISTINCT value, new.id FROM json_each(name_words_json(new.company_name));
+            END
+        """
+        )
+        cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS companies_name_update
+            AFTER UPDATE OF company_name ON companies
+            BEGIN
+                UPDATE companies SET name_key = normalize_name(new.company_name)
+                WHERE id = new.id;
+                DELETE FROM company_name_words WHERE company_id = new.id;
+                INSERT INTO company_name_words (word, company_id)
+                SELECT DISTINCT value, new.id FROM json_each(name_words_json(new.company_name));
+            END
+        """
+        )
+        cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS companies_name_delete AFTER DELETE ON companies
+            BEGIN
+                DELETE FROM company_name_words WHERE company_id = old.id;
+            END
+        """
+        )
+        if needs_word_backfill:
+            current_app.logger.info("Indexing existing company names for search.")
+            cursor.execute(
+                """
+                INSERT INTO company_name_words (word, company_id)
+                SELECT DISTINCT words.value, companies.id
+                FROM companies, json_each(name_words_json(companies.company_name)) AS words
+            """
+            )
         cursor.execute(
             """
             CREATE TABLE IF NOT EXISTS users (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 username TEXT NOT NULL UNIQUE,
                 password TEXT NOT NULL,
-                is_admin INTEGER DEFAULT 0
+                is_admin INTEGER DEFAULT 0,
+                auth_version INTEGER NOT NULL DEFAULT 1
+            )
+        """
+        )
+
+        # --- Migration for users table: Add auth version for session revocation ---
+        cursor.execute("PRAGMA table_info(users)")
+        user_columns = [col[1] for col in cursor.fetchall()]
+        if "auth_version" not in user_columns:
+            current_app.logger.info("Migrating users table: Adding auth_version column.")
+            cursor.execute(
+                "ALTER TABLE users ADD COLUMN auth_version INTEGER NOT NULL DEFAULT 1"
+            )
+        conn.commit()
+    except sqlite3.Error as e:
+        migration_failed = True
+        current_app.logger.error("Error creating companies or users table: %s", e)
+        conn.rollback()
+    finally:
+        conn.close()
+
+    # --- Duplicate detection tables ---
+    # Triggers queue every inserted or edited contact so the duplicate scanner only
+    # re-examines rows changed since its last run. They avoid OR IGNORE because an
+    # outer upsert's conflict handling would override it.
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'duplicate_queue'"
+        )
+        needs_backfill = cursor.fetchone() is None
+
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS duplicate_queue (contact_id INTEGER PRIMARY KEY)"
+        )
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS contact_blocking_keys (
+                block_key TEXT NOT NULL,
+                contact_id INTEGER NOT NULL,
+                PRIMARY KEY (block_key, contact_id)
+            ) WITHOUT ROWID
+        """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_blocking_keys_contact ON contact_blocking_keys (contact_id)"
+        )
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS duplicate_pairs (
+                contact_id_a INTEGER NOT NULL,
+                contact_id_b INTEGER NOT NULL,
+                score REAL NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                PRIMARY KEY (contact_id_a, contact_id_b)
+            )
+        """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_duplicate_pairs_b ON duplicate_pairs (contact_id_b)"
+        )
+        cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS contacts_dedup_insert AFTER INSERT ON contacts
+            BEGIN
+                INSERT INTO duplicate_queue (contact_id) SELECT new.id
+                WHERE NOT EXISTS (SELECT 1 FROM duplicate_queue WHERE contact_id = new.id);
+            END
+        """
+        )
+        cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS contacts_dedup_update
+            AFTER UPDATE OF full_name, main_company, mobile_phone, office_phone1,
+                office_phone2, office_phone3, email ON contacts
+            BEGIN
+                INSERT INTO duplicate_queue (contact_id) SELECT new.id
+                WHERE NOT EXISTS (SELECT 1 FROM duplicate_queue WHERE contact_id = new.id);
+            END
+        """
+        )
+        cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS contacts_dedup_delete AFTER DELETE ON contacts
+            BEGIN
+                DELETE FROM duplicate_queue WHERE contact_id = old.id;
+                DELETE FROM contact_blocking_keys WHERE contact_id = old.id;
+                DELETE FROM duplicate_pairs
+                WHERE contact_id_a = old.id OR contact_id_b = old.id;
+            END
+        """
+        )
+        if needs_backfill:
+            current_app.logger.info("Queueing existing contacts for duplicate detection.")
+            cursor.execute("INSERT OR IGNORE INTO duplicate_queue SELECT id FROM contacts")
+        conn.commit()
+    except sqlite3.Error as e:
+        migration_failed = True
+        current_app.logger.error("Error creating duplicate detection tables: %s", e)
+        conn.rollback()
+    finally:
+        conn.close()
+
+    # --- Trigram search index ---
+    # Every 3-character sequence of the searched columns and of the phone numbers'
+    # digits, so a substring search reads the rows holding all of the term's
+    # trigrams instead of scanning the table. detail=none stores no positions
+    # (half the size); candidates are verified against the table's own copy of
+    # the text by the LIKE that selected them.
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'contact_trigrams'"
+        )
+        needs_trigram_backfill = cursor.fetchone() is None
+        cursor.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS contact_trigrams
+            USING fts5(body, phones, tokenize = 'trigram', detail = 'none')
+        """
+        )
+        cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS contacts_trigrams_insert AFTER INSERT ON contacts
+            BEGIN
+                INSERT INTO contact_trigrams (rowid, body, phones)
+                VALUES (new.id, {_trigram_values("new")});
+            END
+        """
+        )
+        cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS contacts_trigrams_update
+            AFTER UPDATE OF {", ".join(SEARCH_COLUMNS)} ON contacts
+            BEGIN
+                DELETE FROM contact_trigrams WHERE rowid = old.id;
+                INSERT INTO contact_trigrams (rowid, body, phones)
+                VALUES (new.id, {_trigram_values("new")});
+            END
+        """
+        )
+        cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS contacts_trigrams_delete AFTER DELETE ON contacts
+            BEGIN
+                DELETE FROM contact_trigrams WHERE rowid = old.id;
+            END
+        """
+        )
+        if needs_trigram_backfill:
+            current_app.logger.info("Building the trigram search index for existing contacts.")
+            cursor.execute(
+                f"""
+                INSERT INTO contact_trigrams (rowid, body, phones)
+                SELECT id, {_trigram_values("contacts")} FROM contacts
+            """
+            )
+            cursor.execute("INSERT INTO contact_trigrams (contact_trigrams) VALUES ('optimize')")
+        conn.commit()
+    except sqlite3.Error as e:
+        migration_failed = True
+        current_app.logger.error("Error creating trigram search index: %s", e)
+        conn.rollback()
+    finally:
+        conn.close()
+
+    # --- Maintenance run log ---
+    conn = get_db_connection()
+    try:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS maintenance_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                task TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                duration_ms REAL NOT NULL,
+                outcome TEXT NOT NULL,
+                details TEXT
             )
         """
         )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_maintenance_runs_task ON maintenance_runs (task, started_at)"
+        )
         conn.commit()
     except sqlite3.Error as e:
-        current_app.logger.error(f"Error creating companies or users table: {e}")
+        migration_failed = True
+        current_app.logger.error("Error creating maintenance_runs table: %s", e)
         conn.rollback()
     finally:
         conn.close()
+
+    # --- Audit log ---
+    # Rows reference users and records by id without foreign keys, so entries
+    # outlive the contacts, companies and users they describe
+    conn = get_db_connection()
+    try:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS audit_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                occurred_at REAL NOT NULL,
+                user_id INTEGER,
+                username TEXT,
+                entity TEXT NOT NULL,
+                entity_id INTEGER,
+                action TEXT NOT NULL,
+                changes TEXT NOT NULL
+            )
+        """
+        )
+        # Each index ends in the rowid, so filtered pages come back in id order
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_audit_log_entity ON audit_log (entity, entity_id)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_user ON audit_log (user_id)")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_audit_log_occurred ON audit_log (occurred_at)"
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        migration_failed = True
+        current_app.logger.error("Error creating audit_log table: %s", e)
+        conn.rollback()
+    finally:
+        conn.close()
+
+    # Only a complete migration is recorded, so a failed step is retried on the next start
+    if migration_failed:
+        current_app.logger.warning("Database schema not fully migrated; retrying on next start.")
+        return
+    conn = get_db_connection()
+    try:
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    finally:
+        conn.close()
+    current_app.logger.info("Database schema migrated to version %s.", SCHEMA_VERSION)
@@ -0,0 +1,248 @@
+import json
+import threading
+from difflib import SequenceMatcher
+
+from config import (
+    DUPLICATE_MAX_BLOCK_SIZE,
+    DUPLICATE_SCAN_INTERVAL,
+    DUPLICATE_SCORE_THRESHOLD,
+)
+from normalize import name_tokens, normalize_email, normalize_name, normalize_phone
+from writer import WriteQueueTimeout, run_write
+
+OFFICE_PHONE_COLUMNS = ["office_phone1", "office_phone2", "office_phone3"]
+
+# Contacts processed per scanner transaction
+SCAN_BATCH_SIZE = 500
+
+
+def blocking_keys(contact):
+    """Returns the blocking keys of a contact.
+
+    Only contacts sharing at least one key are ever compared, which keeps the
+    scan proportional to block sizes instead of quadratic in the table size.
+    """
+    keys = set()
+    for column in ["mobile_phone"] + OFFICE_PHONE_COLUMNS:
+        phone = normalize_phone(contact[column])
+        if phone:
+            keys.add(f"phone:{phone}")
+    email = normalize_email(contact["email"])
+    if email:
+        keys.add(f"email:{email}")
+    tokens = name_tokens(contact["full_name"])
+    if tokens:
+        keys.add(f"name:{' '.join(tokens)}")
+    return keys
+
+
+def name_similarity(name_a, name_b):
+    """Scores two names between 0 and 1, tolerant of token order and small typos."""
+    tokens_a = set(name_tokens(name_a))
+    tokens_b = set(name_tokens(name_b))
+    if not tokens_a or not tokens_b:
+        return 0.0
+    jaccard = len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+    ratio = SequenceMatcher(None, normalize_name(name_a), normalize_name(name_b)).ratio()
+    return max(jaccard, ratio)
+
+
+def score_pair(contact_a, contact_b):
+    """Scores how likely two contacts describe the same person, between 0 and 1."""
+    score = 0.5 * name_similarity(contact_a["full_name"], contact_b["full_name"])
+
+    mobile_a = normalize_phone(contact_a["mobile_phone"])
+    if mobile_a and mobile_a == normalize_phone(contact_b["mobile_phone"]):
+        score += 0.4
+
+    email_a = normalize_email(contact_a["email"])
+    if email_a and email_a == normalize_email(contact_b["email"]):
+        score += 0.4
+
+    # Office lines are often shared by colleagues, so they only weigh in lightly
+    office_a = {normalize_phone(contact_a[c]) for c in OFFICE_PHONE_COLUMNS} - {""}
+    office_b = {normalize_phone(contact_b[c]) for c in OFFICE_PHONE_COLUMNS} - {""}
+    if office_a & office_b:
+        score += 0.15
+
+    company_a = normalize_name(contact_a["main_company"])
+    if company_a and company_a == normalize_name(contact_b["main_company"]):
+        score += 0.05
+
+    return round(min(score, 1.0), 3)
+
+
+def _fetch_contacts(cursor, ids):
+    cursor.execute(
+        "SELECT * FROM contacts WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(ids)),),
+    )
+    return {row["id"]: row for row in cursor.fetchall()}
+
+
+def scan_batch(cursor):
+    """Re-examines one batch of queued contacts.
+
+    A write operation for the write coordinator (see writer.py), so the scan
+    never competes with request writes for SQLite's write lock. Returns
+    ``(processed, skipped_blocks)``.
+    """
+    cursor.execute(
+        "SELECT contact_id FROM duplicate_queue ORDER BY contact_id LIMIT ?",
+        (SCAN_BATCH_SIZE,),
+    )
+    queued_ids = [row[0] for row in cursor.fetchall()]
+    if not queued_ids:
+        return 0, 0
+
+    queued_json = json.dumps(queued_ids)
+    contacts = _fetch_contacts(cursor, queued_ids)
+
+    # Refresh the blocking keys of the queued contacts
+    cursor.execute(
+        "DELETE FROM contact_blocking_keys WHERE contact_id IN (SELECT value FROM json_each(?))",
+        (queued_json,),
+    )
+    contact_keys = {contact_id: blocking_keys(row) for contact_id, row in contacts.items()}
+    cursor.executemany(
+        "INSERT OR IGNORE INTO contact_blocking_keys (block_key, contact_id) VALUES (?, ?)",
+        [(key, contact_id) for contact_id, keys in contact_keys.items() for key in keys],
+    )
+
+    # Skip blocks too generic to be meaningful (e.g. a shared switchboard number)
+    all_keys = {key for keys in contact_keys.values() for key in keys}
+    cursor.execute(
+        """
+        SELECT block_key FROM contact_blocking_keys
+        WHERE block_key IN (SELECT value FROM json_each(?))
+        GROUP BY block_key HAVING COUNT(*) <= ?
+    """,
+        (json.dumps(sorted(all_keys)), DUPLICATE_MAX_BLOCK_SIZE),
+    )
+    usable_keys = [row[0] for row in cursor.fetchall()]
+
+    cursor.execute(
+        """
+        SELECT block_key, contact_id FROM contact_blocking_keys
+        WHERE block_key IN (SELECT value FROM json_each(?))
+    """,
+        (json.dumps(usable_keys),),
+    )
+    block_members = {}
+    for row in cursor.fetchall():
+        block_members.setdefault(row["block_key"], []).append(row["contact_id"])
+
+    candidate_pairs = set()
+    for contact_id, keys in contact_keys.items():
+        for key in keys:
+            for other_id in block_members.get(key, ()):
+                if other_id != contact_id:
+                    candidate_pairs.add((min(contact_id, other_id), max(contact_id, other_id)))
+
+    other_ids = {i for pair in candidate_pairs for i in pair} - contacts.keys()
+    contacts.update(_fetch_contacts(cursor, other_ids))
+
+    # Pending pairs of re-examined contacts are recomputed; reviewed ones are kept
+    cursor.execute(
+        """
+        DELETE FROM duplicate_pairs
+        WHERE status = 'pending'
+          AND (contact_id_a IN (SELECT value FROM json_each(?))
+               OR contact_id_b IN (SELECT value FROM json_each(?)))
+    """,
+        (queued_json, queued_json),
+    )
+    scored_pairs = []
+    for id_a, id_b in candidate_pairs:
+        score = score_pair(contacts[id_a], contacts[id_b])
+        if score >= DUPLICATE_SCORE_THRESHOLD:
+            scored_pairs.append((id_a, id_b, score))
+    cursor.executemany(
+        """
+        INSERT INTO duplicate_pairs (contact_id_a, contact_id_b, score) VALUES (?, ?, ?)
+        ON CONFLICT (contact_id_a, contact_id_b) DO UPDATE SET score = excluded.score
+    """,
+        scored_pairs,
+    )
+
+    cursor.execute(
+        "DELETE FROM duplicate_queue WHERE contact_id IN (SELECT value FROM json_each(?))",
+        (queued_json,),
+    )
+    return len(queued_ids), len(all_keys) - len(usable_keys)
+
+
+def run_duplicate_scan(logger):
+    """Processes every queued contact. Returns the number of contacts examined.
+
+    Each batch is its own exclusive write, so request writes queued meanwhile
+    wait for one batch at most. Raises WriteQueueTimeout if a batch could not start.
+    """
+    processed = 0
+    while True:
+        count, skipped_blocks = run_write(scan_batch, exclusive=True)
+        if skipped_blocks:
+            logger.info("Duplicate scan skipped %d oversized blocks.", skipped_blocks)
+        if not count:
+            break
+        processed += count
+    if processed:
+        logger.info("Duplicate scan examined %d contacts.", processed)
+    return processed
+
+
+def build_clusters(pairs):
+    """Groups scored pairs into clusters of contacts that are likely the same person."""
+    parent = {}
+
+    def find(contact_id):
+        parent.setdefault(contact_id, contact_id)
+        while parent[contact_id] != contact_id:
+            parent[contact_id] = parent[parent[contact_id]]
+            contact_id = parent[contact_id]
+        return contact_id
+
+    for pair in pairs:
+        root_a, root_b = find(pair["contact_id_a"]), find(pair["contact_id_b"])
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    clusters = {}
+    for pair in pairs:
+        cluster = clusters.setdefault(
+            find(pair["contact_id_a"]), {"contact_ids": set(), "pairs": [], "score": 0.0}
+        )
+        cluster["contact_ids"].update((pair["contact_id_a"], pair["contact_id_b"]))
+        cluster["pairs"].append(dict(pair))
+        cluster["score"] = max(cluster["score"], pair["score"])
+
+    result = []
+    for cluster in clusters.values():
+        cluster["contact_ids"] = sorted(cluster["contact_ids"])
+        result.append(cluster)
+    result.sort(key=lambda c: (-c["score"], c["contact_ids"][0]))
+    return result
+
+
+def start_duplicate_scanner(app):
+    """Starts the background thread that incrementally scans for duplicates."""
+    stop_event = threading.Event()
+
+    def scan_loop():
+        while True:
+            with app.app_context():
+                try:
+                    run_duplicate_scan(app.logger)
+                except WriteQueueTimeout:
+                    # The remaining queue is picked up by the next scan
+                    app.logger.warning("Duplicate scan postponed: Write queue is busy.")
+                except Exception as e:
+                    app.logger.error(
+                        "Error during duplicate scan: %s", e, exc_info=True
+                    )
+            if stop_event.wait(DUPLICATE_SCAN_INTERVAL):
+                break
+
+    thread = threading.Thread(target=scan_loop, name="duplicate-scanner", daemon=True)
+    thread.start()
+    return stop_event
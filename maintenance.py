@@ -0,0 +1,455 @@
+"""Database maintenance: idle-time ANALYZE, incremental vacuum, WAL checkpoints and backups.
+
+The tasks run from a background thread while the server is idle. Files created
+before incremental vacuum was enabled are converted once from the command line:
+
+    python maintenance.py convert-vacuum
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from flask import g
+
+from backup import BackupError, BackupInProgress, create_backup
+from config import (
+    DATABASE,
+    MAINTENANCE_ANALYSIS_LIMIT,
+    MAINTENANCE_ANALYZE_DRIFT,
+    MAINTENANCE_BUSY_TIMEOUT_MS,
+    MAINTENANCE_HISTORY_SIZE,
+    MAINTENANCE_IDLE_SECONDS,
+    MAINTENANCE_INTERVALS,
+    MAINTENANCE_POLL_INTERVAL,
+    MAINTENANCE_VACUUM_MIN_FREE_PAGES,
+    setup_logging,
+)
+from database import get_db_connection
+from metrics import REGISTRY
+
+logger = logging.getLogger("phonedash.maintenance")
+
+MAINTENANCE_RUNS = REGISTRY.counter(
+    "phonedash_maintenance_runs_total",
+    "Database maintenance task runs, by task and outcome.",
+    ("task", "outcome"),
+)
+MAINTENANCE_DURATION = REGISTRY.histogram(
+    "phonedash_maintenance_duration_seconds",
+    "Time taken by database maintenance tasks, in seconds.",
+    ("task",),
+)
+DB_FILE_SIZE = REGISTRY.gauge(
+    "phonedash_db_file_bytes",
+    "Size of the database files on disk when last checked, in bytes.",
+    ("file",),
+)
+
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+# Tables whose planner statistics are checked for drift between scheduled runs
+ANALYZE_DRIFT_TABLES = ("contacts", "companies", "contact_blocking_keys", "company_name_words")
+
+
+class MaintenanceSkipped(Exception):
+    """Raised by a task that had nothing to do or could not get its lock."""
+
+    def __init__(self, outcome, details=None):
+        super().__init__(outcome)
+        self.outcome = outcome
+        self.details = details or {}
+
+
+def analyze(conn):
+    """Refreshes the query planner statistics (sqlite_stat1)."""
+    conn.execute(f"PRAGMA analysis_limit = {int(MAINTENANCE_ANALYSIS_LIMIT)}")
+    if sqlite3.sqlite_version_info >= (3, 46, 0):
+        # Newer SQLite can decide per table whether the statistics are out of date
+        conn.execute("PRAGMA optimize = 0x10002")
+    else:
+        # Before 3.46 optimize only considers tables this connection has queried
+        conn.execute("ANALYZE")
+    return {"analysis_limit": MAINTENANCE_ANALYSIS_LIMIT}
+
+
+def statistics_drifted(conn):
+    """Returns True if a table's row count moved away from the one ANALYZE recorded."""
+    has_stats = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+    ).fetchone()
+    if not has_stats:
+        return True
+    # The first number of each index's stat is the table's row count
+    recorded = dict(
+        conn.execute(
+            "SELECT tbl, MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 GROUP BY tbl"
+        ).fetchall()
+    )
+    for table in ANALYZE_DRIFT_TABLES:
+        if table not in recorded:
+            continue
+        count = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        expected = recorded[table] or 0
+        if abs(count - expected) > max(expected, 1) * MAINTENANCE_ANALYZE_DRIFT:
+            return True
+    return False
+
+
+def checkpoint(conn):
+    """Copies the WAL into the database file and truncates the WAL."""
+    busy, wal_pages, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    if wal_pages == -1:
+        raise MaintenanceSkipped("skipped", {"reason": "database is not in WAL mode"})
+    details = {"wal_pages": wal_pages, "checkpointed_pages": checkpointed}
+    if busy:
+        # A reader or writer held the WAL for longer than the busy timeout
+        raise MaintenanceSkipped("busy", details)
+    return details
+
+
+def vacuum(conn):
+    """Returns the free pages at the end of the file to the file system."""
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if mode != 2:
+        # Converting needs a full VACUUM, which is left to an operator (convert_auto_vacuum)
+        raise MaintenanceSkipped(
+            "skipped",
+            {
+                "reason": "auto_vacuum is not incremental; run python maintenance.py convert-vacuum",
+                "auto_vacuum": AUTO_VACUUM_MODES.get(mode, mode),
+            },
+        )
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if free_pages < MAINTENANCE_VACUUM_MIN_FREE_PAGES:
+        raise MaintenanceSkipped("skipped", {"free_pages": free_pages})
+    # The pragma frees one page per step; execute() would only step it once
+    conn.executescript("PRAGMA incremental_vacuum")
+    return {"freed_pages": free_pages - conn.execute("PRAGMA freelist_count").fetchone()[0]}
+
+
+def convert_auto_vacuum(conn):
+    """Switches a file created without incremental auto_vacuum over with one full VACUUM.
+
+    The VACUUM rewrites the whole file and holds the write lock until it is
+    done, so this is an explicit operator step rather than a scheduled task.
+    """
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if mode == 2:
+        raise MaintenanceSkipped("skipped", {"reason": "auto_vacuum is already incremental"})
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    return {
+        "converted_from": AUTO_VACUUM_MODES.get(mode, mode),
+        "freed_pages": page_count - conn.execute("PRAGMA page_count").fetchone()[0],
+    }
+
+
+def scheduled_backup(conn):
+    """Writes a compressed backup of the database (see backup.py)."""
+    try:
+        info = create_backup()
+    except BackupInProgress:
+        raise MaintenanceSkipped("busy", {"reason": "another backup is running"})
+    return {"name": info["name"], "size_bytes": info["size_bytes"]}
+
+
+# Run order when several tasks are due: the checkpoint follows the vacuum so it
+# also truncates the WAL the vacuum wrote, and the backup copies the compacted file
+MAINTENANCE_TASKS = {
+    "analyze": analyze,
+    "vacuum": vacuum,
+    "checkpoint": checkpoint,
+    "backup": scheduled_backup,
+}
+
+
+def database_file_stats(conn=None):
+    """Returns the size of the database and WAL files and the page statistics."""
+    wal_path = f"{DATABASE}-wal"
+    stats = {
+        "database_bytes": os.path.getsize(DATABASE) if os.path.exists(DATABASE) else 0,
+        "wal_bytes": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+    }
+    DB_FILE_SIZE.set(stats["database_bytes"], ("database",))
+    DB_FILE_SIZE.set(stats["wal_bytes"], ("wal",))
+    if conn is not None:
+        for pragma in ("page_size", "page_count", "freelist_count", "journal_mode"):
+            stats[pragma] = conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        stats["auto_vacuum"] = AUTO_VACUUM_MODES.get(mode, mode)
+    return stats
+
+
+def record_run(conn, task, started_at, duration, outcome, details):
+    conn.execute(
+        """
+        INSERT INTO maintenance_runs (task, started_at, duration_ms, outcome, details)
+        VALUES (?, ?, ?, ?, ?)
+    """,
+        (task, started_at, round(duration * 1000, 3), outcome, json.dumps(details)),
+    )
+    conn.execute(
+        "DELETE FROM maintenance_runs WHERE id <= (SELECT MAX(id) FROM maintenance_runs) - ?",
+        (MAINTENANCE_HISTORY_SIZE,),
+    )
+
+
+def run_task(conn, name, logger, task=None):
+    """Runs one maintenance task on an autocommit connection and records the outcome.
+
+    ``task`` runs in place of the scheduled task ``name``, which it is recorded as.
+    """
+    started_at = time.time()
+    start = time.perf_counter()
+    try:
+        details = (task or MAINTENANCE_TASKS[name])(conn)
+        outcome = "ok"
+    except MaintenanceSkipped as e:
+        details, outcome = e.details, e.outcome
+    except sqlite3.OperationalError as e:
+        # "database is locked": a writer showed up; the task is retried when next idle
+        details, outcome = {"error": str(e)}, "busy" if "locked" in str(e) else "error"
+    except (sqlite3.Error, BackupError, OSError) as e:
+        details, outcome = {"error": str(e)}, "error"
+    duration = time.perf_counter() - start
+
+    MAINTENANCE_RUNS.inc((name, outcome))
+    MAINTENANCE_DURATION.observe(duration, (name,))
+    logger.log(
+        logging.ERROR if outcome == "error" else logging.INFO,
+        "Maintenance task '%s' finished in %.3fs: %s %s",
+        name,
+        duration,
+        outcome,
+        details,
+    )
+    try:
+        record_run(conn, name, started_at, duration, outcome, details)
+    except sqlite3.Error as e:
+        logger.warning("Could not record maintenance run of '%s': %s", name, e)
+    return outcome
+
+
+class MaintenanceScheduler:
+    """Runs the maintenance tasks on their intervals while the server is idle.
+
+    The server counts as idle when this process has had no request in flight
+    for MAINTENANCE_IDLE_SECONDS and no connection, in any process, has written
+    to the database in that time (noticed through ``PRAGMA data_version``).
+    Reads served by other worker processes are not visible here.
+    """
+
+    def __init__(self, logger):
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._last_activity = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_started = {}
+        self._analyze_requested = False
+        self.current_task = None
+
+    def request_started(self):
+        with self._lock:
+            self._in_flight += 1
+            self._last_activity = time.monotonic()
+
+    def request_finished(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._last_activity = time.monotonic()
+
+    def touch(self):
+        with self._lock:
+            self._last_activity = time.monotonic()
+
+    def idle_seconds(self):
+        with self._lock:
+            if self._in_flight:
+                return 0.0
+            return time.monotonic() - self._last_activity
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="db-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _due_tasks(self, conn, now):
+        due = []
+        for name in MAINTENANCE_TASKS:
+            interval = MAINTENANCE_INTERVALS.get(name)
+            if not interval:
+                continue
+            if now - self._last_started.get(name, 0) >= interval:
+                due.append(name)
+            elif name == "analyze" and self._analyze_requested:
+                due.append(name)
+        return due
+
+    def _run(self):
+        conn = get_db_connection()
+        conn.isolation_level = None
+        conn.execute(f"PRAGMA busy_timeout = {int(MAINTENANCE_BUSY_TIMEOUT_MS)}")
+        try:
+            self._last_started = dict(
+                conn.execute("SELECT task, MAX(started_at) FROM maintenance_runs GROUP BY task")
+            )
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            while not self._stop.wait(MAINTENANCE_POLL_INTERVAL):
+                version = conn.execute("PRAGMA data_version").fetchone()[0]
+                if version != data_version:
+                    data_version = version
+                    self.touch()
+                    # Imports and bulk deletes change row counts enough to mislead the planner
+                    if MAINTENANCE_INTERVALS.get("analyze"):
+                        self._analyze_requested = self._analyze_requested or statistics_drifted(conn)
+                database_file_stats()
+                if self.idle_seconds() < MAINTENANCE_IDLE_SECONDS:
+                    continue
+
+                for name in self._due_tasks(conn, time.time()):
+                    if self._stop.is_set() or self.idle_seconds() < MAINTENANCE_IDLE_SECONDS:
+                        break
+                    self.current_task = name
+                    try:
+                        outcome = run_task(conn, name, self.logger)
+                    finally:
+                        self.current_task = None
+                    if outcome != "busy":
+                        self._last_started[name] = time.time()
+                    if name == "analyze" and outcome == "ok":
+                        self._analyze_requested = False
+                # The task's own writes are not activity
+                data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        except Exception as e:
+            self.logger.error("Maintenance scheduler stopped: %s", e, exc_info=True)
+        finally:
+            conn.close()
+
+
+_scheduler = None
+
+
+def maintenance_status():
+    """Returns the schedule, the last run of each task and the file statistics."""
+    now = time.time()
+    conn = get_db_connection()
+    try:
+        last_runs = {
+            row["task"]: row
+            for row in conn.execute(
+                """
+                SELECT task, started_at, duration_ms, outcome, details
+                FROM maintenance_runs
+                WHERE id IN (SELECT MAX(id) FROM maintenance_runs GROUP BY task)
+            """
+            )
+        }
+        files = database_file_stats(conn)
+    finally:
+        conn.close()
+
+    tasks = {}
+    for name in MAINTENANCE_TASKS:
+        interval = MAINTENANCE_INTERVALS.get(name) or 0
+        last = last_runs.get(name)
+        tasks[name] = {
+            "interval_seconds": interval,
+            "last_run": (
+                dict(last, details=json.loads(last["details"] or "{}")) if last else None
+            ),
+            "next_due_in_seconds": (
+                max(0, round(last["started_at"] + interval - now) if last else 0)
+                if interval
+                else None
+            ),
+        }
+    scheduler = None
+    if _scheduler is not None:
+        scheduler = {
+            "idle_seconds": round(_scheduler.idle_seconds(), 1),
+            "idle_threshold_seconds": MAINTENANCE_IDLE_SECONDS,
+            "current_task": _scheduler.current_task,
+        }
+    return {"scheduler": scheduler, "tasks": tasks, "files": files}
+
+
+def maintenance_history(limit=50):
+    """Returns the most recent maintenance runs, newest first."""
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(
+            """
+            SELECT id, task, started_at, duration_ms, outcome, details
+            FROM maintenance_runs ORDER BY id DESC LIMIT ?
+        """,
+            (limit,),
+        ).fetchall()
+    finally:
+        conn.close()
+    return [dict(row, details=json.loads(row["details"] or "{}")) for row in rows]
+
+
+def start_maintenance_scheduler(app):
+    """Starts the database maintenance thread and the hooks that track idle time."""
+    global _scheduler
+    _scheduler = MaintenanceScheduler(app.logger)
+
+    @app.before_request
+    def track_request_start():
+        g.maintenance_tracked = True
+        _scheduler.request_started()
+
+    @app.teardown_request
+    def track_request_end(exc):
+        # Requests turned away by an earlier hook were never counted
+        if g.pop("maintenance_tracked", False):
+            _scheduler.request_finished()
+
+    _scheduler.start()
+    return _scheduler
+
+
+def _run_migrations():
+    # The conversion is recorded in maintenance_runs, which older files may not have yet
+    from flask import Flask
+    from database import init_db
+
+    with Flask("phonedash").app_context():
+        init_db()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run one-off database maintenance.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser(
+        "convert-vacuum",
+        help="Rebuild the database file with incremental auto_vacuum (full VACUUM; stop the server first)",
+    )
+    parser.parse_args(argv)
+    setup_logging()
+    _run_migrations()
+
+    conn = get_db_connection()
+    conn.isolation_level = None
+    conn.execute(f"PRAGMA busy_timeout = {int(MAINTENANCE_BUSY_TIMEOUT_MS)}")
+    try:
+        # Recorded as a vacuum run, so GET /api/admin/maintenance shows the conversion
+        outcome = run_task(conn, "vacuum", logger, task=convert_auto_vacuum)
+    finally:
+        conn.close()
+    return 0 if outcome in ("ok", "skipped") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Upper bounds (bytes) of the response size histogram buckets
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Base class for metrics keyed by a tuple of label values."""
+
+    kind = ""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """A monotonically increasing value."""
+
+    kind = "counter"
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, labels)} {value}"
+            for labels, value in items
+        ]
+
+
+class Gauge(Counter):
+    """A value that can go up and down."""
+
+    kind = "gauge"
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+    def set(self, value, labels=()):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """Counts observations into cumulative buckets, Prometheus style."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labels=()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = [(labels, (list(s[0]), s[1], s[2])) for labels, s in self._values.items()]
+        lines = self.header()
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}"
+                )
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, label_names=()):
+        return self.register(Counter(name, help_text, label_names))
+
+    def gauge(self, name, help_text, label_names=()):
+        return self.register(Gauge(name, help_text, label_names))
+
+    def histogram(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, label_names, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_LABELS = ("blueprint", "route", "method")
+
+REQUESTS_TOTAL = REGISTRY.counter(
+    "phonedash_http_requests_total",
+    "Total HTTP requests.",
+    REQUEST_LABELS + ("status",),
+)
+REQUEST_LATENCY = REGISTRY.histogram(
+    "phonedash_http_request_duration_seconds",
+    "HTTP request latency in seconds.",
+    REQUEST_LABELS,
+)
+RESPONSE_SIZE = REGISTRY.histogram(
+    "phonedash_http_response_size_bytes",
+    "HTTP response body size in bytes.",
+    REQUEST_LABELS,
+    buckets=SIZE_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "phonedash_http_requests_in_flight",
+    "HTTP requests currently being served.",
+)
+REQUEST_SQL_TIME = REGISTRY.histogram(
+    "phonedash_http_request_sql_seconds",
+    "Time each HTTP request spent executing SQL, in seconds.",
+    REQUEST_LABELS,
+)
+DB_CONNECT_TIME = REGISTRY.histogram(
+    "phonedash_db_connect_seconds",
+    "Time spent waiting to open a database connection, in seconds.",
+)
+SQL_TIME_TOTAL = REGISTRY.counter(
+    "phonedash_db_sql_seconds_total",
+    "Total time spent executing SQL statements, in seconds.",
+)
+SQL_STATEMENTS_TOTAL = REGISTRY.counter(
+    "phonedash_db_statements_total",
+    "Total SQL statements executed.",
+)
+
+
+def record_sql_time(elapsed, statements=1):
+    """Adds SQL execution time to the global totals and the current request."""
+    SQL_TIME_TOTAL.inc(amount=elapsed)
+    if statements:
+        SQL_STATEMENTS_TOTAL.inc(amount=statements)
+    if has_request_context():
+        g.sql_seconds = g.get("sql_seconds", 0.0) + elapsed
+
+
+def _request_labels():
+    rule = request.url_rule.rule if request.url_rule else "unmatched"
+    return (request.blueprint or "app", rule, request.method)
+
+
+def init_metrics(app):
+    """Registers the request hooks that feed the HTTP metrics."""
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+        g.sql_seconds = 0.0
+        REQUESTS_IN_FLIGHT.inc()
+
+    @app.after_request
+    def record_request_metrics(response):
+        start = g.get("request_start")
+        if start is not None:
+            labels = _request_labels()
+            REQUESTS_TOTAL.inc(labels + (str(response.status_code),))
+            REQUEST_LATENCY.observe(time.perf_counter() - start, labels)
+            RESPONSE_SIZE.observe(response.content_length or 0, labels)
+            REQUEST_SQL_TIME.observe(g.get("sql_seconds", 0.0), labels)
+        return response
+
+    @app.teardown_request
+    def finish_request(exc):
+        if g.pop("request_start", None) is not None:
+            REQUESTS_IN_FLIGHT.dec()
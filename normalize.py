@@ -0,0 +1,121 @@
+import json
+import re
+import unicodedata
+
+# Persian and Arabic-Indic digits mapped to ASCII
+_DIGIT_TRANSLATION = str.maketrans("۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩", "01234567890123456789")
+
+# Arabic letter variants commonly typed instead of their Persian forms
+_LETTER_TRANSLATION = str.maketrans(
+    {
+        "ي": "ی",
+        "ى": "ی",
+        "ك": "ک",
+        "ة": "ه",
+        "ۀ": "ه",
+        "أ": "ا",
+        "إ": "ا",
+        "آ": "ا",
+        "\u200c": " ",  # zero-width non-joiner
+        "\u200f": "",  # right-to-left mark
+        "\u200e": "",  # left-to-right mark
+        "\u0640": "",  # tatweel
+    }
+)
+
+_NON_DIGITS = re.compile(r"\D+")
+_NON_WORD = re.compile(r"[^\w]+")
+
+# Shortest digit string treated as a phone number
+MIN_PHONE_DIGITS = 7
+
+# Joins the columns of a contact in the trigram search index
+SEARCH_TEXT_SEPARATOR = "\x1f"
+
+
+def normalize_digits(value):
+    """Converts Persian/Arabic digits in a string to ASCII digits."""
+    if value is None:
+        return ""
+    return str(value).translate(_DIGIT_TRANSLATION)
+
+
+def normalize_phone(value):
+    """Normalizes a phone number to its national significant digits.
+
+    Country prefixes (+98, 0098) and the leading trunk zero are dropped so that
+    "+98 912 123 4567", "0912-123-4567" and "۰۹۱۲۱۲۳۴۵۶۷" compare equal.
+    Returns an empty string for values too short to be a phone number.
+    """
+    digits = _NON_DIGITS.sub("", normalize_digits(value))
+    if digits.startswith("0098"):
+        digits = digits[4:]
+    elif digits.startswith("98") and len(digits) == 12:
+        digits = digits[2:]
+    digits = digits.lstrip("0")
+    if len(digits) < MIN_PHONE_DIGITS:
+        return ""
+    return digits
+
+
+def normalize_email(value):
+    """Normalizes an email address for comparison."""
+    if not value:
+        return ""
+    email = str(value).strip().lower()
+    return email if "@" in email else ""
+
+
+def normalize_name(value):
+    """Normalizes a Persian or Latin name: unified letters, no diacritics, lowercase."""
+    if not value:
+        return ""
+    text = normalize_digits(value).translate(_LETTER_TRANSLATION)
+    text = "".join(
+        ch for ch in unicodedata.normalize("NFKD", text) if not unicodedata.combining(ch)
+    )
+    text = _NON_WORD.sub(" ", text.lower())
+    return " ".join(text.split())
+
+
+def name_tokens(value):
+    """Returns the sorted tokens of a normalized name."""
+    return sorted(token for token in normalize_name(value).split() if token)
+
+
+def name_words_json(value):
+    """Returns the distinct words of a normalized name as a JSON array (for SQL triggers)."""
+    return json.dumps(sorted(set(normalize_name(value).split())), ensure_ascii=False)
+
+
+def contact_identity_key(mobile_phone, email):
+    """Returns the key identifying a contact across imports, or None.
+
+    The normalized mobile phone is preferred, falling back to the normalized
+    email address.
+    """
+    phone = normalize_phone(mobile_phone)
+    if phone:
+        return f"phone:{phone}"
+    email = normalize_email(email)
+    if email:
+        return f"email:{email}"
+    return None
+
+
+def phone_digits(*values):
+    """Returns the digits of each phone number, separated by spaces (for the trigram index).
+
+    Only digit scripts and separators are normalized, so a fragment typed
+    from anywhere in the number, including the trunk zero, still matches.
+    """
+    digits = (_NON_DIGITS.sub("", normalize_digits(value)) for value in values)
+    return " ".join(value for value in digits if value)
+
+
+def search_text(*values):
+    """Joins the searched columns of a row (for the trigram index).
+
+    The separator never occurs in a search term, so a match cannot span two columns.
+    """
+    return SEARCH_TEXT_SEPARATOR.join(str(value) for value in values if value)
@@ -0,0 +1,113 @@
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import lru_cache
+
+from flask import jsonify
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from config import (
+    PASSWORD_HASH_METHOD,
+    PASSWORD_HASH_QUEUE_SIZE,
+    PASSWORD_HASH_QUEUE_TIMEOUT,
+    PASSWORD_HASH_WORKERS,
+    PASSWORD_SALT_LENGTH,
+)
+from metrics import REGISTRY
+
+PASSWORD_HASH_IN_FLIGHT = REGISTRY.gauge(
+    "phonedash_password_hash_in_flight",
+    "Password hash operations running or queued.",
+)
+PASSWORD_HASH_REJECTED = REGISTRY.counter(
+    "phonedash_password_hash_rejected_total",
+    "Password hash operations rejected because the pool was saturated.",
+    ("reason",),
+)
+PASSWORDS_REHASHED = REGISTRY.counter(
+    "phonedash_passwords_rehashed_total",
+    "Stored password hashes upgraded to the configured parameters on login.",
+)
+
+# Hashing releases the GIL, so a small thread pool runs it in parallel while its
+# size caps how much CPU a burst of logins can take from the rest of the API.
+_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+# Operations allowed to run or wait at once; beyond that requests fail fast
+_admission = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_SIZE)
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when a password operation could not start within the queue limits."""
+
+
+def password_busy_response():
+    """The 503 response returned when the password pool is saturated."""
+    retry_after = max(1, int(PASSWORD_HASH_QUEUE_TIMEOUT))
+    return (
+        jsonify({"error": "Server is busy, please try again shortly"}),
+        503,
+        {"Retry-After": str(retry_after)},
+    )
+
+
+def _run(func, *args):
+    if not _admission.acquire(blocking=False):
+        PASSWORD_HASH_REJECTED.inc(("queue_full",))
+        raise PasswordHasherBusy("Password hashing queue is full")
+    PASSWORD_HASH_IN_FLIGHT.inc()
+    try:
+        future = _executor.submit(func, *args)
+        try:
+            return future.result(timeout=PASSWORD_HASH_QUEUE_TIMEOUT)
+        except FutureTimeoutError:
+            # Still queued: give up. Already running: it finishes shortly, so wait for it.
+            if future.cancel():
+                PASSWORD_HASH_REJECTED.inc(("queue_timeout",))
+                raise PasswordHasherBusy("Timed out waiting for a password hashing worker")
+            try:
+                return future.result()
+            except CancelledError:
+                raise PasswordHasherBusy("Password hashing was cancelled")
+    finally:
+        PASSWORD_HASH_IN_FLIGHT.dec()
+        _admission.release()
+
+
+def _generate(password):
+    return generate_password_hash(
+        password, method=PASSWORD_HASH_METHOD, salt_length=PASSWORD_SALT_LENGTH
+    )
+
+
+@lru_cache(maxsize=1)
+def _configured_method():
+    # werkzeug expands short forms such as "scrypt" into their full parameters
+    return _generate("").split("$", 1)[0]
+
+
+def _verify(stored_hash, password):
+    if not check_password_hash(stored_hash, password):
+        return False, None
+    if stored_hash.split("$", 1)[0] != _configured_method():
+        return True, _generate(password)
+    return True, None
+
+
+def hash_password(password):
+    """Hashes a password in the worker pool. Raises PasswordHasherBusy when saturated."""
+    return _run(_generate, password)
+
+
+def verify_password(stored_hash, password):
+    """Checks a password in the worker pool.
+
+    Returns ``(matches, new_hash)``; ``new_hash`` is set when the stored hash
+    uses outdated parameters and should be replaced. Raises PasswordHasherBusy
+    when the pool is saturated.
+    """
+    matches, new_hash = _run(_verify, stored_hash, password)
+    if new_hash:
+        PASSWORDS_REHASHED.inc()
+    return matches, new_hash
@@ -0,0 +1,154 @@
+import cProfile
+import io
+import itertools
+import marshal
+import pstats
+import threading
+import time
+from collections import deque
+
+from flask import g, jsonify, request, session
+
+from auth import admin_required
+from config import PROFILE_HISTORY_SIZE, PROFILE_TOP_FUNCTIONS
+
+# A request is profiled when it carries this header or query flag
+PROFILE_HEADER = "X-Profile"
+PROFILE_QUERY_FLAG = "profile"
+
+_TRUE_VALUES = ("1", "true", "yes", "on")
+
+_lock = threading.Lock()
+_profiles = deque(maxlen=PROFILE_HISTORY_SIZE)
+_ids = itertools.count(1)
+
+# cProfile cannot run two profilers at once on every Python version, so only
+# one request is profiled at a time.
+_active = threading.Lock()
+
+
+def _profiling_requested():
+    flag = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY_FLAG)
+    return bool(flag) and flag.lower() in _TRUE_VALUES
+
+
+class RequestProfile:
+    """The cProfile result of one request, kept in the ring buffer."""
+
+    def __init__(self, profile, started, status):
+        profile.create_stats()
+        self.id = next(_ids)
+        self.method = request.method
+        self.path = request.full_path.rstrip("?")
+        self.route = request.url_rule.rule if request.url_rule else None
+        self.username = session.get("username")
+        self.status = status
+        self.created_at = time.time()
+        self.duration_ms = round((time.perf_counter() - started) * 1000, 3)
+        self.sql_ms = round(g.get("sql_seconds", 0.0) * 1000, 3)
+        # Writes run on the write coordinator's thread, which cProfile does not see
+        self.writer_ms = round(g.get("write_seconds", 0.0) * 1000, 3)
+        # Same format as pstats' dump_stats, so the download opens in snakeviz etc.
+        self.stats = marshal.dumps(profile.stats)
+        self.summary = _summarize(profile)
+        if self.writer_ms:
+            self.summary = (
+                f"{self.writer_ms} ms of this request ran on the db-writer thread and is not "
+                "in this profile; the request thread shows it as waiting.\n\n" + self.summary
+            )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "username": self.username,
+            "status": self.status,
+            "created_at": self.created_at,
+            "duration_ms": self.duration_ms,
+            "sql_ms": self.sql_ms,
+            "writer_ms": self.writer_ms,
+        }
+
+
+def _summarize(profile):
+    stream = io.StringIO()
+    stats = pstats.Stats(profile, stream=stream)
+    stats.sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+    return stream.getvalue()
+
+
+def _finish(status):
+    """Stops the running profile of this request and stores it. Returns it or None."""
+    profile = g.pop("profiler", None)
+    if profile is None:
+        return None
+    profile.disable()
+    try:
+        result = RequestProfile(profile, g.pop("profile_start"), status)
+        with _lock:
+            _profiles.append(result)
+        return result
+    finally:
+        _active.release()
+
+
+def list_profiles():
+    """Returns the metadata of the kept profiles, newest first."""
+    with _lock:
+        return [p.to_dict() for p in reversed(_profiles)]
+
+
+def get_profile(profile_id):
+    """Returns the kept profile with the given id, or None if it was evicted."""
+    with _lock:
+        for profile in _profiles:
+            if profile.id == profile_id:
+                return profile
+    return None
+
+
+def clear_profiles():
+    with _lock:
+        _profiles.clear()
+
+
+def init_profiler(app):
+    """Registers the hooks that profile requests flagged by an admin."""
+
+    @app.before_request
+    def start_profiler():
+        if not _profiling_requested():
+            return None
+        # Profiling exposes code paths and timings, so only admins may ask for it
+        denied = admin_required(lambda: None)()
+        if denied is not None:
+            return denied
+        if not _active.acquire(blocking=False):
+            app.logger.warning("Profiling refused: another request is being profiled.")
+            return jsonify({"error": "Another request is already being profiled"}), 409
+        g.profile_start = time.perf_counter()
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+        return None
+
+    @app.after_request
+    def stop_profiler(response):
+        result = _finish(response.status_code)
+        if result is not None:
+            response.headers["X-Profile-Id"] = str(result.id)
+            response.headers["X-Profile-Url"] = f"/api/admin/profiles/{result.id}"
+            app.logger.info(
+                "Profiled %s %s in %s ms (profile %s).",
+                result.method,
+                result.path,
+                result.duration_ms,
+                result.id,
+            )
+        return response
+
+    @app.teardown_request
+    def discard_profiler(exc):
+        # Only reached with a running profiler when the request failed before after_request
+        _finish(500)
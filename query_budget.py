@@ -0,0 +1,96 @@
+import time
+
+from flask import g, has_request_context, jsonify, request
+
+from admission import classify_request
+from config import QUERY_BUDGET_CHECK_INTERVAL, QUERY_TIME_BUDGETS
+from metrics import REGISTRY, REQUEST_LABELS
+
+QUERY_BUDGET_EXCEEDED = REGISTRY.counter(
+    "phonedash_query_budget_exceeded_total",
+    "Requests whose SQL was aborted for exceeding the query time budget.",
+    REQUEST_LABELS,
+)
+
+
+class QueryBudget:
+    """The SQL deadline of one request."""
+
+    __slots__ = ("seconds", "deadline", "exceeded")
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds
+        self.exceeded = False
+
+
+def budget_seconds(endpoint, lane):
+    """Returns the query budget of an endpoint: its override, else its admission lane's.
+
+    A budget of 0 or None means unlimited.
+    """
+    if endpoint in QUERY_TIME_BUDGETS:
+        return QUERY_TIME_BUDGETS[endpoint]
+    return QUERY_TIME_BUDGETS.get(lane)
+
+
+def current_query_budget():
+    """Returns the current request's QueryBudget, or None outside a budgeted request."""
+    return g.get("query_budget") if has_request_context() else None
+
+
+def install_query_budget(conn, budget=None):
+    """Aborts statements on ``conn`` once ``budget`` (by default the current request's) is spent.
+
+    SQLite calls the handler every QUERY_BUDGET_CHECK_INTERVAL virtual machine
+    instructions; a non-zero return interrupts the running statement, which
+    then raises sqlite3.OperationalError. The writer thread passes the budget
+    of the request whose write it is applying.
+    """
+    budget = budget or current_query_budget()
+    if budget is None:
+        return
+
+    def check_budget():
+        if time.monotonic() > budget.deadline:
+            budget.exceeded = True
+            return 1
+        return 0
+
+    conn.set_progress_handler(check_budget, QUERY_BUDGET_CHECK_INTERVAL)
+
+
+def init_query_budgets(app):
+    """Registers the hooks that set each request's SQL deadline and report overruns."""
+
+    @app.before_request
+    def start_query_budget():
+        seconds = budget_seconds(request.endpoint, classify_request())
+        if seconds:
+            g.query_budget = QueryBudget(seconds)
+
+    @app.after_request
+    def report_query_budget(response):
+        budget = g.get("query_budget")
+        if budget is None or not budget.exceeded:
+            return response
+        labels = (
+            request.blueprint or "app",
+            request.url_rule.rule if request.url_rule else "unmatched",
+            request.method,
+        )
+        QUERY_BUDGET_EXCEEDED.inc(labels)
+        app.logger.warning(
+            "Query budget of %ss exceeded: %s %s", budget.seconds, request.method, request.full_path
+        )
+        # Replaces whatever error the handler produced from the interrupted statement
+        response = jsonify(
+            {
+                "error": "Query too expensive",
+                "code": "query_too_expensive",
+                "budget_ms": int(budget.seconds * 1000),
+                "hint": "Narrow the search term or request a smaller page.",
+            }
+        )
+        response.status_code = 422
+        return response
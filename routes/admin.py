@@ -0,0 +1,233 @@
+import os
+import threading
+
+from flask import Blueprint, Response, request, jsonify, current_app, send_file
+from audit import query_audit_log
+from auth import admin_required
+from backup import (
+    BackupInProgress,
+    backup_path,
+    backup_progress,
+    create_backup,
+    list_backups,
+    read_checksum,
+)
+from maintenance import maintenance_history, maintenance_status
+from metrics import REGISTRY
+from profiler import clear_profiles, get_profile, list_profiles
+from snapshot import get_read_connection, read_snapshot_status
+from sqltrace import query_stats, reset_query_stats
+from startup import startup_report
+
+admin_routes = Blueprint("admin_routes", __name__)
+
+
+@admin_routes.route("/metrics", methods=["GET"])
+@admin_required
+def get_metrics():
+    """Exposes request and database metrics in the Prometheus text format (admin only)."""
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+@admin_routes.route("/admin/queries", methods=["GET"])
+@admin_required
+def get_query_stats():
+    """Lists SQL statement shapes aggregated by total time, with slow-query plans (admin only)."""
+    try:
+        limit = int(request.args.get("limit", 50))
+        order_by = request.args.get("order_by", "total")
+        current_app.logger.info("Fetched SQL query statistics.")
+        return jsonify(query_stats(limit=limit, order_by=order_by)), 200
+    except Exception as e:
+        current_app.logger.error(
+            "Error fetching query statistics: %s", e, exc_info=True
+        )
+        return jsonify({"error": str(e)}), 500
+
+
+@admin_routes.route("/admin/queries/reset", methods=["POST"])
+@admin_required
+def reset_query_statistics():
+    """Clears the aggregated SQL statement statistics (admin only)."""
+    reset_query_stats()
+    current_app.logger.info("SQL query statistics reset.")
+    return jsonify({"message": "Query statistics reset"}), 200
+
+
+@admin_routes.route("/admin/profiles", methods=["GET"])
+@admin_required
+def get_profiles():
+    """Lists the most recent request profiles, newest first (admin only)."""
+    profiles = list_profiles()
+    current_app.logger.info("Fetched %s request profiles.", len(profiles))
+    return jsonify({"profiles": profiles}), 200
+
+
+@admin_routes.route("/admin/profiles/<int:profile_id>", methods=["GET"])
+@admin_required
+def get_request_profile(profile_id):
+    """Returns one request profile with its text summary (admin only)."""
+    profile = get_profile(profile_id)
+    if profile is None:
+        current_app.logger.warning("Profile %s not found.", profile_id)
+        return jsonify({"error": "Profile not found"}), 404
+    return jsonify(dict(profile.to_dict(), summary=profile.summary)), 200
+
+
+@admin_routes.route("/admin/profiles/<int:profile_id>/download", methods=["GET"])
+@admin_required
+def download_request_profile(profile_id):
+    """Downloads a request profile as a pstats file, or as text with ?format=text (admin only)."""
+    profile = get_profile(profile_id)
+    if profile is None:
+        current_app.logger.warning("Profile %s not found.", profile_id)
+        return jsonify({"error": "Profile not found"}), 404
+
+    if request.args.get("format") == "text":
+        body, mimetype, extension = profile.summary, "text/plain; charset=utf-8", "txt"
+    else:
+        body, mimetype, extension = profile.stats, "application/octet-stream", "prof"
+    return Response(
+        body,
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f"attachment; filename=profile-{profile.id}.{extension}"
+        },
+    )
+
+
+@admin_routes.route("/admin/profiles/reset", methods=["POST"])
+@admin_required
+def reset_profiles():
+    """Discards every kept request profile (admin only)."""
+    clear_profiles()
+    current_app.logger.info("Request profiles cleared.")
+    return jsonify({"message": "Profiles cleared"}), 200
+
+
+@admin_routes.route("/admin/snapshot", methods=["GET"])
+@admin_required
+def get_snapshot_status():
+    """Reports whether reads are served from the in-memory snapshot and how fresh it is (admin only)."""
+    return jsonify(read_snapshot_status()), 200
+
+
+@admin_routes.route("/admin/startup", methods=["GET"])
+@admin_required
+def get_startup_report():
+    """Reports how long this worker process took to start and to serve its first request (admin only)."""
+    return jsonify(startup_report()), 200
+
+
+@admin_routes.route("/admin/maintenance", methods=["GET"])
+@admin_required
+def get_maintenance_status():
+    """Reports the maintenance schedule, each task's last run and the database file sizes (admin only)."""
+    try:
+        return jsonify(maintenance_status()), 200
+    except Exception as e:
+        current_app.logger.error(
+            "Error fetching maintenance status: %s", e, exc_info=True
+        )
+        return jsonify({"error": str(e)}), 500
+
+
+@admin_routes.route("/admin/maintenance/runs", methods=["GET"])
+@admin_required
+def get_maintenance_runs():
+    """Lists the most recent database maintenance runs, newest first (admin only)."""
+    try:
+        limit = int(request.args.get("limit", 50))
+        return jsonify({"runs": maintenance_history(limit=limit)}), 200
+    except Exception as e:
+        current_app.logger.error(
+            "Error fetching maintenance runs: %s", e, exc_info=True
+        )
+        return jsonify({"error": str(e)}), 500
+
+
+@admin_routes.route("/admin/backups", methods=["GET"])
+@admin_required
+def get_backups():
+    """Lists the kept database backups, newest first, and the running backup if any (admin only)."""
+    try:
+        return jsonify({"backups": list_backups(), "running": backup_progress()}), 200
+    except Exception as e:
+        current_app.logger.error("Error listing backups: %s", e, exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+
+@admin_routes.route("/admin/backups", methods=["POST"])
+@admin_required
+def start_backup():
+    """Starts an online backup of the database in the background (admin only)."""
+    if backup_progress() is not None:
+        return jsonify({"error": "A backup is already running", "running": backup_progress()}), 409
+
+    logger = current_app.logger
+
+    def run_backup():
+        try:
+            create_backup()
+        except BackupInProgress:
+            logger.warning("Backup not started: another backup is running.")
+        except Exception as e:
+            logger.error("Backup failed: %s", e, exc_info=True)
+
+    threading.Thread(target=run_backup, name="backup", daemon=True).start()
+    current_app.logger.info("Database backup started.")
+    return jsonify({"message": "Backup started"}), 202
+
+
+@admin_routes.route("/admin/backups/<name>/download", methods=["GET"])
+@admin_required
+def download_backup(name):
+    """Streams a backup file, with its SHA-256 checksum in a header (admin only)."""
+    path = backup_path(name)
+    if path is None:
+        current_app.logger.warning("Backup %s not found.", name)
+        return jsonify({"error": "Backup not found"}), 404
+    response = send_file(
+        os.path.abspath(path), mimetype="application/gzip", as_attachment=True, download_name=name
+    )
+    checksum = read_checksum(path)
+    if checksum:
+        response.headers["X-Checksum-SHA256"] = checksum
+    current_app.logger.info("Backup %s downloaded.", name)
+    return response
+
+
+AUDIT_PAGE_SIZE = 50
+MAX_AUDIT_PAGE_SIZE = 500
+
+
+@admin_routes.route("/admin/audit", methods=["GET"])
+@admin_required
+def get_audit_log():
+    """Lists audit records newest first, filtered and paginated by a record id cursor (admin only).
+
+    Filters: entity (contact, company, user), entity_id, user_id, action
+    (create, update, delete, import) and since/until as Unix timestamps.
+    """
+    filters = {
+        "entity": request.args.get("entity"),
+        "entity_id": request.args.get("entity_id", type=int),
+        "user_id": request.args.get("user_id", type=int),
+        "action": request.args.get("action"),
+        "since": request.args.get("since", type=float),
+        "until": request.args.get("until", type=float),
+    }
+    before_id = request.args.get("cursor", type=int)
+    limit = request.args.get("limit", AUDIT_PAGE_SIZE, type=int)
+    limit = min(max(limit, 1), MAX_AUDIT_PAGE_SIZE)
+
+    conn = get_read_connection()
+    try:
+        entries, next_cursor = query_audit_log(conn.cursor(), filters, before_id, limit)
+        current_app.logger.info("Fetched %s audit records.", len(entries))
+        return jsonify({"entries": entries, "next_cursor": next_cursor, "limit": limit}), 200
+    except Exception as e:
+        current_app.logger.error("Error fetching audit log: %s", e, exc_info=True)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        conn.close()
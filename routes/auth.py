@@ -1,7 +1,13 @@
 from flask import Blueprint, request, jsonify, session, current_app
-from werkzeug.security import generate_password_hash, check_password_hash
+from audit import record_change
 from auth import login_required
 from database import get_db_connection
+from passwords import (
+    PasswordHasherBusy,
+    hash_password,
+    password_busy_response,
+    verify_password,
+)
 
 auth_routes = Blueprint("auth_routes", __name__)
 
@@ -9,6 +15,7 @@ auth_routes = Blueprint("auth_routes", __name__)
 @auth_routes.route("/register", methods=["POST"])
 def register():
     """Handles user registration."""
+    conn = None
     try:
         data = request.get_json()
         username = data.get("username")
@@ -28,30 +35,39 @@ def register():
         cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
         if cursor.fetchone():
             current_app.logger.warning(
-                f"Registration failed: Username '{username}' already exists."
+                "Registration failed: Username '%s' already exists.", username
             )
             return jsonify({"error": "Username already exists"}), 409
 
         # Hash the password
-        password_hash = generate_password_hash(password)
+        password_hash = hash_password(password)
 
         cursor.execute(
-            "INSERT INTO users (username, password, is_admin) VALUES (?, ?, ?)",
+            "INSERT INTO users (username, password, is_admin) VALUES (?, ?, ?) "
+            "RETURNING id, username, is_admin",
             (username, password_hash, 1 if role == "admin" else 0),
         )
+        created = cursor.fetchone()
         conn.commit()
-        conn.close()
+        record_change("user", "create", created["id"], after=created)
 
-        current_app.logger.info(f"User '{username}' registered successfully.")
+        current_app.logger.info("User '%s' registered successfully.", username)
         return jsonify({"message": "Registration successful"}), 201
+    except PasswordHasherBusy as e:
+        current_app.logger.warning("Registration rejected: %s", e)
+        return password_busy_response()
     except Exception as e:
-        current_app.logger.error(f"Error during registration: {e}", exc_info=True)
+        current_app.logger.error("Error during registration: %s", e, exc_info=True)
         return jsonify({"error": str(e)}), 500
+    finally:
+        if conn is not None:
+            conn.close()
 
 
 @auth_routes.route("/login", methods=["POST"])
 def login():
     """Handles user login."""
+    conn = None
     try:
         data = request.get_json()
         username = data.get("username")
@@ -66,29 +82,47 @@ def login():
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute(
-            "SELECT id, username, password, is_admin FROM users WHERE username = ?",
+            "SELECT id, username, password, is_admin, auth_version FROM users WHERE username = ?",
             (username,),
         )
         user = cursor.fetchone()
-        conn.close()
 
-        if user and check_password_hash(user["password"], password):
+        matches, new_hash = (
+            verify_password(user["password"], password) if user else (False, None)
+        )
+        if new_hash:
+            # Upgrade the stored hash to the configured parameters, unless it changed meanwhile
+            cursor.execute(
+                "UPDATE users SET password = ? WHERE id = ? AND password = ?",
+                (new_hash, user["id"], user["password"]),
+            )
+            conn.commit()
+            current_app.logger.info("Rehashed password for user '%s'.", username)
+
+        if matches:
             session["user_id"] = user["id"]
             session["username"] = user["username"]
             session["role"] = "admin" if user["is_admin"] else "normal"
-            current_app.logger.info(f"User '{username}' logged in successfully.")
+            session["auth_version"] = user["auth_version"]
+            current_app.logger.info("User '%s' logged in successfully.", username)
             return (
                 jsonify({"message": "Login successful", "role": session["role"]}),
                 200,
             )
         else:
             current_app.logger.warning(
-                f"Login failed: Invalid credentials for username '{username}'."
+                "Login failed: Invalid credentials for username '%s'.", username
             )
             return jsonify({"error": "Invalid credentials"}), 401
+    except PasswordHasherBusy as e:
+        current_app.logger.warning("Login rejected: %s", e)
+        return password_busy_response()
     except Exception as e:
-        current_app.logger.error(f"Error during login: {e}", exc_info=True)
+        current_app.logger.error("Error during login: %s", e, exc_info=True)
         return jsonify({"error": str(e)}), 500
+    finally:
+        if conn is not None:
+            conn.close()
 
 
 @auth_routes.route("/logout", methods=["GET"])
@@ -98,10 +132,10 @@ def logout():
     try:
         username = session.get("username")
         session.clear()
-        current_app.logger.info(f"User '{username}' logged out successfully.")
+        current_app.logger.info("User '%s' logged out successfully.", username)
         return jsonify({"message": "Logout successful"}), 200
     except Exception as e:
-        current_app.logger.error(f"Error during logout: {e}", exc_info=True)
+        current_app.logger.error("Error during logout: %s", e, exc_info=True)
         return jsonify({"error": str(e)}), 500
 
 
@@ -117,5 +151,5 @@ def get_users_count():
         current_app.logger.info("Fetched users count.")
         return jsonify({"count": result["count"]}), 200
     except Exception as e:
-        current_app.logger.error(f"Error fetching users count: {e}", exc_info=True)
+        current_app.logger.error("Error fetching users count: %s", e, exc_info=True)
         return jsonify({"error": str(e)}), 500
@@ -1,18 +1,181 @@
 from flask import Blueprint, request, jsonify, current_app
+from audit import record_change
 from auth import login_required
-from database import get_db_connection
+from normalize import normalize_name
+from serialization import encode_rows, row_encoder, rows_response
+from snapshot import get_read_connection
+from writer import WriteQueueTimeout, run_write, write_busy_response
+import base64
+import json
 import sqlite3
 
 companies_routes = Blueprint("companies_routes", __name__)
 
+# Sortable columns and the expression each one is ordered by. Company names sort
+# by their normalized form so Arabic and Persian letter variants sort together.
+COMPANY_SORT_KEYS = {
+    "id": "id",
+    "company_name": "name_key",
+    "sub_company1": "COALESCE(sub_company1, '')",
+    "sub_company2": "COALESCE(sub_company2, '')",
+}
+COMPANY_PAGE_SIZE = 100
+MAX_COMPANY_PAGE_SIZE = 500
+# Query parameters that select the paginated form of GET /api/companies
+COMPANY_LIST_PARAMS = ("q", "limit", "cursor", "sort_by", "sort_direction", "fields")
+
+# Upper bound of a prefix range: sorts after every string starting with the prefix
+_PREFIX_END = "\U0010ffff"
+
+# Companies examined at most when resolving one company's hierarchy
+MAX_FAMILY_SIZE = 500
+
+
+def encode_cursor(sort_value, company_id):
+    """Encodes the keyset position after a row as an opaque URL-safe token."""
+    raw = json.dumps([sort_value, company_id], ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Decodes a cursor token into ``(sort_value, id)``. Raises ValueError if invalid."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        sort_value, company_id = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    # Both are bound as SQL parameters in the keyset query
+    if not isinstance(company_id, int) or isinstance(company_id, bool):
+        raise ValueError("Invalid cursor")
+    if sort_value is not None and (
+        not isinstance(sort_value, (str, int, float)) or isinstance(sort_value, bool)
+    ):
+        raise ValueError("Invalid cursor")
+    return sort_value, company_id
+
+
+def build_company_search(term):
+    """Builds the WHERE conditions matching companies whose name words start with the term's words.
+
+    Each word of the normalized term must be a prefix of some word of the
+    normalized company name, which makes every word an index range scan.
+    """
+    conditions, params = [], []
+    for word in normalize_name(term).split():
+        conditions.append(
+            "id IN (SELECT company_id FROM company_name_words WHERE word >= ? AND word < ?)"
+        )
+        params.extend([word, word + _PREFIX_END])
+    return conditions, params
+
+
+def list_companies_page(cursor, args):
+    """Runs the paginated companies query described by the request arguments.
+
+    Returns ``(rows_json, next_cursor, limit)``. Raises ValueError on invalid arguments.
+    """
+    limit = min(max(int(args.get("limit", COMPANY_PAGE_SIZE)), 1), MAX_COMPANY_PAGE_SIZE)
+    sort_by = args.get("sort_by", "").strip() or "id"
+    if sort_by not in COMPANY_SORT_KEYS:
+        raise ValueError(f"Invalid sort_by. Use one of: {', '.join(COMPANY_SORT_KEYS)}")
+    descending = args.get("sort_direction", "asc").strip().lower() == "desc"
+    fields = args.get("fields", "").strip()
+    if fields not in ("", "names"):
+        raise ValueError("Invalid fields. Use 'names' for id and name only")
+
+    sort_key = COMPANY_SORT_KEYS[sort_by]
+    conditions, params = build_company_search(args.get("q", ""))
+
+    token = args.get("cursor")
+    if token:
+        after_value, after_id = decode_cursor(token)
+        comparison = "<" if descending else ">"
+        if sort_key == "id":
+            conditions.append(f"id {comparison} ?")
+            params.append(after_id)
+        else:
+            conditions.append(
+                f"({sort_key} {comparison} ? OR ({sort_key} = ? AND id {comparison} ?))"
+            )
+            params.extend([after_value, after_value, after_id])
+
+    direction = "DESC" if descending else "ASC"
+    columns = "id, company_name" if fields == "names" else "id, company_name, sub_company1, sub_company2"
+    where_clause = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    order_clause = f" ORDER BY {sort_key} {direction}"
+    if sort_key != "id":
+        order_clause += f", id {direction}"
+    # The sort key is selected too so the next cursor can be built from the last row
+    cursor.execute(
+        f"SELECT {columns}, {sort_key} AS sort_key FROM companies{where_clause}{order_clause} LIMIT ?",
+        params + [limit + 1],
+    )
+    rows = cursor.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["sort_key"], rows[-1]["id"])
+    # Encoded without the trailing sort_key column
+    encoder = row_encoder(tuple(column[0] for column in cursor.description[:-1]))
+    return encoder.encode([tuple(row)[:-1] for row in rows]), next_cursor, limit
+
+
+# Write operations, run by the write coordinator (see writer.py). The duplicate name
+# checks run in the same transaction as the write they guard.
+
+
+def _insert_company(cursor, company_name, sub_company1, sub_company2):
+    """Returns the new company's row, or None if the name is already taken."""
+    cursor.execute("SELECT id FROM companies WHERE company_name = ?", (company_name,))
+    if cursor.fetchone():
+        return None
+    cursor.execute(
+        "INSERT INTO companies (company_name, sub_company1, sub_company2) VALUES (?, ?, ?) "
+        "RETURNING id, company_name, sub_company1, sub_company2",
+        (company_name, sub_company1, sub_company2),
+    )
+    return cursor.fetchone()
+
+
+def _update_company(cursor, company_id, company_name, sub_company1, sub_company2):
+    """Returns ``(outcome, before, after)``; outcome is updated, not_found or name_taken."""
+    # The current row is kept for the audit trail
+    cursor.execute(
+        "SELECT id, company_name, sub_company1, sub_company2 FROM companies WHERE id = ?",
+        (company_id,),
+    )
+    before = cursor.fetchone()
+    if not before:
+        return "not_found", None, None
+
+    cursor.execute(
+        "SELECT id FROM companies WHERE company_name = ? AND id != ?",
+        (company_name, company_id),
+    )
+    if cursor.fetchone():
+        return "name_taken", before, None
+
+    cursor.execute(
+        "UPDATE companies SET company_name = ?, sub_company1 = ?, sub_company2 = ? WHERE id = ? "
+        "RETURNING id, company_name, sub_company1, sub_company2",
+        (company_name, sub_company1, sub_company2, company_id),
+    )
+    return "updated", before, cursor.fetchone()
+
+
+def _delete_company(cursor, company_id):
+    cursor.execute(
+        "DELETE FROM companies WHERE id = ? "
+        "RETURNING id, company_name, sub_company1, sub_company2",
+        (company_id,),
+    )
+    return cursor.fetchone()
+
 
 @companies_routes.route("/companies", methods=["GET", "POST"])
 @login_required
 def handle_companies():
     """Handles GET requests to retrieve all companies and POST requests to add a new company."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     if request.method == "POST":
         try:
             company_data = request.json
@@ -26,44 +189,50 @@ def handle_companies():
                 )
                 return jsonify({"error": "Company name is required"}), 400
 
-            cursor.execute(
-                "SELECT id FROM companies WHERE company_name = ?", (company_name,)
-            )
-            if cursor.fetchone():
+            created = run_write(_insert_company, company_name, sub_company1, sub_company2)
+            if not created:
                 current_app.logger.warning(
-                    f"Company add failed: Company '{company_name}' already exists."
+                    "Company add failed: Company '%s' already exists.", company_name
                 )
                 return jsonify({"error": "Company already exists"}), 409
 
-            cursor.execute(
-                "INSERT INTO companies (company_name, sub_company1, sub_company2) VALUES (?, ?, ?)",
-                (company_name, sub_company1, sub_company2),
-            )
-            conn.commit()
-            current_app.logger.info(f"Company '{company_name}' added successfully.")
+            record_change("company", "create", created["id"], after=created)
+            current_app.logger.info("Company '%s' added successfully.", company_name)
             return (
                 jsonify(
-                    {"message": "Company added successfully", "id": cursor.lastrowid}
+                    {"message": "Company added successfully", "id": created["id"]}
                 ),
                 201,
             )
+        except WriteQueueTimeout:
+            current_app.logger.warning("Company add failed: Write queue is busy.")
+            return write_busy_response()
         except Exception as e:
-            conn.rollback()
-            current_app.logger.error(f"Error adding company: {e}", exc_info=True)
+            current_app.logger.error("Error adding company: %s", e, exc_info=True)
             return jsonify({"error": str(e)}), 500
-        finally:
-            conn.close()
 
     elif request.method == "GET":
+        conn = get_read_connection()
+        cursor = conn.cursor()
         try:
-            cursor.execute("SELECT * FROM companies")
+            if any(param in request.args for param in COMPANY_LIST_PARAMS):
+                try:
+                    rows_json, next_cursor, limit = list_companies_page(cursor, request.args)
+                except ValueError as e:
+                    return jsonify({"error": str(e)}), 400
+                return (
+                    rows_response(rows_json, key="companies", next_cursor=next_cursor, limit=limit),
+                    200,
+                )
+
+            # Without parameters the whole table is returned, as before pagination existed
+            cursor.execute("SELECT id, company_name, sub_company1, sub_company2 FROM companies")
             companies = cursor.fetchall()
-            companies_list = [dict(company) for company in companies]
             current_app.logger.info("Fetched all companies.")
-            return jsonify(companies_list), 200
+            return rows_response(encode_rows(cursor, companies)), 200
         except Exception as e:
             current_app.logger.error(
-                f"Error fetching all companies: {e}", exc_info=True
+                "Error fetching all companies: %s", e, exc_info=True
             )
             return jsonify({"error": str(e)}), 500
         finally:
@@ -74,7 +243,7 @@ def handle_companies():
 @login_required
 def get_unique_companies_from_contacts():
     """Get unique company names from contacts table."""
-    conn = get_db_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
     try:
         cursor.execute(
@@ -85,7 +254,56 @@ def get_unique_companies_from_contacts():
         current_app.logger.info("Fetched unique companies from contacts.")
         return jsonify(companies_list), 200
     except Exception as e:
-        current_app.logger.error(f"Error fetching unique companies: {e}", exc_info=True)
+        current_app.logger.error(
+            "Error fetching unique companies: %s", e, exc_info=True
+        )
+        return jsonify({"error": str(e)}), 500
+    finally:
+        conn.close()
+
+
+@companies_routes.route("/companies/family", methods=["GET"])
+@login_required
+def get_company_family():
+    """Returns the companies linked to a company name through their sub-company columns.
+
+    This is the part of the table needed to draw one company's hierarchy tree.
+    """
+    name = request.args.get("name", "").strip()
+    if not name:
+        return jsonify({"error": "name is required"}), 400
+
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    try:
+        names = {name}
+        frontier = [name]
+        family = {}
+        while frontier and len(family) < MAX_FAMILY_SIZE:
+            names_json = json.dumps(frontier, ensure_ascii=False)
+            cursor.execute(
+                """
+                SELECT id, company_name, sub_company1, sub_company2 FROM companies
+                WHERE company_name IN (SELECT value FROM json_each(?))
+                   OR sub_company1 IN (SELECT value FROM json_each(?))
+                   OR sub_company2 IN (SELECT value FROM json_each(?))
+            """,
+                (names_json, names_json, names_json),
+            )
+            frontier = []
+            for row in cursor.fetchall():
+                if row["id"] in family:
+                    continue
+                family[row["id"]] = row
+                for linked_name in (row["company_name"], row["sub_company1"], row["sub_company2"]):
+                    if linked_name and linked_name not in names:
+                        names.add(linked_name)
+                        frontier.append(linked_name)
+        rows = list(family.values())[:MAX_FAMILY_SIZE]
+        current_app.logger.info("Fetched %d companies related to '%s'.", len(rows), name)
+        return rows_response(encode_rows(cursor, rows)), 200
+    except Exception as e:
+        current_app.logger.error("Error fetching company family: %s", e, exc_info=True)
         return jsonify({"error": str(e)}), 500
     finally:
         conn.close()
@@ -95,22 +313,24 @@ def get_unique_companies_from_contacts():
 @login_required
 def handle_single_company(company_id):
     """Handles GET, PUT, and DELETE requests for a specific company."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     if request.method == "GET":
+        conn = get_read_connection()
+        cursor = conn.cursor()
         try:
-            cursor.execute("SELECT * FROM companies WHERE id = ?", (company_id,))
+            cursor.execute(
+                "SELECT id, company_name, sub_company1, sub_company2 FROM companies WHERE id = ?",
+                (company_id,),
+            )
             company = cursor.fetchone()
             if company:
-                current_app.logger.info(f"Fetched company with ID {company_id}.")
+                current_app.logger.info("Fetched company with ID %s.", company_id)
                 return jsonify(dict(company)), 200
             else:
-                current_app.logger.warning(f"Company with ID {company_id} not found.")
+                current_app.logger.warning("Company with ID %s not found.", company_id)
                 return jsonify({"error": "Company not found"}), 404
         except Exception as e:
             current_app.logger.error(
-                f"Error fetching company {company_id}: {e}", exc_info=True
+                "Error fetching company %s: %s", company_id, e, exc_info=True
             )
             return jsonify({"error": str(e)}), 500
         finally:
@@ -123,64 +343,56 @@ def handle_single_company(company_id):
             sub_company1 = company_data.get("subCompany1")
             sub_company2 = company_data.get("subCompany2")
 
-            # Check if company exists
-            cursor.execute("SELECT id FROM companies WHERE id = ?", (company_id,))
-            if not cursor.fetchone():
+            outcome, before, after = run_write(
+                _update_company, company_id, company_name, sub_company1, sub_company2
+            )
+            if outcome == "not_found":
                 current_app.logger.warning(
-                    f"Update failed: Company with ID {company_id} not found."
+                    "Update failed: Company with ID %s not found.", company_id
                 )
                 return jsonify({"error": "Company not found"}), 404
-
-            # Check if company name is taken by another company
-            cursor.execute(
-                "SELECT id FROM companies WHERE company_name = ? AND id != ?",
-                (company_name, company_id),
-            )
-            if cursor.fetchone():
+            if outcome == "name_taken":
                 current_app.logger.warning(
-                    f"Update failed: Company name '{company_name}' already exists."
+                    "Update failed: Company name '%s' already exists.", company_name
                 )
                 return jsonify({"error": "Company name already exists"}), 409
 
-            cursor.execute(
-                "UPDATE companies SET company_name = ?, sub_company1 = ?, sub_company2 = ? WHERE id = ?",
-                (company_name, sub_company1, sub_company2, company_id),
-            )
-            conn.commit()
+            record_change("company", "update", company_id, before=before, after=after)
             current_app.logger.info(
-                f"Company with ID {company_id} updated successfully."
+                "Company with ID %s updated successfully.", company_id
             )
             return jsonify({"message": "Company updated successfully"}), 200
+        except WriteQueueTimeout:
+            current_app.logger.warning(
+                "Update failed for company %s: Write queue is busy.", company_id
+            )
+            return write_busy_response()
         except Exception as e:
-            conn.rollback()
             current_app.logger.error(
-                f"Error updating company {company_id}: {e}", exc_info=True
+                "Error updating company %s: %s", company_id, e, exc_info=True
             )
             return jsonify({"error": str(e)}), 500
-        finally:
-            conn.close()
 
     elif request.method == "DELETE":
         try:
-            # Check if company exists
-            cursor.execute("SELECT id FROM companies WHERE id = ?", (company_id,))
-            if not cursor.fetchone():
+            deleted = run_write(_delete_company, company_id)
+            if not deleted:
                 current_app.logger.warning(
-                    f"Delete failed: Company with ID {company_id} not found."
+                    "Delete failed: Company with ID %s not found.", company_id
                 )
                 return jsonify({"error": "Company not found"}), 404
-
-            cursor.execute("DELETE FROM companies WHERE id = ?", (company_id,))
-            conn.commit()
+            record_change("company", "delete", company_id, before=deleted)
             current_app.logger.info(
-                f"Company with ID {company_id} deleted successfully."
+                "Company with ID %s deleted successfully.", company_id
             )
             return jsonify({"message": "Company deleted successfully"}), 200
+        except WriteQueueTimeout:
+            current_app.logger.warning(
+                "Delete failed for company %s: Write queue is busy.", company_id
+            )
+            return write_busy_response()
         except Exception as e:
-            conn.rollback()
             current_app.logger.error(
-                f"Error deleting company {company_id}: {e}", exc_info=True
+                "Error deleting company %s: %s", company_id, e, exc_info=True
             )
             return jsonify({"error": str(e)}), 500
-        finally:
-            conn.close()
@@ -1,19 +1,228 @@
 from flask import Blueprint, request, jsonify, current_app
+from audit import record_change, record_changes
 from auth import login_required
-from database import get_db_connection
+from config import TRIGRAM_MIN_LENGTH, TRIGRAM_SEARCH
+from database import PHONE_SEARCH_COLUMNS, SEARCH_COLUMNS
+from normalize import SEARCH_TEXT_SEPARATOR, contact_identity_key, phone_digits
+from serialization import encode_rows, rows_response
+from snapshot import get_read_connection
+from writer import WriteQueueTimeout, run_write, write_busy_response
+import json
+import re
 import sqlite3
-import pandas as pd
 
 contacts_routes = Blueprint("contacts_routes", __name__)
 
+# Maps the camelCase keys sent by the frontend to contacts table columns
+CONTACT_FIELDS = {
+    "fullName": "full_name",
+    "mainCompany": "main_company",
+    "jobTitle": "job_title",
+    "mobilePhone": "mobile_phone",
+    "officePhone1": "office_phone1",
+    "extension1": "extension1",
+    "officePhone2": "office_phone2",
+    "extension2": "extension2",
+    "officePhone3": "office_phone3",
+    "extension3": "extension3",
+    "email": "email",
+    "officeManagerName1": "office_manager_name1",
+    "officeManagerMobile1": "office_manager_mobile1",
+    "officeManagerName2": "office_manager_name2",
+    "officeManagerMobile2": "office_manager_mobile2",
+    "officeManagerName3": "office_manager_name3",
+    "officeManagerMobile3": "office_manager_mobile3",
+    "officeEmail": "office_email",
+    "subjectCategory": "subject_category",
+    "country": "country",
+    "address": "address",
+    "postalCode": "postal_code",
+    "description": "description",
+}
+
+# Terms made only of digits and phone separators also match the phone columns'
+# digits, so "4412" finds "021-8844-1234" and numbers stored in Persian digits
+_PHONE_TERM = re.compile(r"^[\d\s()+\-./]+$")
+
+
+def build_search_where(term, use_index=TRIGRAM_SEARCH):
+    """Builds the WHERE clause and parameters matching contacts against a search term.
+
+    A contact matches if any of SEARCH_COLUMNS contains the term, or, for a
+    phone-like term of at least TRIGRAM_MIN_LENGTH digits, if one of its phone
+    numbers contains the term's digits.
+
+    Terms of TRIGRAM_MIN_LENGTH characters or more are resolved through the
+    contact_trigrams index: SQLite reads the rows holding every trigram of the
+    term and verifies each against the indexed text with the LIKE. Shorter
+    terms, terms with LIKE wildcards and ``use_index=False``
+    (PHONEBOOK_TRIGRAM_SEARCH=0) scan the table instead; both find the same
+    rows, but the scan calls phone_digits() on every row for phone-like terms.
+    """
+    if not term:
+        return "", []
+    digits = phone_digits(term) if _PHONE_TERM.match(term) else ""
+    if len(digits) < TRIGRAM_MIN_LENGTH:
+        # Shorter fragments match nearly every contact
+        digits = ""
+    pattern = f"%{term}%"
+
+    use_index = (
+        use_index
+        and len(term) >= TRIGRAM_MIN_LENGTH
+        and not any(ch in term for ch in ("%", "_", SEARCH_TEXT_SEPARATOR))
+    )
+    if use_index:
+        where_clause = " WHERE id IN (SELECT rowid FROM contact_trigrams WHERE body LIKE ?"
+        params = [pattern]
+        if digits:
+            where_clause += " UNION SELECT rowid FROM contact_trigrams WHERE phones LIKE ?"
+            params.append(f"%{digits}%")
+        return where_clause + ")", params
+
+    conditions = [f"{column} LIKE ?" for column in SEARCH_COLUMNS]
+    params = [pattern] * len(SEARCH_COLUMNS)
+    if digits:
+        conditions.append(f"phone_digits({', '.join(PHONE_SEARCH_COLUMNS)}) LIKE ?")
+        params.append(f"%{digits}%")
+    return f" WHERE ({' OR '.join(conditions)})", params
+
+
+def build_bulk_target(data):
+    """Resolves the rows targeted by a bulk request.
+
+    The request names either an explicit list of ``ids`` or a ``filter`` with a
+    search ``term``. Returns ``(where_clause, params, ids)``; ``ids`` is None for
+    filter-based requests. Raises ValueError when the target is invalid.
+    """
+    ids = data.get("ids")
+    search_filter = data.get("filter")
+
+    if ids is not None and search_filter is not None:
+        raise ValueError("Provide either ids or filter, not both")
+
+    if ids is not None:
+        if not isinstance(ids, list) or not ids:
+            raise ValueError("ids must be a non-empty list")
+        if not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            raise ValueError("ids must be integers")
+        # json_each keeps this a single statement regardless of SQLite's parameter limit
+        return " WHERE id IN (SELECT value FROM json_each(?))", [json.dumps(ids)], ids
+
+    if search_filter is not None:
+        if not isinstance(search_filter, dict):
+            raise ValueError("filter must be an object")
+        term = str(search_filter.get("term", "")).strip()
+        if not term:
+            raise ValueError("filter.term is required")
+        where_clause, params = build_search_where(term)
+        return where_clause, params, None
+
+    raise ValueError("ids or filter is required")
+
+
+def bulk_results(ids, affected_ids, status):
+    """Builds per-id outcomes for a bulk operation."""
+    affected = set(affected_ids)
+    if ids is None:
+        return [{"id": contact_id, "status": status} for contact_id in affected_ids]
+    return [
+        {"id": contact_id, "status": status if contact_id in affected else "not_found"}
+        for contact_id in ids
+    ]
+
+
+# Write operations, run by the write coordinator in a transaction shared with other
+# requests' writes (see writer.py). They must not commit or use the request context.
+
+
+def _insert_contact(cursor, values):
+    cursor.execute(
+        """
+        INSERT INTO contacts (
+            full_name, main_company, job_title, mobile_phone,
+            office_phone1, extension1, office_phone2, extension2, office_phone3, extension3,
+            email, office_manager_name1, office_manager_mobile1, office_manager_name2,
+            office_manager_mobile2, office_manager_name3, office_manager_mobile3,
+            office_email, subject_category, country, address, postal_code, description
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        RETURNING *
+    """,
+        values,
+    )
+    return cursor.fetchone()
+
+
+def _update_contact(cursor, contact_id, values):
+    """Returns the contact's rows before and after the update, or (None, None) if it is missing."""
+    # The current row is kept for the audit trail
+    cursor.execute("SELECT * FROM contacts WHERE id = ?", (contact_id,))
+    before = cursor.fetchone()
+    if not before:
+        return None, None
+    cursor.execute(
+        """
+        UPDATE contacts SET
+            full_name = ?, main_company = ?, job_title = ?, mobile_phone = ?,
+            office_phone1 = ?, extension1 = ?, office_phone2 = ?, extension2 = ?, office_phone3 = ?, extension3 = ?,
+            email = ?, office_manager_name1 = ?, office_manager_mobile1 = ?, office_manager_name2 = ?,
+            office_manager_mobile2 = ?, office_manager_name3 = ?, office_manager_mobile3 = ?,
+            office_email = ?, subject_category = ?, country = ?, address = ?, postal_code = ?, description = ?,
+            version = version + 1
+        WHERE id = ?
+        RETURNING *
+    """,
+        values + (contact_id,),
+    )
+    return before, cursor.fetchone()
+
+
+def _patch_contact(cursor, contact_id, set_clause, params, version_clause):
+    """Returns ``(before, updated, current_version)``.
+
+    ``updated`` is None when nothing matched; ``current_version`` then tells a
+    stale version apart from a missing contact (None).
+    """
+    cursor.execute("SELECT * FROM contacts WHERE id = ?", (contact_id,))
+    before = cursor.fetchone()
+    cursor.execute(
+        f"UPDATE contacts SET {set_clause}, version = version + 1 "
+        f"WHERE id = ?{version_clause} RETURNING *",
+        params,
+    )
+    updated = cursor.fetchone()
+    if updated is not None:
+        return before, updated, updated["version"]
+    return before, None, before["version"] if before else None
+
+
+def _delete_contact(cursor, contact_id):
+    cursor.execute("DELETE FROM contacts WHERE id = ? RETURNING *", (contact_id,))
+    return cursor.fetchone()
+
+
+def _bulk_delete(cursor, where_clause, params):
+    cursor.execute(f"DELETE FROM contacts{where_clause} RETURNING *", params)
+    return cursor.fetchall()
+
+
+def _bulk_update(cursor, set_clause, set_params, where_clause, params):
+    """Returns the targeted rows before the update, by id, and the updated rows."""
+    # Run inside the write transaction, so the rows read for the audit trail
+    # are exactly the rows the update changes
+    cursor.execute(f"SELECT * FROM contacts{where_clause}", params)
+    before = {row["id"]: row for row in cursor.fetchall()}
+    cursor.execute(
+        f"UPDATE contacts SET {set_clause}, version = version + 1{where_clause} RETURNING *",
+        set_params + params,
+    )
+    return before, cursor.fetchall()
+
 
 @contacts_routes.route("/contacts", methods=["GET", "POST"])
 @login_required
 def handle_contacts():
     """Handles GET requests to retrieve all contacts and POST requests to add a new contact."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     if request.method == "POST":
         try:
             contact_data = request.json
@@ -47,91 +256,85 @@ def handle_contacts():
                 current_app.logger.warning("Contact add failed: Full name is required.")
                 return jsonify({"error": "Full name is required"}), 400
 
-            cursor.execute(
-                """
-                INSERT INTO contacts (
-                    full_name, main_company, job_title, mobile_phone,
-                    office_phone1, extension1, office_phone2, extension2, office_phone3, extension3,
-                    email, office_manager_name1, office_manager_mobile1, office_manager_name2,
-                    office_manager_mobile2, office_manager_name3, office_manager_mobile3,
-                    office_email, subject_category, country, address, postal_code, description
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-                (
-                    full_name,
-                    main_company,
-                    job_title,
-                    mobile_phone,
-                    office_phone1,
-                    extension1,
-                    office_phone2,
-                    extension2,
-                    office_phone3,
-                    extension3,
-                    email,
-                    office_manager_name1,
-                    office_manager_mobile1,
-                    office_manager_name2,
-                    office_manager_mobile2,
-                    office_manager_name3,
-                    office_manager_mobile3,
-                    office_email,
-                    subject_category,
-                    country,
-                    address,
-                    postal_code,
-                    description,
-                ),
+            values = (
+                full_name,
+                main_company,
+                job_title,
+                mobile_phone,
+                office_phone1,
+                extension1,
+                office_phone2,
+                extension2,
+                office_phone3,
+                extension3,
+                email,
+                office_manager_name1,
+                office_manager_mobile1,
+                office_manager_name2,
+                office_manager_mobile2,
+                office_manager_name3,
+                office_manager_mobile3,
+                office_email,
+                subject_category,
+                country,
+                address,
+                postal_code,
+                description,
             )
-            conn.commit()
-            current_app.logger.info(f"Contact '{full_name}' added successfully.")
+            created = run_write(_insert_contact, values)
+            record_change("contact", "create", created["id"], after=created)
+            current_app.logger.info("Contact '%s' added successfully.", full_name)
             return (
                 jsonify(
-                    {"message": "Contact added successfully", "id": cursor.lastrowid}
+                    {"message": "Contact added successfully", "id": created["id"]}
                 ),
                 201,
             )
+        except WriteQueueTimeout:
+            current_app.logger.warning("Contact add failed: Write queue is busy.")
+            return write_busy_response()
         except Exception as e:
-            conn.rollback()
-            current_app.logger.error(f"Error adding contact: {e}", exc_info=True)
+            current_app.logger.error("Error adding contact: %s", e, exc_info=True)
             return jsonify({"error": str(e)}), 500
-        finally:
-            conn.close()
 
     elif request.method == "GET":
+        conn = get_read_connection()
+        cursor = conn.cursor()
         try:
             cursor.execute("SELECT * FROM contacts")
             contacts = cursor.fetchall()
-            contacts_list = [dict(contact) for contact in contacts]
             current_app.logger.info("Fetched all contacts.")
-            return jsonify(contacts_list), 200
+            return rows_response(encode_rows(cursor, contacts)), 200
         except Exception as e:
-            current_app.logger.error(f"Error fetching all contacts: {e}", exc_info=True)
+            current_app.logger.error(
+                "Error fetching all contacts: %s", e, exc_info=True
+            )
             return jsonify({"error": str(e)}), 500
         finally:
             conn.close()
 
 
-@contacts_routes.route("/contacts/<int:contact_id>", methods=["GET", "PUT", "DELETE"])
+@contacts_routes.route(
+    "/contacts/<int:contact_id>", methods=["GET", "PUT", "PATCH", "DELETE"]
+)
 @login_required
 def handle_single_contact(contact_id):
-    """Handles GET, PUT, and DELETE requests for a specific contact."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
+    """Handles GET, PUT, PATCH, and DELETE requests for a specific contact."""
     if request.method == "GET":
+        conn = get_read_connection()
+        cursor = conn.cursor()
         try:
             cursor.execute("SELECT * FROM contacts WHERE id = ?", (contact_id,))
             contact = cursor.fetchone()
             if contact:
-                current_app.logger.info(f"Fetched contact with ID {contact_id}.")
+                current_app.logger.info("Fetched contact with ID %s.", contact_id)
                 return jsonify(dict(contact)), 200
             else:
-                current_app.logger.warning(f"Contact with ID {contact_id} not found.")
+                current_app.logger.warning("Contact with ID %s not found.", contact_id)
                 return jsonify({"error": "Contact not found"}), 404
         except Exception as e:
             current_app.logger.error(
-                f"Error fetching contact {contact_id}: {e}", exc_info=True
+                "Error fetching contact %s: %s", contact_id, e, exc_info=True
             )
             return jsonify({"error": str(e)}), 500
         finally:
@@ -164,96 +367,291 @@ def handle_single_contact(contact_id):
             postal_code = contact_data.get("postalCode")
             description = contact_data.get("description")
 
-            # Check if contact exists
-            cursor.execute("SELECT id FROM contacts WHERE id = ?", (contact_id,))
-            if not cursor.fetchone():
+            values = (
+                full_name,
+                main_company,
+                job_title,
+                mobile_phone,
+                office_phone1,
+                extension1,
+                office_phone2,
+                extension2,
+                office_phone3,
+                extension3,
+                email,
+                office_manager_name1,
+                office_manager_mobile1,
+                office_manager_name2,
+                office_manager_mobile2,
+                office_manager_name3,
+                office_manager_mobile3,
+                office_email,
+                subject_category,
+                country,
+                address,
+                postal_code,
+                description,
+            )
+            before, after = run_write(_update_contact, contact_id, values)
+            if not before:
                 current_app.logger.warning(
-                    f"Update failed: Contact with ID {contact_id} not found."
+                    "Update failed: Contact with ID %s not found.", contact_id
                 )
                 return jsonify({"error": "Contact not found"}), 404
 
-            cursor.execute(
-                """
-                UPDATE contacts SET
-                    full_name = ?, main_company = ?, job_title = ?, mobile_phone = ?,
-                    office_phone1 = ?, extension1 = ?, office_phone2 = ?, extension2 = ?, office_phone3 = ?, extension3 = ?,
-                    email = ?, office_manager_name1 = ?, office_manager_mobile1 = ?, office_manager_name2 = ?,
-                    office_manager_mobile2 = ?, office_manager_name3 = ?, office_manager_mobile3 = ?,
-                    office_email = ?, subject_category = ?, country = ?, address = ?, postal_code = ?, description = ?
-                WHERE id = ?
-            """,
-                (
-                    full_name,
-                    main_company,
-                    job_title,
-                    mobile_phone,
-                    office_phone1,
-                    extension1,
-                    office_phone2,
-                    extension2,
-                    office_phone3,
-                    extension3,
-                    email,
-                    office_manager_name1,
-                    office_manager_mobile1,
-                    office_manager_name2,
-                    office_manager_mobile2,
-                    office_manager_name3,
-                    office_manager_mobile3,
-                    office_email,
-                    subject_category,
-                    country,
-                    address,
-                    postal_code,
-                    description,
+            record_change("contact", "update", contact_id, before=before, after=after)
+            current_app.logger.info(
+                "Contact with ID %s updated successfully.", contact_id
+            )
+            return jsonify({"message": "Contact updated successfully"}), 200
+        except WriteQueueTimeout:
+            current_app.logger.warning(
+                "Update failed for contact %s: Write queue is busy.", contact_id
+            )
+            return write_busy_response()
+        except Exception as e:
+            current_app.logger.error(
+                "Error updating contact %s: %s", contact_id, e, exc_info=True
+            )
+            return jsonify({"error": str(e)}), 500
+
+    elif request.method == "PATCH":
+        try:
+            contact_data = dict(request.get_json(silent=True) or {})
+            # Optional row version for optimistic concurrency
+            expected_version = contact_data.pop("version", None)
+
+            unknown_fields = [key for key in contact_data if key not in CONTACT_FIELDS]
+            if unknown_fields:
+                current_app.logger.warning(
+                    "Patch failed for contact %s: Unknown fields %s.",
                     contact_id,
-                ),
+                    unknown_fields,
+                )
+                return (
+                    jsonify({"error": f"Unknown fields: {', '.join(unknown_fields)}"}),
+                    400,
+                )
+
+            if not contact_data:
+                current_app.logger.warning(
+                    "Patch failed for contact %s: No fields to update.", contact_id
+                )
+                return jsonify({"error": "No valid fields to update"}), 400
+
+            # Every column is text; null, numbers, lists or objects would fail in SQLite
+            invalid_fields = [
+                key for key, value in contact_data.items() if not isinstance(value, str)
+            ]
+            if invalid_fields:
+                current_app.logger.warning(
+                    "Patch failed for contact %s: Non-string values for %s.",
+                    contact_id,
+                    invalid_fields,
+                )
+                return (
+                    jsonify(
+                        {"error": f"Fields must be strings: {', '.join(invalid_fields)}"}
+                    ),
+                    400,
+                )
+
+            if expected_version is not None and (
+                not isinstance(expected_version, int) or isinstance(expected_version, bool)
+            ):
+                current_app.logger.warning(
+                    "Patch failed for contact %s: Invalid version %r.",
+                    contact_id,
+                    expected_version,
+                )
+                return jsonify({"error": "version must be an integer"}), 400
+
+            if "fullName" in contact_data and not contact_data["fullName"]:
+                current_app.logger.warning(
+                    "Patch failed for contact %s: Full name cannot be empty.",
+                    contact_id,
+                )
+                return jsonify({"error": "Full name is required"}), 400
+
+            # Only the supplied columns are written, in a single statement
+            set_clause = ", ".join(f"{CONTACT_FIELDS[key]} = ?" for key in contact_data)
+            params = list(contact_data.values()) + [contact_id]
+            version_clause = ""
+            if expected_version is not None:
+                version_clause = " AND version = ?"
+                params.append(expected_version)
+
+            # The current row is read in the same transaction for the audit trail
+            before, updated, current_version = run_write(
+                _patch_contact, contact_id, set_clause, params, version_clause
             )
-            conn.commit()
+
+            if updated is None:
+                # Nothing matched: tell a missing contact apart from a stale version
+                if current_version is None:
+                    current_app.logger.warning(
+                        "Patch failed: Contact with ID %s not found.", contact_id
+                    )
+                    return jsonify({"error": "Contact not found"}), 404
+                current_app.logger.warning(
+                    "Patch conflict for contact %s: expected version %s, current %s.",
+                    contact_id,
+                    expected_version,
+                    current_version,
+                )
+                return (
+                    jsonify(
+                        {
+                            "error": "Contact was modified by another user",
+                            "version": current_version,
+                        }
+                    ),
+                    409,
+                )
+
+            record_change("contact", "update", contact_id, before=before, after=updated)
             current_app.logger.info(
-                f"Contact with ID {contact_id} updated successfully."
+                "Contact with ID %s patched successfully.", contact_id
             )
-            return jsonify({"message": "Contact updated successfully"}), 200
+            return (
+                jsonify(
+                    {
+                        "message": "Contact updated successfully",
+                        "version": updated["version"],
+                    }
+                ),
+                200,
+            )
+        except WriteQueueTimeout:
+            current_app.logger.warning(
+                "Patch failed for contact %s: Write queue is busy.", contact_id
+            )
+            return write_busy_response()
         except Exception as e:
-            conn.rollback()
             current_app.logger.error(
-                f"Error updating contact {contact_id}: {e}", exc_info=True
+                "Error patching contact %s: %s", contact_id, e, exc_info=True
             )
             return jsonify({"error": str(e)}), 500
-        finally:
-            conn.close()
 
     elif request.method == "DELETE":
         try:
-            # Check if contact exists
-            cursor.execute("SELECT id FROM contacts WHERE id = ?", (contact_id,))
-            if not cursor.fetchone():
+            deleted = run_write(_delete_contact, contact_id)
+            if not deleted:
                 current_app.logger.warning(
-                    f"Delete failed: Contact with ID {contact_id} not found."
+                    "Delete failed: Contact with ID %s not found.", contact_id
                 )
                 return jsonify({"error": "Contact not found"}), 404
-
-            cursor.execute("DELETE FROM contacts WHERE id = ?", (contact_id,))
-            conn.commit()
+            record_change("contact", "delete", contact_id, before=deleted)
             current_app.logger.info(
-                f"Contact with ID {contact_id} deleted successfully."
+                "Contact with ID %s deleted successfully.", contact_id
             )
             return jsonify({"message": "Contact deleted successfully"}), 200
+        except WriteQueueTimeout:
+            current_app.logger.warning(
+                "Delete failed for contact %s: Write queue is busy.", contact_id
+            )
+            return write_busy_response()
         except Exception as e:
-            conn.rollback()
             current_app.logger.error(
-                f"Error deleting contact {contact_id}: {e}", exc_info=True
+                "Error deleting contact %s: %s", contact_id, e, exc_info=True
             )
             return jsonify({"error": str(e)}), 500
-        finally:
-            conn.close()
+
+
+@contacts_routes.route("/contacts/bulk_delete", methods=["POST"])
+@login_required
+def bulk_delete_contacts():
+    """Deletes a list of contacts, or all contacts matching a search filter, in one statement."""
+    data = request.get_json(silent=True) or {}
+    try:
+        where_clause, params, ids = build_bulk_target(data)
+    except ValueError as e:
+        current_app.logger.warning("Bulk delete failed: %s", e)
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        deleted = run_write(_bulk_delete, where_clause, params)
+        record_changes("contact", "delete", [(row["id"], row, None) for row in deleted])
+        deleted_ids = [row["id"] for row in deleted]
+        current_app.logger.info("Bulk deleted %s contacts.", len(deleted_ids))
+        return (
+            jsonify(
+                {
+                    "message": f"Deleted {len(deleted_ids)} contacts",
+                    "deleted_count": len(deleted_ids),
+                    "results": bulk_results(ids, deleted_ids, "deleted"),
+                }
+            ),
+            200,
+        )
+    except WriteQueueTimeout:
+        current_app.logger.warning("Bulk delete failed: Write queue is busy.")
+        return write_busy_response()
+    except Exception as e:
+        current_app.logger.error("Error during bulk delete: %s", e, exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+
+@contacts_routes.route("/contacts/bulk_update", methods=["POST"])
+@login_required
+def bulk_update_contacts():
+    """Sets the given fields on a list of contacts, or on all contacts matching a search filter."""
+    data = request.get_json(silent=True) or {}
+    try:
+        where_clause, params, ids = build_bulk_target(data)
+    except ValueError as e:
+        current_app.logger.warning("Bulk update failed: %s", e)
+        return jsonify({"error": str(e)}), 400
+
+    fields = data.get("fields")
+    if not isinstance(fields, dict) or not fields:
+        current_app.logger.warning("Bulk update failed: No fields to update.")
+        return jsonify({"error": "fields must be a non-empty object"}), 400
+
+    unknown_fields = [key for key in fields if key not in CONTACT_FIELDS]
+    if unknown_fields:
+        current_app.logger.warning(
+            "Bulk update failed: Unknown fields %s.", unknown_fields
+        )
+        return jsonify({"error": f"Unknown fields: {', '.join(unknown_fields)}"}), 400
+
+    if "fullName" in fields and not fields["fullName"]:
+        current_app.logger.warning("Bulk update failed: Full name cannot be empty.")
+        return jsonify({"error": "Full name is required"}), 400
+
+    set_clause = ", ".join(f"{CONTACT_FIELDS[key]} = ?" for key in fields)
+    set_params = list(fields.values())
+
+    try:
+        before, updated = run_write(_bulk_update, set_clause, set_params, where_clause, params)
+        record_changes(
+            "contact", "update", [(row["id"], before.get(row["id"]), row) for row in updated]
+        )
+        updated_ids = [row["id"] for row in updated]
+        current_app.logger.info("Bulk updated %s contacts.", len(updated_ids))
+        return (
+            jsonify(
+                {
+                    "message": f"Updated {len(updated_ids)} contacts",
+                    "updated_count": len(updated_ids),
+                    "results": bulk_results(ids, updated_ids, "updated"),
+                }
+            ),
+            200,
+        )
+    except WriteQueueTimeout:
+        current_app.logger.warning("Bulk update failed: Write queue is busy.")
+        return write_busy_response()
+    except Exception as e:
+        current_app.logger.error("Error during bulk update: %s", e, exc_info=True)
+        return jsonify({"error": str(e)}), 500
 
 
 @contacts_routes.route("/contacts/search", methods=["GET"])
 @login_required
 def search_contacts():
     """Search contacts with pagination, sorting, and filtering."""
-    conn = get_db_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
 
     try:
@@ -271,17 +669,7 @@ def search_contacts():
         """
 
         # Add search conditions if term is provided
-        where_clause = ""
-        params = []
-        if term:
-            where_clause = """
-                WHERE (full_name LIKE ? OR main_company LIKE ? OR job_title LIKE ? OR 
-                       mobile_phone LIKE ? OR office_phone1 LIKE ? OR office_phone2 LIKE ? OR office_phone3 LIKE ? OR
-                       email LIKE ? OR office_email LIKE ? OR subject_category LIKE ? OR 
-                       country LIKE ? OR address LIKE ? OR description LIKE ?)
-            """
-            search_term = f"%{term}%"
-            params = [search_term] * 13  # 13 fields being searched
+        where_clause, params = build_search_where(term)
 
         # Add sorting
         order_clause = ""
@@ -310,15 +698,15 @@ def search_contacts():
             query = base_query + where_clause + order_clause
             cursor.execute(query, params)
             contacts = cursor.fetchall()
-            contacts_list = [dict(contact) for contact in contacts]
-            total_count = len(contacts_list)
+            contacts_json = encode_rows(cursor, contacts)
+            total_count = len(contacts)
         else:
             # Apply pagination
             limit_clause = f" LIMIT {limit} OFFSET {offset}"
             query = base_query + where_clause + order_clause + limit_clause
             cursor.execute(query, params)
             contacts = cursor.fetchall()
-            contacts_list = [dict(contact) for contact in contacts]
+            contacts_json = encode_rows(cursor, contacts)
 
             # Get total count for pagination info
             count_query = f"SELECT COUNT(*) FROM contacts{where_clause}"
@@ -326,32 +714,85 @@ def search_contacts():
             total_count = cursor.fetchone()[0]
 
         current_app.logger.info(
-            f"Search completed. Term: '{term}', Results: {len(contacts_list)}, Total: {total_count}"
+            "Search completed. Term: '%s', Results: %d, Total: %d",
+            term,
+            len(contacts),
+            total_count,
         )
 
         return (
-            jsonify(
-                {
-                    "contacts": contacts_list,
-                    "total_count": total_count,
-                    "offset": offset,
-                    "limit": limit,
-                }
+            rows_response(
+                contacts_json,
+                key="contacts",
+                total_count=total_count,
+                offset=offset,
+                limit=limit,
             ),
             200,
         )
 
     except Exception as e:
-        current_app.logger.error(f"Error searching contacts: {e}", exc_info=True)
+        current_app.logger.error("Error searching contacts: %s", e, exc_info=True)
         return jsonify({"error": str(e)}), 500
     finally:
         conn.close()
 
 
+# Excel import modes: append every row, update rows whose identity already exists,
+# or leave existing rows untouched
+IMPORT_MODES = ("insert_only", "upsert", "skip_existing")
+
+# Rows written per executemany batch during import
+IMPORT_BATCH_SIZE = 1000
+
+IMPORT_COLUMNS = list(CONTACT_FIELDS.values())
+
+_IMPORT_INSERT = f"""
+    INSERT INTO contacts ({", ".join(IMPORT_COLUMNS)}, identity_key)
+    VALUES ({", ".join("?" for _ in IMPORT_COLUMNS)}, ?)
+"""
+
+_IMPORT_CONFLICT_TARGET = "ON CONFLICT (identity_key) WHERE identity_key IS NOT NULL"
+
+# Empty cells in a re-imported sheet keep the stored value
+IMPORT_STATEMENTS = {
+    "insert_only": _IMPORT_INSERT,
+    "upsert": _IMPORT_INSERT
+    + _IMPORT_CONFLICT_TARGET
+    + " DO UPDATE SET "
+    + ", ".join(
+        f"{column} = COALESCE(NULLIF(excluded.{column}, ''), contacts.{column})"
+        for column in IMPORT_COLUMNS
+    )
+    + ", version = contacts.version + 1",
+    "skip_existing": _IMPORT_INSERT + _IMPORT_CONFLICT_TARGET + " DO NOTHING",
+}
+
+
+def _import_rows(cursor, statement, rows):
+    """Writes import rows in batches; returns the inserted and affected row counts."""
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM contacts")
+    max_id_before = cursor.fetchone()[0]
+
+    affected_count = 0
+    for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+        cursor.executemany(statement, rows[start : start + IMPORT_BATCH_SIZE])
+        affected_count += cursor.rowcount
+
+    # Ids are AUTOINCREMENT, so new rows are exactly those above the old maximum
+    cursor.execute("SELECT COUNT(*) FROM contacts WHERE id > ?", (max_id_before,))
+    return cursor.fetchone()[0], affected_count
+
+
 @contacts_routes.route("/contacts/import", methods=["POST"])
 @login_required
 def import_contacts():
-    """Import contacts from Excel file."""
+    """Import contacts from Excel file.
+
+    The optional ``mode`` form field selects insert_only (default), upsert or
+    skip_existing. Upsert and skip_existing match rows on the contact identity
+    key (normalized mobile phone, else email).
+    """
     try:
         if "file" not in request.files:
             return jsonify({"error": "No file provided"}), 400
@@ -363,11 +804,23 @@ def import_contacts():
         if not file.filename.lower().endswith((".xlsx", ".xls")):
             return jsonify({"error": "Only Excel files (.xlsx, .xls) are allowed"}), 400
 
+        mode = request.form.get("mode", "insert_only")
+        if mode not in IMPORT_MODES:
+            return (
+                jsonify({"error": f"Invalid import mode. Use one of: {', '.join(IMPORT_MODES)}"}),
+                400,
+            )
+
+        # pandas and numpy take longer to import than the rest of the application,
+        # so they are loaded by the first import instead of at process start
+        import pandas as pd
+
         # Read Excel file
         try:
-            df = pd.read_excel(file)
+            # Read every cell as text so phone numbers are not turned into floats
+            df = pd.read_excel(file, dtype=str)
         except Exception as e:
-            current_app.logger.error(f"Error reading Excel file: {e}")
+            current_app.logger.error("Error reading Excel file: %s", e)
             return jsonify({"error": "Invalid Excel file format"}), 400
 
         # Define expected columns and their mappings
@@ -404,92 +857,76 @@ def import_contacts():
                 400,
             )
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        imported_count = 0
-        errors = []
+        # Missing columns become empty, NaN cells become empty strings
+        df = df.reindex(columns=list(column_mapping)).rename(columns=column_mapping)
+        df = df.astype(object).where(df.notna(), "")
+
+        rows = []
+        skipped_count = 0
+        for record in df[IMPORT_COLUMNS].itertuples(index=False, name=None):
+            values = [str(value).strip() for value in record]
+            contact_data = dict(zip(IMPORT_COLUMNS, values))
+
+            # Skip rows without full name
+            if not contact_data["full_name"]:
+                skipped_count += 1
+                continue
+
+            # insert_only leaves key assignment to the identity trigger
+            identity_key = None
+            if mode != "insert_only":
+                identity_key = contact_identity_key(
+                    contact_data["mobile_phone"], contact_data["email"]
+                )
+            rows.append(values + [identity_key])
 
         try:
-            for index, row in df.iterrows():
-                try:
-                    # Extract data with defaults for missing values
-                    contact_data = {}
-                    for persian_col, english_col in column_mapping.items():
-                        value = row.get(persian_col, "")
-                        # Convert NaN to empty string
-                        if pd.isna(value):
-                            value = ""
-                        contact_data[english_col] = str(value).strip()
-
-                    # Skip rows without full name
-                    if not contact_data["full_name"]:
-                        continue
-
-                    # Insert contact
-                    cursor.execute(
-                        """
-                        INSERT INTO contacts (
-                            full_name, main_company, job_title, mobile_phone,
-                            office_phone1, extension1, office_phone2, extension2, office_phone3, extension3,
-                            email, office_manager_name1, office_manager_mobile1, office_manager_name2,
-                            office_manager_mobile2, office_manager_name3, office_manager_mobile3,
-                            office_email, subject_category, country, address, postal_code, description
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                        (
-                            contact_data["full_name"],
-                            contact_data["main_company"],
-                            contact_data["job_title"],
-                            contact_data["mobile_phone"],
-                            contact_data["office_phone1"],
-                            contact_data["extension1"],
-                            contact_data["office_phone2"],
-                            contact_data["extension2"],
-                            contact_data["office_phone3"],
-                            contact_data["extension3"],
-                            contact_data["email"],
-                            contact_data["office_manager_name1"],
-                            contact_data["office_manager_mobile1"],
-                            contact_data["office_manager_name2"],
-                            contact_data["office_manager_mobile2"],
-                            contact_data["office_manager_name3"],
-                            contact_data["office_manager_mobile3"],
-                            contact_data["office_email"],
-                            contact_data["subject_category"],
-                            contact_data["country"],
-                            contact_data["address"],
-                            contact_data["postal_code"],
-                            contact_data["description"],
-                        ),
-                    )
-                    imported_count += 1
-
-                except Exception as row_error:
-                    errors.append(f"Row {index + 2}: {str(row_error)}")
-                    continue
-
-            conn.commit()
-            current_app.logger.info(f"Successfully imported {imported_count} contacts")
-
-            response_data = {
-                "message": f"Successfully imported {imported_count} contacts",
-                "imported_count": imported_count,
-            }
-
-            if errors:
-                response_data["errors"] = errors[:10]  # Limit error messages
-                response_data["error_count"] = len(errors)
+            # A large import gets a transaction of its own instead of joining other writes
+            imported_count, affected_count = run_write(
+                _import_rows, IMPORT_STATEMENTS[mode], rows, exclusive=True
+            )
+            updated_count = affected_count - imported_count
+            skipped_count += len(rows) - affected_count
+
+            record_change(
+                "contact",
+                "import",
+                details={
+                    "file": file.filename,
+                    "mode": mode,
+                    "imported_count": imported_count,
+                    "updated_count": updated_count,
+                    "skipped_count": skipped_count,
+                },
+            )
+            current_app.logger.info(
+                "Import (%s) finished: %s inserted, %s updated, %s skipped",
+                mode,
+                imported_count,
+                updated_count,
+                skipped_count,
+            )
 
-            return jsonify(response_data), 200
+            return (
+                jsonify(
+                    {
+                        "message": f"Successfully imported {imported_count} contacts",
+                        "mode": mode,
+                        "imported_count": imported_count,
+                        "updated_count": updated_count,
+                        "skipped_count": skipped_count,
+                    }
+                ),
+                200,
+            )
 
+        except WriteQueueTimeout:
+            current_app.logger.warning("Import failed: Write queue is busy.")
+            return write_busy_response()
         except Exception as e:
-            conn.rollback()
-            current_app.logger.error(f"Error during import: {e}", exc_info=True)
+            current_app.logger.error("Error during import: %s", e, exc_info=True)
             return jsonify({"error": f"Import failed: {str(e)}"}), 500
-        finally:
-            conn.close()
 
     except Exception as e:
-        current_app.logger.error(f"Error in import_contacts: {e}", exc_info=True)
+        current_app.logger.error("Error in import_contacts: %s", e, exc_info=True)
         return jsonify({"error": str(e)}), 500
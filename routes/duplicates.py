@@ -0,0 +1,225 @@
+from flask import Blueprint, request, jsonify, current_app
+from audit import record_change, record_changes
+from auth import login_required
+from database import get_db_connection
+from snapshot import get_read_connection
+from duplicates import build_clusters, run_duplicate_scan
+from routes.contacts import CONTACT_FIELDS
+from writer import WriteQueueTimeout, run_write, write_busy_response
+import json
+
+duplicates_routes = Blueprint("duplicates_routes", __name__)
+
+# Columns copied from duplicates into empty fields of the kept contact on merge
+MERGE_COLUMNS = list(CONTACT_FIELDS.values())
+
+
+@duplicates_routes.route("/duplicates", methods=["GET"])
+@login_required
+def get_duplicate_clusters():
+    """Lists clusters of likely duplicate contacts awaiting review, with pagination."""
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    try:
+        offset = int(request.args.get("offset", 0))
+        limit = int(request.args.get("limit", 20))
+
+        cursor.execute(
+            "SELECT contact_id_a, contact_id_b, score FROM duplicate_pairs WHERE status = 'pending'"
+        )
+        clusters = build_clusters(cursor.fetchall())
+        page = clusters[offset : offset + limit]
+
+        page_ids = [contact_id for cluster in page for contact_id in cluster["contact_ids"]]
+        cursor.execute(
+            "SELECT * FROM contacts WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(page_ids),),
+        )
+        contacts = {row["id"]: dict(row) for row in cursor.fetchall()}
+        for cluster in page:
+            cluster["contacts"] = [
+                contacts[contact_id]
+                for contact_id in cluster["contact_ids"]
+                if contact_id in contacts
+            ]
+
+        cursor.execute("SELECT COUNT(*) FROM duplicate_queue")
+        queued_count = cursor.fetchone()[0]
+
+        current_app.logger.info("Fetched %d duplicate clusters.", len(page))
+        return (
+            jsonify(
+                {
+                    "clusters": page,
+                    "total_count": len(clusters),
+                    "queued_count": queued_count,
+                    "offset": offset,
+                    "limit": limit,
+                }
+            ),
+            200,
+        )
+    except Exception as e:
+        current_app.logger.error(
+            "Error fetching duplicate clusters: %s", e, exc_info=True
+        )
+        return jsonify({"error": str(e)}), 500
+    finally:
+        conn.close()
+
+
+@duplicates_routes.route("/duplicates/scan", methods=["POST"])
+@login_required
+def scan_duplicates():
+    """Runs the incremental duplicate scan immediately instead of waiting for the scheduler."""
+    try:
+        processed = run_duplicate_scan(current_app.logger)
+        return jsonify({"message": "Duplicate scan completed", "processed": processed}), 200
+    except WriteQueueTimeout:
+        current_app.logger.warning("Duplicate scan failed: Write queue is busy.")
+        return write_busy_response()
+    except Exception as e:
+        current_app.logger.error("Error running duplicate scan: %s", e, exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+
+@duplicates_routes.route("/duplicates/dismiss", methods=["POST"])
+@login_required
+def dismiss_duplicates():
+    """Marks the pairs among the given contacts as not duplicates."""
+    data = request.get_json(silent=True) or {}
+    contact_ids = data.get("contact_ids")
+    if not isinstance(contact_ids, list) or len(contact_ids) < 2:
+        current_app.logger.warning("Dismiss failed: At least two contact ids are required.")
+        return jsonify({"error": "At least two contact ids are required"}), 400
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        ids_json = json.dumps(contact_ids)
+        cursor.execute(
+            """
+            UPDATE duplicate_pairs SET status = 'dismissed'
+            WHERE contact_id_a IN (SELECT value FROM json_each(?))
+              AND contact_id_b IN (SELECT value FROM json_each(?))
+        """,
+            (ids_json, ids_json),
+        )
+        dismissed = cursor.rowcount
+        conn.commit()
+        current_app.logger.info("Dismissed %s duplicate pairs.", dismissed)
+        return jsonify({"message": "Duplicates dismissed", "dismissed_count": dismissed}), 200
+    except Exception as e:
+        conn.rollback()
+        current_app.logger.error("Error dismissing duplicates: %s", e, exc_info=True)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        conn.close()
+
+
+# Write operation, run by the write coordinator (see writer.py); it must not commit
+# or use the request context.
+
+
+def _merge_contacts(cursor, primary_id, duplicate_ids, fields):
+    """Fills the primary contact's empty ``fields`` from the duplicates and deletes them.
+
+    Returns ``(missing_ids, merged, deleted, before, after)``: the merged
+    fields, the deleted rows and the primary contact before and after the
+    merge. Nothing is changed when any contact is missing.
+    """
+    cursor.execute(
+        "SELECT * FROM contacts WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps([primary_id] + duplicate_ids),),
+    )
+    rows = {row["id"]: row for row in cursor.fetchall()}
+    missing = [i for i in [primary_id] + duplicate_ids if i not in rows]
+    if missing:
+        return missing, {}, [], None, None
+
+    primary = rows[primary_id]
+    merged = {}
+    for column in fields:
+        if primary[column]:
+            continue
+        for duplicate_id in duplicate_ids:
+            if rows[duplicate_id][column]:
+                merged[column] = rows[duplicate_id][column]
+                break
+
+    # Delete first so the primary can take over the duplicates' identity keys
+    cursor.execute(
+        "DELETE FROM contacts WHERE id IN (SELECT value FROM json_each(?)) RETURNING *",
+        (json.dumps(duplicate_ids),),
+    )
+    deleted = cursor.fetchall()
+    if merged:
+        set_clause = ", ".join(f"{column} = ?" for column in merged)
+        cursor.execute(
+            f"UPDATE contacts SET {set_clause}, version = version + 1 WHERE id = ?",
+            list(merged.values()) + [primary_id],
+        )
+    cursor.execute(
+        """
+        UPDATE contacts SET identity_key = contact_identity_key(mobile_phone, email)
+        WHERE id = ? AND identity_key IS NULL AND NOT EXISTS (
+            SELECT 1 FROM contacts AS other
+            WHERE other.identity_key = contact_identity_key(contacts.mobile_phone, contacts.email)
+        )
+    """,
+        (primary_id,),
+    )
+    cursor.execute("SELECT * FROM contacts WHERE id = ?", (primary_id,))
+    return [], merged, deleted, primary, cursor.fetchone()
+
+
+@duplicates_routes.route("/duplicates/merge", methods=["POST"])
+@login_required
+def merge_duplicates():
+    """Merges duplicate contacts into a primary contact in a single transaction.
+
+    Empty fields of the primary contact are filled from the duplicates, in the
+    order given, and the duplicates are then deleted.
+    """
+    data = request.get_json(silent=True) or {}
+    primary_id = data.get("primary_id")
+    duplicate_ids = data.get("duplicate_ids")
+
+    if not isinstance(primary_id, int) or not isinstance(duplicate_ids, list) or not duplicate_ids:
+        current_app.logger.warning("Merge failed: primary_id and duplicate_ids are required.")
+        return jsonify({"error": "primary_id and duplicate_ids are required"}), 400
+    if primary_id in duplicate_ids:
+        current_app.logger.warning("Merge failed: primary_id is listed as a duplicate.")
+        return jsonify({"error": "primary_id cannot be one of duplicate_ids"}), 400
+
+    try:
+        missing, merged, deleted, before, after = run_write(
+            _merge_contacts, primary_id, duplicate_ids, MERGE_COLUMNS
+        )
+        if missing:
+            current_app.logger.warning("Merge failed: Contacts %s not found.", missing)
+            return jsonify({"error": f"Contacts not found: {missing}"}), 404
+
+        record_changes("contact", "delete", [(row["id"], row, None) for row in deleted])
+        record_change("contact", "update", primary_id, before=before, after=after)
+
+        current_app.logger.info(
+            "Merged contacts %s into contact %s.", duplicate_ids, primary_id
+        )
+        return (
+            jsonify(
+                {
+                    "message": "Contacts merged successfully",
+                    "id": primary_id,
+                    "merged_fields": sorted(merged),
+                    "deleted_ids": duplicate_ids,
+                }
+            ),
+            200,
+        )
+    except WriteQueueTimeout:
+        current_app.logger.warning("Merge failed: Write queue is busy.")
+        return write_busy_response()
+    except Exception as e:
+        current_app.logger.error("Error merging contacts: %s", e, exc_info=True)
+        return jsonify({"error": str(e)}), 500
@@ -1,7 +1,13 @@
 from flask import Blueprint, request, jsonify, current_app, session
-from werkzeug.security import generate_password_hash, check_password_hash
-from auth import login_required, admin_required
+from audit import REDACTED, record_change
+from auth import login_required, admin_required, invalidate_user_authorization
 from database import get_db_connection
+from passwords import (
+    PasswordHasherBusy,
+    hash_password,
+    password_busy_response,
+    verify_password,
+)
 import sqlite3
 
 users_routes = Blueprint("users_routes", __name__)
@@ -31,28 +37,34 @@ def handle_users():
             cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
             if cursor.fetchone():
                 current_app.logger.warning(
-                    f"User creation failed: Username '{username}' already exists."
+                    "User creation failed: Username '%s' already exists.", username
                 )
                 return jsonify({"error": "Username already exists"}), 409
 
             # Hash the password securely
-            password_hash = generate_password_hash(password)
+            password_hash = hash_password(password)
 
             cursor.execute(
-                "INSERT INTO users (username, password, is_admin) VALUES (?, ?, ?)",
+                "INSERT INTO users (username, password, is_admin) VALUES (?, ?, ?) "
+                "RETURNING id, username, is_admin",
                 (username, password_hash, 1 if role == "admin" else 0),
             )
+            created = cursor.fetchone()
             conn.commit()
-            current_app.logger.info(f"User '{username}' created successfully.")
+            record_change("user", "create", created["id"], after=created)
+            current_app.logger.info("User '%s' created successfully.", username)
             return (
                 jsonify(
-                    {"message": "User created successfully", "id": cursor.lastrowid}
+                    {"message": "User created successfully", "id": created["id"]}
                 ),
                 201,
             )
+        except PasswordHasherBusy as e:
+            current_app.logger.warning("User creation rejected: %s", e)
+            return password_busy_response()
         except Exception as e:
             conn.rollback()
-            current_app.logger.error(f"Error creating user: {e}", exc_info=True)
+            current_app.logger.error("Error creating user: %s", e, exc_info=True)
             return jsonify({"error": str(e)}), 500
         finally:
             conn.close()
@@ -70,7 +82,7 @@ def handle_users():
             current_app.logger.info("Fetched all users.")
             return jsonify(users_list), 200
         except Exception as e:
-            current_app.logger.error(f"Error fetching all users: {e}", exc_info=True)
+            current_app.logger.error("Error fetching all users: %s", e, exc_info=True)
             return jsonify({"error": str(e)}), 500
         finally:
             conn.close()
@@ -94,14 +106,14 @@ def handle_single_user(user_id):
                 user_dict = dict(user)
                 # Convert is_admin to role for consistency
                 user_dict['role'] = 'admin' if user_dict['is_admin'] else 'normal'
-                current_app.logger.info(f"Fetched user with ID {user_id}.")
+                current_app.logger.info("Fetched user with ID %s.", user_id)
                 return jsonify(user_dict), 200
             else:
-                current_app.logger.warning(f"User with ID {user_id} not found.")
+                current_app.logger.warning("User with ID %s not found.", user_id)
                 return jsonify({"error": "User not found"}), 404
         except Exception as e:
             current_app.logger.error(
-                f"Error fetching user {user_id}: {e}", exc_info=True
+                "Error fetching user %s: %s", user_id, e, exc_info=True
             )
             return jsonify({"error": str(e)}), 500
         finally:
@@ -114,11 +126,14 @@ def handle_single_user(user_id):
             password = user_data.get("password")
             role = user_data.get("role")
 
-            # Check if user exists
-            cursor.execute("SELECT id FROM users WHERE id = ?", (user_id,))
-            if not cursor.fetchone():
+            # Check if user exists; the row is kept for the audit trail
+            cursor.execute(
+                "SELECT id, username, password, is_admin FROM users WHERE id = ?", (user_id,)
+            )
+            before = cursor.fetchone()
+            if not before:
                 current_app.logger.warning(
-                    f"Update failed: User with ID {user_id} not found."
+                    "Update failed: User with ID %s not found.", user_id
                 )
                 return jsonify({"error": "User not found"}), 404
 
@@ -130,7 +145,7 @@ def handle_single_user(user_id):
                 )
                 if cursor.fetchone():
                     current_app.logger.warning(
-                        f"Update failed: Username '{username}' already exists."
+                        "Update failed: Username '%s' already exists.", username
                     )
                     return jsonify({"error": "Username already exists"}), 409
 
@@ -144,7 +159,7 @@ def handle_single_user(user_id):
 
             if password:
                 update_fields.append("password = ?")
-                password_hash = generate_password_hash(password)
+                password_hash = hash_password(password)
                 update_values.append(password_hash)
 
             if role:
@@ -153,21 +168,43 @@ def handle_single_user(user_id):
 
             if not update_fields:
                 current_app.logger.warning(
-                    f"Update failed: No valid fields to update for user {user_id}."
+                    "Update failed: No valid fields to update for user %s.", user_id
                 )
                 return jsonify({"error": "No valid fields to update"}), 400
 
+            # A new password or role revokes the user's existing sessions
+            revokes_sessions = bool(password or role)
+            if revokes_sessions:
+                update_fields.append("auth_version = auth_version + 1")
+
             update_values.append(user_id)
-            update_query = f"UPDATE users SET {', '.join(update_fields)} WHERE id = ?"
+            update_query = (
+                f"UPDATE users SET {', '.join(update_fields)} WHERE id = ? "
+                "RETURNING id, username, password, is_admin, auth_version"
+            )
 
             cursor.execute(update_query, update_values)
+            after = cursor.fetchone()
+            auth_version = after["auth_version"]
             conn.commit()
-            current_app.logger.info(f"User with ID {user_id} updated successfully.")
+            # Password hashes are redacted in the audit trail
+            record_change("user", "update", user_id, before=before, after=after)
+            if revokes_sessions:
+                invalidate_user_authorization(user_id)
+                if session.get("user_id") == user_id:
+                    # Keep the admin editing their own account logged in
+                    session["auth_version"] = auth_version
+                    if role:
+                        session["role"] = "admin" if role == "admin" else "normal"
+            current_app.logger.info("User with ID %s updated successfully.", user_id)
             return jsonify({"message": "User updated successfully"}), 200
+        except PasswordHasherBusy as e:
+            current_app.logger.warning("Update of user %s rejected: %s", user_id, e)
+            return password_busy_response()
         except Exception as e:
             conn.rollback()
             current_app.logger.error(
-                f"Error updating user {user_id}: {e}", exc_info=True
+                "Error updating user %s: %s", user_id, e, exc_info=True
             )
             return jsonify({"error": str(e)}), 500
         finally:
@@ -175,22 +212,24 @@ def handle_single_user(user_id):
 
     elif request.method == "DELETE":
         try:
-            # Check if user exists
-            cursor.execute("SELECT id FROM users WHERE id = ?", (user_id,))
-            if not cursor.fetchone():
+            cursor.execute(
+                "DELETE FROM users WHERE id = ? RETURNING id, username, is_admin", (user_id,)
+            )
+            deleted = cursor.fetchone()
+            if not deleted:
                 current_app.logger.warning(
-                    f"Delete failed: User with ID {user_id} not found."
+                    "Delete failed: User with ID %s not found.", user_id
                 )
                 return jsonify({"error": "User not found"}), 404
-
-            cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
             conn.commit()
-            current_app.logger.info(f"User with ID {user_id} deleted successfully.")
+            record_change("user", "delete", user_id, before=deleted)
+            invalidate_user_authorization(user_id)
+            current_app.logger.info("User with ID %s deleted successfully.", user_id)
             return jsonify({"message": "User deleted successfully"}), 200
         except Exception as e:
             conn.rollback()
             current_app.logger.error(
-                f"Error deleting user {user_id}: {e}", exc_info=True
+                "Error deleting user %s: %s", user_id, e, exc_info=True
             )
             return jsonify({"error": str(e)}), 500
         finally:
@@ -211,7 +250,7 @@ def change_user_password(user_id):
         user = cursor.fetchone()
         if not user:
             current_app.logger.warning(
-                f"Password change failed: User with ID {user_id} not found."
+                "Password change failed: User with ID %s not found.", user_id
             )
             return jsonify({"error": "User not found"}), 404
 
@@ -221,7 +260,9 @@ def change_user_password(user_id):
 
         if current_user_id != user_id and current_user_role != "admin":
             current_app.logger.warning(
-                f"Password change failed: User {current_user_id} tried to change password for user {user_id}."
+                "Password change failed: User %s tried to change password for user %s.",
+                current_user_id,
+                user_id,
             )
             return jsonify({"error": "Permission denied"}), 403
 
@@ -243,26 +284,38 @@ def change_user_password(user_id):
                 (user_id,),
             )
             stored_hash = cursor.fetchone()
-            if not stored_hash or not check_password_hash(stored_hash["password"], current_password):
+            if not stored_hash or not verify_password(stored_hash["password"], current_password)[0]:
                 current_app.logger.warning(
-                    f"Password change failed: Incorrect current password for user {user_id}."
+                    "Password change failed: Incorrect current password for user %s.",
+                    user_id,
                 )
                 return jsonify({"error": "Current password is incorrect"}), 400
 
         # Hash the new password securely
-        new_password_hash = generate_password_hash(new_password)
+        new_password_hash = hash_password(new_password)
 
         cursor.execute(
-            "UPDATE users SET password = ? WHERE id = ?",
+            "UPDATE users SET password = ?, auth_version = auth_version + 1 WHERE id = ? RETURNING auth_version",
             (new_password_hash, user_id),
         )
+        auth_version = cursor.fetchone()["auth_version"]
         conn.commit()
-        current_app.logger.info(f"Password changed successfully for user {user_id}.")
+        record_change("user", "update", user_id, details={"password": [REDACTED, REDACTED]})
+        # Other sessions of this user are revoked; the one that changed the password stays
+        invalidate_user_authorization(user_id)
+        if current_user_id == user_id:
+            session["auth_version"] = auth_version
+        current_app.logger.info("Password changed successfully for user %s.", user_id)
         return jsonify({"message": "Password changed successfully"}), 200
+    except PasswordHasherBusy as e:
+        current_app.logger.warning(
+            "Password change for user %s rejected: %s", user_id, e
+        )
+        return password_busy_response()
     except Exception as e:
         conn.rollback()
         current_app.logger.error(
-            f"Error changing password for user {user_id}: {e}", exc_info=True
+            "Error changing password for user %s: %s", user_id, e, exc_info=True
         )
         return jsonify({"error": str(e)}), 500
     finally:
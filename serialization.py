@@ -0,0 +1,119 @@
+import json
+from functools import lru_cache
+from json.encoder import encode_basestring
+
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+
+from config import JSON_ENCODER
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+if JSON_ENCODER == "orjson" and orjson is None:
+    raise RuntimeError("PHONEBOOK_JSON_ENCODER=orjson but orjson is not installed")
+
+# orjson is used when installed, unless the stdlib encoder is forced
+USE_ORJSON = orjson is not None and JSON_ENCODER != "json"
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider that encodes with orjson when it is available.
+
+    Keys are not sorted and non-ASCII text is emitted as UTF-8 rather than
+    ``\\uXXXX`` escapes, which keeps Persian payloads about a third smaller.
+    """
+
+    sort_keys = False
+    ensure_ascii = False
+
+    def dumps(self, obj, **kwargs):
+        if USE_ORJSON and not kwargs:
+            try:
+                return orjson.dumps(obj, default=self.default).decode()
+            except TypeError:
+                # e.g. integers beyond 64 bits; the stdlib encoder handles them
+                pass
+        kwargs.setdefault("default", self.default)
+        kwargs.setdefault("ensure_ascii", self.ensure_ascii)
+        kwargs.setdefault("sort_keys", self.sort_keys)
+        return json.dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if USE_ORJSON and not (self._app.debug or self.compact is False):
+            try:
+                body = orjson.dumps(obj, default=self.default)
+            except TypeError:
+                pass
+            else:
+                return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+        return super().response(obj)
+
+
+def _encode_value(value):
+    # SQLite only returns None, int, float, str and bytes
+    if value is None:
+        return "null"
+    cls = value.__class__
+    if cls is str:
+        return encode_basestring(value)
+    if cls is int:
+        return int.__repr__(value)
+    return current_app.json.dumps(value)
+
+
+class RowEncoder:
+    """Encodes query rows as a JSON array of objects for a fixed column list.
+
+    The object layout is compiled once into a %-format template, so each row
+    is formatted straight from its values without an intermediate dict. With
+    orjson, zipping the values into dicts inside its C encoder is faster
+    still, so that path is used instead (see ``bench/json_encoding.py``).
+    """
+
+    def __init__(self, columns, use_orjson=USE_ORJSON):
+        self.columns = tuple(columns)
+        self.use_orjson = use_orjson
+        self._template = (
+            "{"
+            + ",".join(
+                encode_basestring(column).replace("%", "%%") + ":%s" for column in self.columns
+            )
+            + "}"
+        )
+
+    def encode(self, rows):
+        """Returns the rows (sqlite3.Row objects or tuples) as JSON text."""
+        if self.use_orjson:
+            columns = self.columns
+            return orjson.dumps([dict(zip(columns, row)) for row in rows]).decode()
+        template = self._template
+        return "[" + ",".join([template % tuple(map(_encode_value, row)) for row in rows]) + "]"
+
+
+@lru_cache(maxsize=64)
+def row_encoder(columns):
+    """Returns the cached RowEncoder of a column tuple."""
+    return RowEncoder(columns)
+
+
+def encode_rows(cursor, rows):
+    """Encodes rows fetched from ``cursor`` using its result columns."""
+    return row_encoder(tuple(column[0] for column in cursor.description)).encode(rows)
+
+
+def rows_response(rows_json, key=None, **fields):
+    """Builds a JSON response around rows already encoded by ``encode_rows``.
+
+    Without ``key`` the body is the array of rows. With it, the body is an
+    object holding the array under ``key`` followed by the extra ``fields``.
+    """
+    body = rows_json
+    if key is not None:
+        envelope = current_app.json.dumps(fields) if fields else "{}"
+        separator = "," if fields else ""
+        body = "{" + encode_basestring(key) + ":" + rows_json + separator + envelope[1:]
+    return current_app.response_class(body + "\n", mimetype="application/json")
@@ -0,0 +1,212 @@
+"""Production entry point: serves the application with waitress.
+
+    python server.py --threads 8 --no-browser
+    python server.py --workers 4 --port 8080 --no-browser
+
+With --workers greater than one, the listening socket is bound once and shared
+by that many worker processes, each running its own waitress thread pool, so
+request handling can use more than one CPU core.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+logger = logging.getLogger("phonedash.server")
+
+# Seconds between checks for worker processes that exited unexpectedly
+SUPERVISOR_INTERVAL = 1.0
+
+
+def _export_thread_count(argv=None):
+    # config.py sizes admission lanes and the password queue from the thread count
+    # when it is imported, so --threads must reach it first; spawned workers inherit it
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--threads", type=int)
+    threads = parser.parse_known_args(argv)[0].threads
+    if threads is not None:
+        os.environ["PHONEBOOK_SERVER_THREADS"] = str(threads)
+
+
+def parse_args(argv=None):
+    from config import (
+        SERVER_BACKLOG,
+        SERVER_CHANNEL_TIMEOUT,
+        SERVER_CONNECTION_LIMIT,
+        SERVER_HOST,
+        SERVER_PORT,
+        SERVER_THREADS,
+    )
+
+    parser = argparse.ArgumentParser(description="Serve the phone book application.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--threads", type=int, default=SERVER_THREADS, help="Worker threads per process")
+    parser.add_argument(
+        "--connection-limit",
+        type=int,
+        default=SERVER_CONNECTION_LIMIT,
+        help="Simultaneous connections accepted per process",
+    )
+    parser.add_argument("--backlog", type=int, default=SERVER_BACKLOG, help="Listen backlog")
+    parser.add_argument(
+        "--channel-timeout",
+        type=int,
+        default=SERVER_CHANNEL_TIMEOUT,
+        help="Seconds an inactive connection is kept open",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes sharing the listening socket",
+    )
+    parser.add_argument(
+        "--browser",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Open the login page in a web browser on startup",
+    )
+    return parser.parse_args(argv)
+
+
+def _waitress_options(args):
+    return {
+        "threads": args.threads,
+        "connection_limit": args.connection_limit,
+        "backlog": args.backlog,
+        "channel_timeout": args.channel_timeout,
+    }
+
+
+def _open_browser(args):
+    # Imported here: spawned workers re-import this module and never open a browser
+    import webbrowser
+
+    host = "127.0.0.1" if args.host in ("0.0.0.0", "::") else args.host
+    webbrowser.open(f"http://{host}:{args.port}/login.html")
+
+
+def run_worker(sock, options, background_jobs):
+    """Entry point of a worker process: loads the application and serves the shared socket."""
+    # Only one process runs the background jobs (duplicate scanner etc.)
+    os.environ["PHONEBOOK_BACKGROUND_JOBS"] = "1" if background_jobs else "0"
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from waitress import serve
+    from app import app
+
+    serve(app, sockets=[sock], **options)
+
+
+def _prepare_database():
+    # Migrations run once here so workers never race each other on schema changes
+    from flask import Flask
+    from database import init_db
+
+    with Flask("phonedash").app_context():
+        init_db()
+
+
+def _prepare_assets():
+    # Built once here so workers find the manifest current instead of each rebuilding it
+    from assets import load_assets
+    from config import ASSET_PIPELINE
+
+    if not ASSET_PIPELINE:
+        return
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    load_assets(os.path.join(package_dir, "static"), os.path.join(package_dir, "templates"))
+
+
+def serve_multiprocess(args):
+    sock = socket.create_server(
+        (args.host, args.port),
+        family=socket.AF_INET6 if ":" in args.host else socket.AF_INET,
+        backlog=args.backlog,
+    )
+    _prepare_database()
+    _prepare_assets()
+
+    # Spawned workers start from a clean interpreter, so no threads or locks are inherited
+    context = multiprocessing.get_context("spawn")
+    options = _waitress_options(args)
+
+    def start(index):
+        process = context.Process(
+            target=run_worker,
+            args=(sock, options, index == 0),
+            name=f"phonedash-worker-{index}",
+        )
+        process.start()
+        logger.info("Started worker %d (pid %s).", index, process.pid)
+        return process
+
+    workers = [start(index) for index in range(args.workers)]
+    logger.info(
+        "Serving on http://%s:%s with %d workers x %d threads.",
+        args.host,
+        args.port,
+        args.workers,
+        args.threads,
+    )
+    if args.browser:
+        _open_browser(args)
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        while not stopping:
+            time.sleep(SUPERVISOR_INTERVAL)
+            for index, process in enumerate(workers):
+                if not process.is_alive() and not stopping:
+                    logger.warning(
+                        "Worker %d (pid %s) exited with code %s; restarting.",
+                        index,
+                        process.pid,
+                        process.exitcode,
+                    )
+                    workers[index] = start(index)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info("Stopping workers.")
+        for process in workers:
+            process.terminate()
+        for process in workers:
+            process.join(timeout=10)
+        sock.close()
+
+
+def serve_single_process(args):
+    from waitress import serve
+    from app import app
+
+    if args.browser:
+        _open_browser(args)
+    serve(app, host=args.host, port=args.port, **_waitress_options(args))
+
+
+def main(argv=None):
+    _export_thread_count(argv)
+    args = parse_args(argv)
+    from config import setup_logging
+
+    setup_logging()
+    if args.workers > 1:
+        serve_multiprocess(args)
+    else:
+        serve_single_process(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+import itertools
+import logging
+import sqlite3
+import threading
+import time
+
+from flask import has_request_context, request, session
+
+from config import (
+    DATABASE,
+    READ_SNAPSHOT,
+    READ_SNAPSHOT_MAX_STALENESS,
+    READ_SNAPSHOT_POLL_INTERVAL,
+    READ_SNAPSHOT_REFRESH_DELAY,
+)
+from database import get_db_connection
+from metrics import REGISTRY
+
+logger = logging.getLogger("phonedash.snapshot")
+
+SNAPSHOT_READS = REGISTRY.counter(
+    "phonedash_snapshot_reads_total",
+    "Read connections handed out, by source (snapshot or disk).",
+    ("source",),
+)
+SNAPSHOT_REFRESHES = REGISTRY.counter(
+    "phonedash_snapshot_refreshes_total",
+    "Read snapshot reloads from the database file, by outcome.",
+    ("outcome",),
+)
+SNAPSHOT_REFRESH_TIME = REGISTRY.histogram(
+    "phonedash_snapshot_refresh_seconds",
+    "Time taken to copy the database file into a new read snapshot, in seconds.",
+)
+SNAPSHOT_AGE = REGISTRY.gauge(
+    "phonedash_snapshot_age_seconds",
+    "Age of the current read snapshot when it was last checked, in seconds.",
+)
+
+_generation_numbers = itertools.count(1)
+
+
+class SnapshotGeneration:
+    """One in-memory copy of the database file.
+
+    The copy is a named shared-cache memory database, so every request can open
+    its own cheap connection to it. The keeper connection holds it in memory;
+    once the keeper is closed it is freed as soon as the last reader closes.
+    Connections being opened pin the generation, so a retired copy is not
+    freed (and its URI silently reopened as an empty database) mid-open.
+    """
+
+    def __init__(self):
+        self.uri = f"file:phonedash-snapshot-{next(_generation_numbers)}?mode=memory&cache=shared"
+        self.loaded_at = None
+        self._keeper = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        self._pin_lock = threading.Lock()
+        self._opening = 0
+        self._retired = False
+
+    def load(self):
+        """Copies the database file into this generation with the backup API."""
+        source = sqlite3.connect(DATABASE)
+        try:
+            # One step: a WAL reader does not block writers, while a stepped copy
+            # would restart every time another connection committed in between
+            source.backup(self._keeper)
+        finally:
+            source.close()
+        self.loaded_at = time.monotonic()
+
+    def connect(self):
+        """Returns a read-only connection to this copy, or None once it has been retired."""
+        with self._pin_lock:
+            if self._retired:
+                return None
+            self._opening += 1
+        try:
+            conn = get_db_connection(self.uri, uri=True)
+            conn.execute("PRAGMA query_only = 1")
+            return conn
+        finally:
+            with self._pin_lock:
+                self._opening -= 1
+                release = self._retired and not self._opening
+            if release:
+                self._keeper.close()
+
+    def close(self):
+        """Retires this copy; it is freed once no connection is being opened or open."""
+        with self._pin_lock:
+            self._retired = True
+            release = not self._opening
+        if release:
+            self._keeper.close()
+
+
+class ReadSnapshot:
+    """Serves reads from an in-memory copy of the database that is reloaded after writes.
+
+    Changes are noticed through ``PRAGMA data_version``, which covers writes made
+    by this process, by other worker processes and by background jobs alike. A
+    reload is delayed by READ_SNAPSHOT_REFRESH_DELAY so bursts of writes are
+    coalesced into one copy. Until it completes, reads keep using the previous
+    copy for at most READ_SNAPSHOT_MAX_STALENESS seconds and go to disk after
+    that. Users who wrote since the last reload always read from disk, so
+    they see their own changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._current = None
+        # monotonic times of the first and the latest change not yet in the snapshot
+        self._stale_since = None
+        self._changed_at = None
+        self._recent_writers = {}
+        self._thread = None
+        self.last_error = None
+
+    def start(self):
+        self._refresh()
+        self._thread = threading.Thread(target=self._watch, name="read-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def mark_stale(self, user_id=None):
+        """Records a write made by this process so the snapshot is reloaded promptly."""
+        with self._lock:
+            now = self._record_change()
+            if user_id is not None:
+                self._recent_writers[user_id] = now
+        self._wake.set()
+
+    def _record_change(self):
+        # Called with the lock held
+        now = time.monotonic()
+        if self._stale_since is None:
+            self._stale_since = now
+        self._changed_at = now
+        return now
+
+    def connect(self, user_id=None):
+        """Returns a connection to the snapshot, or None if the read must go to disk."""
+        now = time.monotonic()
+        with self._lock:
+            if self._current is None:
+                return None
+            if self._stale_since is not None:
+                if now - self._stale_since > READ_SNAPSHOT_MAX_STALENESS:
+                    return None
+                if user_id is not None and user_id in self._recent_writers:
+                    return None
+            current = self._current
+        # Opened outside the lock so readers never queue behind each other or a reload;
+        # a generation retired in between returns None and the read goes to disk
+        return current.connect()
+
+    def status(self):
+        with self._lock:
+            current = self._current
+            stale_since = self._stale_since
+        now = time.monotonic()
+        return {
+            "enabled": True,
+            "age_seconds": round(now - current.loaded_at, 3) if current else None,
+            "stale_seconds": round(now - stale_since, 3) if stale_since is not None else None,
+            "max_staleness_seconds": READ_SNAPSHOT_MAX_STALENESS,
+            "last_error": self.last_error,
+        }
+
+    def _refresh(self):
+        with self._lock:
+            # Writes committed from here on are not guaranteed to be in the new copy
+            started_at = time.monotonic()
+            writers_before = dict(self._recent_writers)
+        generation = SnapshotGeneration()
+        start = time.perf_counter()
+        try:
+            generation.load()
+        except sqlite3.Error as e:
+            generation.close()
+            SNAPSHOT_REFRESHES.inc(("error",))
+            self.last_error = str(e)
+            logger.error("Read snapshot refresh failed: %s", e, exc_info=True)
+            return
+        elapsed = time.perf_counter() - start
+        SNAPSHOT_REFRESH_TIME.observe(elapsed)
+        SNAPSHOT_REFRESHES.inc(("ok",))
+        self.last_error = None
+
+        with self._lock:
+            previous, self._current = self._current, generation
+            if self._changed_at is not None and self._changed_at <= started_at:
+                self._stale_since = self._changed_at = None
+            elif self._changed_at is not None:
+                # Changed again during the copy: stale from that change on
+                self._stale_since = self._changed_at
+            for user_id, wrote_at in writers_before.items():
+                if wrote_at <= started_at and self._recent_writers.get(user_id) == wrote_at:
+                    del self._recent_writers[user_id]
+        if previous is not None:
+            # Readers still opening a connection to it keep it alive until they are done
+            previous.close()
+        logger.debug("Read snapshot reloaded in %.3fs.", elapsed)
+
+    def _watch(self):
+        watcher = sqlite3.connect(DATABASE)
+        try:
+            data_version = watcher.execute("PRAGMA data_version").fetchone()[0]
+            while not self._stop.is_set():
+                self._wake.wait(READ_SNAPSHOT_POLL_INTERVAL)
+                self._wake.clear()
+                if self._stop.is_set():
+                    break
+
+                version = watcher.execute("PRAGMA data_version").fetchone()[0]
+                if version != data_version:
+                    data_version = version
+                    with self._lock:
+                        self._record_change()
+                with self._lock:
+                    stale = self._stale_since is not None
+                if stale:
+                    # Let a burst of writes finish before copying the file
+                    if self._stop.wait(READ_SNAPSHOT_REFRESH_DELAY):
+                        break
+                    data_version = watcher.execute("PRAGMA data_version").fetchone()[0]
+                    self._refresh()
+                with self._lock:
+                    current = self._current
+                if current is not None:
+                    SNAPSHOT_AGE.set(time.monotonic() - current.loaded_at)
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error("Read snapshot watcher stopped: %s", e, exc_info=True)
+            # Without the watcher the snapshot could go stale unnoticed
+            with self._lock:
+                self._current = None
+        finally:
+            watcher.close()
+
+
+_snapshot = None
+
+
+def _current_user_id():
+    if has_request_context():
+        return session.get("user_id")
+    return None
+
+
+def get_read_connection():
+    """Returns a connection for read-only queries.
+
+    With the read snapshot enabled and fresh enough, the connection points at
+    the in-memory copy; otherwise it is a normal connection to the database
+    file. Callers must not write through it.
+    """
+    if _snapshot is not None:
+        conn = _snapshot.connect(_current_user_id())
+        if conn is not None:
+            SNAPSHOT_READS.inc(("snapshot",))
+            return conn
+        SNAPSHOT_READS.inc(("disk",))
+    return get_db_connection()
+
+
+def read_snapshot_status():
+    """Returns the read snapshot's state for the admin API."""
+    if _snapshot is None:
+        return {"enabled": False}
+    return _snapshot.status()
+
+
+def init_read_snapshot(app):
+    """Loads the read snapshot and starts its watcher, if enabled in the configuration."""
+    global _snapshot
+    if not READ_SNAPSHOT:
+        return
+
+    _snapshot = ReadSnapshot()
+    start = time.perf_counter()
+    _snapshot.start()
+    app.logger.info("Read snapshot loaded in %.3fs.", time.perf_counter() - start)
+
+    @app.after_request
+    def mark_snapshot_stale(response):
+        # Writes by this process trigger a prompt reload and read-your-writes for the user
+        if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+            _snapshot.mark_stale(_current_user_id())
+        return response
@@ -0,0 +1,138 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+from flask import current_app, has_app_context
+
+from config import SLOW_QUERY_THRESHOLD_MS, SQL_TRACE_MAX_SHAPES
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+# Statements EXPLAIN QUERY PLAN can describe
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+_lock = threading.Lock()
+_shapes = {}
+_started_at = time.time()
+
+
+def _logger():
+    return current_app.logger if has_app_context() else logging.getLogger(__name__)
+
+
+def normalize_sql(sql):
+    """Reduces a statement to its shape: literals become ? and whitespace is collapsed."""
+    shape = _STRING_LITERAL.sub("?", sql)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _PLACEHOLDER_LIST.sub("(?, ...)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+class StatementTrace:
+    """Timing of one statement execution, including the fetches that follow it."""
+
+    __slots__ = ("connection", "sql", "parameters", "shape", "elapsed", "slow_logged")
+
+    def __init__(self, connection, sql, parameters, elapsed):
+        self.connection = connection
+        self.sql = sql
+        self.parameters = parameters
+        self.shape = normalize_sql(sql)
+        self.elapsed = elapsed
+        self.slow_logged = False
+
+
+def _update_shape(trace, elapsed, executions):
+    with _lock:
+        stats = _shapes.get(trace.shape)
+        if stats is None:
+            if len(_shapes) >= SQL_TRACE_MAX_SHAPES:
+                return
+            stats = _shapes[trace.shape] = {
+                "count": 0,
+                "total_seconds": 0.0,
+                "max_seconds": 0.0,
+                "slow_count": 0,
+                "last_plan": None,
+            }
+        stats["count"] += executions
+        stats["total_seconds"] += elapsed
+        stats["max_seconds"] = max(stats["max_seconds"], trace.elapsed)
+
+
+def _check_slow(trace):
+    if trace.slow_logged or trace.elapsed * 1000 < SLOW_QUERY_THRESHOLD_MS:
+        return
+    trace.slow_logged = True
+    plan = explain_query_plan(trace.connection, trace.sql, trace.parameters)
+    with _lock:
+        stats = _shapes.get(trace.shape)
+        if stats is not None:
+            stats["slow_count"] += 1
+            if plan:
+                stats["last_plan"] = plan
+    _logger().warning(
+        f"Slow query ({trace.elapsed * 1000:.1f} ms): {trace.shape}"
+        + (f"\n  Plan: {' | '.join(plan)}" if plan else "")
+    )
+
+
+def explain_query_plan(connection, sql, parameters):
+    """Returns the EXPLAIN QUERY PLAN lines of a statement, or None if unavailable."""
+    if parameters is None or not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return None
+    try:
+        # A plain cursor, so explaining is not itself traced
+        cursor = sqlite3.Connection.cursor(connection)
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+        return [row[3] for row in cursor.fetchall()]
+    except sqlite3.Error:
+        return None
+
+
+def trace_statement(connection, sql, parameters, elapsed, executions=1):
+    """Records one execute() call and returns its trace for later fetch timing."""
+    trace = StatementTrace(connection, sql, parameters, elapsed)
+    _update_shape(trace, elapsed, executions)
+    _check_slow(trace)
+    return trace
+
+
+def trace_fetch(trace, elapsed):
+    """Adds time spent fetching rows to the statement that produced them."""
+    if trace is None:
+        return
+    trace.elapsed += elapsed
+    _update_shape(trace, elapsed, 0)
+    _check_slow(trace)
+
+
+def query_stats(limit=50, order_by="total"):
+    """Returns the aggregated statement shapes, most expensive first."""
+    with _lock:
+        rows = [dict(stats, shape=shape) for shape, stats in _shapes.items()]
+    for row in rows:
+        row["avg_ms"] = round(row["total_seconds"] * 1000 / row["count"], 3) if row["count"] else 0.0
+        row["total_ms"] = round(row.pop("total_seconds") * 1000, 3)
+        row["max_ms"] = round(row.pop("max_seconds") * 1000, 3)
+    sort_key = {"total": "total_ms", "count": "count", "avg": "avg_ms", "max": "max_ms"}
+    rows.sort(key=lambda row: row[sort_key.get(order_by, "total_ms")], reverse=True)
+    return {
+        "since": _started_at,
+        "shape_count": len(rows),
+        "slow_query_threshold_ms": SLOW_QUERY_THRESHOLD_MS,
+        "queries": rows[:limit],
+    }
+
+
+def reset_query_stats():
+    """Clears the aggregated statement shapes."""
+    global _started_at
+    with _lock:
+        _shapes.clear()
+        _started_at = time.time()
@@ -0,0 +1,220 @@
+"""Startup timing: how long a process takes to become ready and to serve its first request.
+
+app.py marks the end of each startup phase; the report is logged once the
+application is ready and served by GET /api/admin/startup. For a breakdown of
+import time by module, run
+
+    python startup.py [--top 20]
+
+which starts the application in a fresh interpreter with ``-X importtime``,
+sends it one request and prints both reports.
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+
+def _process_age():
+    """Seconds since the process was created (Linux only), else None."""
+    try:
+        with open("/proc/self/stat", encoding="ascii") as f:
+            # Fields after the parenthesised command name; starttime is field 22
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", encoding="ascii") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# Taken before Flask is imported below: app.py imports this module first, so this
+# is when the application started loading and everything before is interpreter start
+_loading_started = time.perf_counter()
+_interpreter_seconds = _process_age()
+
+from flask import g, request  # noqa: E402
+
+from metrics import REGISTRY  # noqa: E402
+
+logger = logging.getLogger("phonedash.startup")
+
+STARTUP_SECONDS = REGISTRY.gauge(
+    "phonedash_startup_seconds",
+    "Time taken by each startup phase of this process, in seconds.",
+    ("phase",),
+)
+FIRST_REQUEST_SECONDS = REGISTRY.gauge(
+    "phonedash_first_request_seconds",
+    "Time from process start until the first request arrived, in seconds.",
+)
+if _interpreter_seconds is not None:
+    STARTUP_SECONDS.set(_interpreter_seconds, ("interpreter",))
+
+
+_last_mark = _loading_started
+_phases = []
+_ready_at = None
+_first_request = None
+_first_request_lock = threading.Lock()
+
+
+def _since_start(moment):
+    """Seconds from process start (or from loading, if unknown) to a perf_counter value."""
+    return (_interpreter_seconds or 0.0) + moment - _loading_started
+
+
+def mark_startup_phase(name):
+    """Records the time since the previous mark as startup phase ``name``."""
+    global _last_mark
+    now = time.perf_counter()
+    _phases.append((name, now - _last_mark))
+    STARTUP_SECONDS.set(now - _last_mark, (name,))
+    _last_mark = now
+
+
+def startup_report():
+    """Returns the startup phases and first request timing of this process, in milliseconds."""
+    phases = []
+    if _interpreter_seconds is not None:
+        phases.append({"phase": "interpreter", "ms": round(_interpreter_seconds * 1000, 1)})
+    phases += [{"phase": name, "ms": round(seconds * 1000, 1)} for name, seconds in _phases]
+    return {
+        "pid": os.getpid(),
+        "phases": phases,
+        "ready_ms": round(_since_start(_ready_at) * 1000, 1) if _ready_at else None,
+        "first_request": dict(_first_request) if _first_request else None,
+    }
+
+
+def _format_phases(report):
+    return ", ".join(f"{phase['phase']} {phase['ms']:.0f} ms" for phase in report["phases"])
+
+
+def init_startup_report(app):
+    """Marks the application ready, logs the startup report and times the first request."""
+    global _ready_at
+    _ready_at = time.perf_counter()
+    STARTUP_SECONDS.set(_since_start(_ready_at), ("ready",))
+    report = startup_report()
+    logger.info("Ready in %.0f ms (%s).", report["ready_ms"], _format_phases(report))
+
+    @app.before_request
+    def time_first_request():
+        global _first_request
+        if _first_request is not None:
+            return
+        with _first_request_lock:
+            if _first_request is not None:
+                return
+            arrived = time.perf_counter()
+            _first_request = {
+                "method": request.method,
+                "path": request.path,
+                "after_start_ms": round(_since_start(arrived) * 1000, 1),
+                "duration_ms": None,
+            }
+            g.first_request_arrived = arrived
+        FIRST_REQUEST_SECONDS.set(_since_start(arrived))
+
+    @app.teardown_request
+    def finish_first_request(exc):
+        arrived = g.pop("first_request_arrived", None)
+        if arrived is None:
+            return
+        _first_request["duration_ms"] = round((time.perf_counter() - arrived) * 1000, 1)
+        logger.info(
+            "First request %s %s arrived %.0f ms after start and took %.0f ms.",
+            _first_request["method"],
+            _first_request["path"],
+            _first_request["after_start_ms"],
+            _first_request["duration_ms"],
+        )
+
+
+# Run in a fresh interpreter by main(): loads the application, sends one request
+# and prints the report as the last line of its output
+_PROBE = """
+import json, sys
+sys.path.insert(0, {package_dir!r})
+from app import app
+app.test_client().get("/login.html")
+from startup import startup_report
+print(json.dumps(startup_report()))
+"""
+
+
+def parse_importtime(lines):
+    """Returns the self time, in microseconds, of each top-level package loaded by app.py.
+
+    ``-X importtime`` prints a module after the modules it imported, so the
+    lines since the previous top-level entry up to ``app`` are app.py's whole
+    import tree. Summing self times by package counts every module once.
+    """
+    packages = {}
+    for line in lines:
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            continue  # The header line
+        module = name.strip()
+        package = module.split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+        if name.startswith(" ") and not name.startswith("  "):
+            # A top-level import: app.py's tree ends here, any other starts one
+            if module == "app":
+                return packages
+            packages = {}
+    return {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Start the application in a fresh interpreter and report where startup time goes."
+    )
+    parser.add_argument("--top", type=int, default=15, help="Packages to list")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ, PHONEBOOK_BACKGROUND_JOBS="0", PHONEBOOK_LOG_LEVEL="WARNING")
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(package_dir=package_dir)],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        print(result.stderr, file=sys.stderr)
+        return 1
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+
+    print(f"Startup of process {report['pid']} (run under -X importtime, which adds overhead)")
+    for phase in report["phases"]:
+        print(f"  {phase['phase']:<20} {phase['ms']:8.1f} ms")
+    print(f"  {'ready':<20} {report['ready_ms']:8.1f} ms")
+    first = report["first_request"]
+    if first:
+        print(
+            f"  {'first request':<20} {first['after_start_ms']:8.1f} ms after start"
+            f" ({first['method']} {first['path']}, {first['duration_ms']:.1f} ms)"
+        )
+    print(f"  {'process total':<20} {elapsed * 1000:8.1f} ms including shutdown")
+
+    packages = parse_importtime(result.stderr.splitlines())
+    total = sum(packages.values())
+    print(f"\nImport time by package ({total / 1000:.1f} ms for app.py and everything it loads)")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[: args.top]:
+        print(f"  {package:<32} {self_us / 1000:8.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -76,37 +76,47 @@ document.addEventListener('DOMContentLoaded', () => {
     // Call the function when the page loads
     highlightActiveSidebarLink();
 
+    const companySearchInput = document.getElementById('companySearchInput');
+    const loadMoreCompaniesBtn = document.getElementById('loadMoreCompaniesBtn');
+
+    const COMPANY_PAGE_SIZE = 100; // Companies fetched per page
+    const SEARCH_DELAY_MS = 300; // Debounce before searching on the server
+
     let currentSortColumn = null;
     let currentSortDirection = 'asc'; // 'asc' or 'desc'
+    let nextCursor = null; // Keyset cursor of the next page, null when all rows are shown
+    let fetchGeneration = 0; // Discards responses that a newer search or sort has superseded
 
-    // Function to fetch and display companies
-    async function fetchCompanies() {
+    // Function to fetch and display companies. Searching, sorting and paging happen on the server;
+    // with append=true the next page is added below the rows already shown.
+    async function fetchCompanies(append = false) {
+        const generation = append ? fetchGeneration : ++fetchGeneration;
         try {
-            const response = await fetch('/api/companies');
-            let companies = await response.json();
-
-            // Sort companies if a sort column is active
-            if (currentSortColumn) {
-                companies.sort((a, b) => {
-                    const valA = a[currentSortColumn] || '';
-                    const valB = b[currentSortColumn] || '';
-
-                    if (typeof valA === 'string' && typeof valB === 'string') {
-                        // Case-insensitive string comparison for Persian characters
-                        const comparison = valA.localeCompare(valB, 'fa', { sensitivity: 'base' });
-                        return currentSortDirection === 'asc' ? comparison : -comparison;
-                    } else {
-                        // Fallback for non-string or mixed types
-                        if (valA < valB) return currentSortDirection === 'asc' ? -1 : 1;
-                        if (valA > valB) return currentSortDirection === 'asc' ? 1 : -1;
-                        return 0;
-                    }
-                });
+            const params = new URLSearchParams({
+                q: companySearchInput.value.trim(),
+                limit: COMPANY_PAGE_SIZE,
+                sort_by: currentSortColumn || '',
+                sort_direction: currentSortDirection
+            });
+            if (append && nextCursor) {
+                params.set('cursor', nextCursor);
             }
+            const response = await fetch(`/api/companies?${params.toString()}`);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            const data = await response.json();
+            if (generation !== fetchGeneration) return;
 
-            companyListBody.innerHTML = ''; // Clear existing rows
+            const companies = data.companies;
+            nextCursor = data.next_cursor;
+            loadMoreCompaniesBtn.classList.toggle('hidden', !nextCursor);
 
-            if (companies.length === 0) {
+            if (!append) {
+                companyListBody.innerHTML = ''; // Clear existing rows
+            }
+
+            if (companies.length === 0 && !append) {
                 const noCompaniesRow = document.createElement('tr');
                 noCompaniesRow.innerHTML = `<td colspan="4" class="py-3 px-6 text-center text-gray-500">هیچ شرکتی یافت نشد.</td>`;
                 companyListBody.appendChild(noCompaniesRow);
@@ -137,23 +147,6 @@ document.addEventListener('DOMContentLoaded', () => {
                 companyListBody.appendChild(row);
             });
 
-            // Add event listeners for edit and delete buttons
-            document.querySelectorAll('.edit-btn').forEach(button => {
-                button.addEventListener('click', (event) => {
-                    const companyId = event.target.closest('button').dataset.id;
-                    console.log('Edit button clicked for company ID:', companyId); // Debugging log
-                    editCompanyDetails(companyId);
-                });
-            });
-
-            document.querySelectorAll('.delete-btn').forEach(button => {
-                button.addEventListener('click', async (event) => {
-                    const companyId = event.target.closest('button').dataset.id;
-                    console.log('Delete button clicked for company ID:', companyId); // Debugging log
-                    showDeleteCompanyConfirmModal(companyId);
-                });
-            });
-
         } catch (error) {
             console.error('Error fetching companies:', error);
             const errorRow = document.createElement('tr');
@@ -162,6 +155,29 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // Edit and delete buttons are handled on the table body, so appended pages need no extra listeners
+    companyListBody.addEventListener('click', (event) => {
+        const button = event.target.closest('button');
+        if (!button) return;
+        const companyId = button.dataset.id;
+        if (button.classList.contains('edit-btn')) {
+            console.log('Edit button clicked for company ID:', companyId); // Debugging log
+            editCompanyDetails(companyId);
+        } else if (button.classList.contains('delete-btn')) {
+            console.log('Delete button clicked for company ID:', companyId); // Debugging log
+            showDeleteCompanyConfirmModal(companyId);
+        }
+    });
+
+    // Search on the server as the user types
+    let searchTimeout;
+    companySearchInput.addEventListener('input', () => {
+        clearTimeout(searchTimeout);
+        searchTimeout = setTimeout(() => fetchCompanies(), SEARCH_DELAY_MS);
+    });
+
+    loadMoreCompaniesBtn.addEventListener('click', () => fetchCompanies(true));
+
     // Event listeners for sortable headers
     document.querySelectorAll('.sortable-header').forEach(button => {
         button.addEventListener('click', (event) => {
@@ -190,7 +206,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 sortIcon.classList.add('desc');
             }
 
-            fetchCompanies(); // Re-fetch and re-render with new sort order
+            fetchCompanies(); // Re-fetch the first page in the new sort order
         });
     });
 
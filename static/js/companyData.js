@@ -1,24 +1,84 @@
 // static/js/companyData.js
-// This module handles fetching and managing company data, including building the hierarchy.
+// This module handles fetching company data: name suggestions for the company inputs
+// and the hierarchy of a single company for the tree diagram.
 
-let allCompaniesData = []; // Store all fetched companies
 let companyHierarchyMap = new Map(); // Stores the processed hierarchy: companyName -> { children: [], parent: null/name }
 
+const SUGGESTION_LIMIT = 20; // Company names offered per keystroke
+const SUGGESTION_DELAY_MS = 250; // Debounce before asking the server for suggestions
+
 /**
- * Fetches all company data from the API.
- * @returns {Promise<Array>} - A promise that resolves to an array of company objects.
+ * Searches company names on the server (prefix match on each word of the normalized name).
+ * @param {string} term - The text typed so far.
+ * @param {number} [limit=SUGGESTION_LIMIT] - Maximum number of names to return.
+ * @returns {Promise<Array<string>>} - A promise that resolves to matching company names.
  */
-export async function fetchAllCompanies() {
+export async function searchCompanyNames(term, limit = SUGGESTION_LIMIT) {
     try {
-        const response = await fetch('/api/companies');
+        const params = new URLSearchParams({
+            fields: 'names',
+            q: term,
+            sort_by: 'company_name',
+            limit: limit
+        });
+        const response = await fetch(`/api/companies?${params.toString()}`);
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
-        allCompaniesData = await response.json();
-        buildCompanyHierarchyMap(allCompaniesData); // Build hierarchy map after fetching
-        return allCompaniesData;
+        const data = await response.json();
+        return data.companies.map(company => company.company_name);
     } catch (error) {
-        console.error('Error fetching all companies:', error);
+        console.error('Error searching companies:', error);
+        return [];
+    }
+}
+
+/**
+ * Fills a <datalist> with company names matching what the user types into an input.
+ * @param {HTMLInputElement} input - The company name input.
+ * @param {HTMLDataListElement} datalist - The datalist attached to the input.
+ */
+export function attachCompanySuggestions(input, datalist) {
+    let timeout;
+    let requestId = 0;
+
+    async function refresh() {
+        const currentRequest = ++requestId;
+        const names = await searchCompanyNames(input.value.trim());
+        if (currentRequest !== requestId) return; // A newer keystroke already asked again
+
+        datalist.innerHTML = '';
+        names.forEach(name => {
+            const option = document.createElement('option');
+            option.value = name;
+            datalist.appendChild(option);
+        });
+    }
+
+    input.addEventListener('input', () => {
+        clearTimeout(timeout);
+        timeout = setTimeout(refresh, SUGGESTION_DELAY_MS);
+    });
+    input.addEventListener('focus', refresh);
+}
+
+/**
+ * Fetches the companies related to a company name and builds their hierarchy.
+ * @param {string} companyName - The company whose hierarchy is needed.
+ * @returns {Promise<Array>} - A promise that resolves to the related company objects.
+ */
+export async function fetchCompanyFamily(companyName) {
+    try {
+        const response = await fetch(`/api/companies/family?name=${encodeURIComponent(companyName)}`);
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        const companies = await response.json();
+        buildCompanyHierarchyMap(companies); // Build hierarchy map after fetching
+        return companies;
+    } catch (error) {
+        console.error('Error fetching company hierarchy:', error);
+        companyHierarchyMap.clear();
         return [];
     }
 }
@@ -109,14 +169,6 @@ export function findCompanyHierarchyRoot(companyName) {
     return currentNode;
 }
 
-/**
- * Gets all currently loaded company data.
- * @returns {Array} - An array of all company objects.
- */
-export function getAllCompaniesData() {
-    return allCompaniesData;
-}
-
 /**
  * Gets the company hierarchy map.
  * @returns {Map} - The company hierarchy map.
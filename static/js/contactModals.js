@@ -2,7 +2,7 @@
 // This module manages the view, edit, and delete modals for contacts.
 
 import { showWarningModal } from './utils.js';
-import { fetchAllCompanies, getAllCompaniesData, getCompanyHierarchyMap, findCompanyHierarchyRoot } from './companyData.js';
+import { attachCompanySuggestions, fetchCompanyFamily, getCompanyHierarchyMap, findCompanyHierarchyRoot } from './companyData.js';
 
 // DOM elements (initialized via init function)
 let viewContactModal;
@@ -10,7 +10,9 @@ let editContactModal;
 let deleteConfirmModal;
 let companyTreeContainer;
 let companyTreeDiv;
-let editMainCompanySelect;
+let editMainCompanyInput;
+let editMainCompanyOptions; // Datalist of company name suggestions
+let editAddNewCompanyBtn;
 let addCompanyModal;
 let companyFormModal; // Form inside addCompanyModal
 let modalCompanyNameInput;
@@ -24,6 +26,10 @@ let refreshContactListCallback = null;
 // Temporary storage for contact ID to delete
 let contactIdToDelete = null;
 
+// Form values and row version of the contact being edited, used to send only changed fields
+let editOriginalValues = {};
+let editContactVersion = null;
+
 /**
  * Initializes the modal module by providing necessary DOM elements and callbacks.
  * This should be called once on DOMContentLoaded in contacts.js.
@@ -36,7 +42,9 @@ export function initContactModals(elements, refreshCallback) {
     deleteConfirmModal = elements.deleteConfirmModal;
     companyTreeContainer = elements.companyTreeContainer;
     companyTreeDiv = elements.companyTreeDiv;
-    editMainCompanySelect = elements.editMainCompanySelect;
+    editMainCompanyInput = elements.editMainCompanyInput;
+    editMainCompanyOptions = elements.editMainCompanyOptions;
+    editAddNewCompanyBtn = elements.editAddNewCompanyBtn;
     addCompanyModal = elements.addCompanyModal;
     companyFormModal = elements.companyFormModal;
     modalCompanyNameInput = elements.modalCompanyNameInput;
@@ -51,6 +59,10 @@ export function initContactModals(elements, refreshCallback) {
     setupAddCompanyModalSubmission();
     setupDeleteConfirmation();
     setupAddNewCompanyButtonInEditModal();
+
+    if (editMainCompanyInput && editMainCompanyOptions) {
+        attachCompanySuggestions(editMainCompanyInput, editMainCompanyOptions);
+    }
 }
 
 /**
@@ -86,64 +98,14 @@ function setupModalCloseListeners() {
 }
 
 /**
- * Populates the main company dropdown in the edit contact modal.
- * @param {string} [selectedCompanyName=''] - The name of the company to pre-select.
- */
-async function populateEditCompanyDropdown(selectedCompanyName = '') {
-    const allCompanies = getAllCompaniesData(); // Get from companyData module
-    editMainCompanySelect.innerHTML = ''; // Clear existing options
-
-    const defaultOption = document.createElement('option');
-    defaultOption.value = "";
-    defaultOption.textContent = "انتخاب کنید...";
-    editMainCompanySelect.appendChild(defaultOption);
-
-    // Collect all unique company and subsidiary names
-    const allCompanyNames = new Set();
-    allCompanies.forEach(company => {
-        if (company.company_name) {
-            allCompanyNames.add(company.company_name);
-        }
-        if (company.sub_company1) {
-            allCompanyNames.add(company.sub_company1);
-        }
-        if (company.sub_company2) {
-            allCompanyNames.add(company.sub_company2);
-        }
-    });
-
-    // Convert Set to Array and sort alphabetically
-    const sortedCompanyNames = Array.from(allCompanyNames).sort((a, b) => a.localeCompare(b, 'fa', { sensitivity: 'base' }));
-
-    sortedCompanyNames.forEach(name => {
-        const option = document.createElement('option');
-        option.value = name;
-        option.textContent = name;
-        editMainCompanySelect.appendChild(option);
-    });
-
-    const addNewOption = document.createElement('option');
-    addNewOption.value = "add_new_company";
-    addNewOption.textContent = "افزودن شرکت جدید...";
-    editMainCompanySelect.appendChild(addNewOption);
-
-    // Pre-select the company if provided
-    if (selectedCompanyName) {
-        editMainCompanySelect.value = selectedCompanyName;
-    }
-}
-
-/**
- * Sets up the event listener for the "Add New Company" option in the edit modal's company dropdown.
+ * Sets up the event listener for the "Add New Company" button in the edit modal.
  */
 function setupAddNewCompanyButtonInEditModal() {
-    if (editMainCompanySelect) {
-        editMainCompanySelect.addEventListener('change', () => {
-            if (editMainCompanySelect.value === 'add_new_company') {
-                companyFormModal.reset(); // Clear form before opening
-                addCompanyModal.style.display = 'flex';
-                modalCompanyNameInput.focus(); // Focus on the first input
-            }
+    if (editAddNewCompanyBtn) {
+        editAddNewCompanyBtn.addEventListener('click', () => {
+            companyFormModal.reset(); // Clear form before opening
+            addCompanyModal.style.display = 'flex';
+            modalCompanyNameInput.focus(); // Focus on the first input
         });
     }
 }
@@ -177,8 +139,7 @@ function setupAddCompanyModalSubmission() {
                     showWarningModal('شرکت با موفقیت اضافه شد!', 'success');
                     companyFormModal.reset();
                     addCompanyModal.style.display = 'none';
-                    await fetchAllCompanies(); // Re-fetch and re-populate all companies for dropdowns
-                    editMainCompanySelect.value = companyData.companyName; // Select the newly added company
+                    editMainCompanyInput.value = companyData.companyName; // Select the newly added company
                 } else {
                     showWarningModal(`خطا: ${result.error || 'افزودن شرکت با شکست مواجه شد.'}`);
                 }
@@ -249,6 +210,9 @@ export async function viewContactDetails(contactId) {
         companyTreeDiv.innerHTML = ''; // Clear previous tree
         companyTreeContainer.classList.add('hidden'); // Hide by default
 
+        if (contact.main_company) {
+            await fetchCompanyFamily(contact.main_company); // Only the companies related to this one
+        }
         const companyHierarchyMap = getCompanyHierarchyMap(); // Get from companyData module
         if (contact.main_company && companyHierarchyMap.size > 0) {
             // Find the root of the hierarchy for the contact's main company
@@ -322,8 +286,8 @@ export async function editContactDetails(contactId) {
         document.getElementById('editContactId').value = contact.id;
         document.getElementById('editFullName').value = contact.full_name || '';
 
-        // Populate the main company dropdown and set its value
-        await populateEditCompanyDropdown(contact.main_company || ''); // Pass current company name for pre-selection
+        // Suggestions for the company input are fetched from the server as the user types
+        editMainCompanyInput.value = contact.main_company || '';
 
         document.getElementById('editJobTitle').value = contact.job_title || '';
         document.getElementById('editMobilePhone').value = contact.mobile_phone || '';
@@ -347,6 +311,10 @@ export async function editContactDetails(contactId) {
         document.getElementById('editPostalCode').value = contact.postal_code || '';
         document.getElementById('editDescription').value = contact.description || '';
 
+        // Snapshot the populated form so the submit handler can send a partial update
+        editOriginalValues = Object.fromEntries(new FormData(document.getElementById('editContactForm')).entries());
+        editContactVersion = contact.version ?? null;
+
         editContactModal.style.display = 'flex'; // Show modal
     } catch (error) {
         console.error('Error fetching contact for edit:', error);
@@ -390,14 +358,32 @@ function setupEditFormSubmission() {
             // Ensure affiliated_company fields are not sent or are empty (as they are removed from HTML)
             delete updatedData.affiliatedCompany1;
             delete updatedData.affiliatedCompany2;
+            delete updatedData.id;
+
+            // Send only the fields that changed, guarded by the row version
+            const changedData = {};
+            for (const key in updatedData) {
+                if (updatedData[key] !== editOriginalValues[key]) {
+                    changedData[key] = updatedData[key];
+                }
+            }
+
+            if (Object.keys(changedData).length === 0) {
+                editContactModal.style.display = 'none'; // Nothing to save
+                return;
+            }
+
+            if (editContactVersion !== null) {
+                changedData.version = editContactVersion;
+            }
 
             try {
                 const response = await fetch(`/api/contacts/${contactId}`, {
-                    method: 'PUT',
+                    method: 'PATCH',
                     headers: {
                         'Content-Type': 'application/json',
                     },
-                    body: JSON.stringify(updatedData),
+                    body: JSON.stringify(changedData),
                 });
 
                 const result = await response.json();
@@ -408,6 +394,8 @@ function setupEditFormSubmission() {
                     if (refreshContactListCallback) {
                         refreshContactListCallback(); // Refresh main table
                     }
+                } else if (response.status === 409) {
+                    showWarningModal('این مخاطب در این فاصله توسط کاربر دیگری ویرایش شده است. لطفاً اطلاعات را دوباره بارگذاری کنید.');
                 } else {
                     showWarningModal(`خطا: ${result.error || 'به‌روزرسانی مخاطب با شکست مواجه شد.'}`);
                 }
@@ -1,5 +1,6 @@
 // static/js/contactTable.js
 // This file handles rendering contacts, pagination, infinite scroll, and applying column visibility.
+// Rows are virtualized: only the visible window of loaded contacts is kept in the DOM.
 
 // DOM elements (will be passed from main contacts.js or queried here if self-contained)
 let contactListBody;
@@ -12,7 +13,7 @@ let toggleColumnsBtn; // Button to open/close column visibility dropdown
 
 // Data and state for table
 let allContactsData = []; // Store all fetched contacts (currently only for export, as display is paginated)
-let currentDisplayedContacts = []; // Store contacts currently displayed in the table
+let currentDisplayedContacts = []; // Store all loaded contacts (only the visible window is in the DOM)
 
 // Pagination/Infinite Scroll state
 let currentPage = 0;
@@ -79,7 +80,7 @@ export function setContactCallbacks(viewCb, editCb, deleteCb) {
 
 export function initContactTable(
     bodyElement, headersElement, scrollContainerElement, loadingIndicatorElement, selectAllCbElement,
-    columnVisibilityDropdownElement, toggleColumnsBtnElement
+    columnVisibilityDropdownElement, toggleColumnsBtnElement, onSelectionChange = null
 ) {
     contactListBody = bodyElement;
     tableHeaders = headersElement;
@@ -88,6 +89,7 @@ export function initContactTable(
     selectAllCheckbox = selectAllCbElement;
     columnVisibilityDropdown = columnVisibilityDropdownElement;
     toggleColumnsBtn = toggleColumnsBtnElement;
+    onSelectionChangeCallback = onSelectionChange;
 
     console.log('initContactTable called.');
     console.log('toggleColumnsBtn element:', toggleColumnsBtn);
@@ -136,16 +138,47 @@ export function initContactTable(
     // Select All Checkbox logic for table rows
     if (selectAllCheckbox) {
         selectAllCheckbox.addEventListener('change', (event) => {
-            const isChecked = event.target.checked;
-            document.querySelectorAll('.row-checkbox').forEach(checkbox => {
-                checkbox.checked = isChecked;
-            });
+            setAllContactsSelected(event.target.checked);
         });
     }
 
+    // Row actions and checkboxes are handled by delegation, so recycled rows need no listeners of their own
+    if (contactListBody) {
+        contactListBody.addEventListener('click', (event) => {
+            const button = event.target.closest('button');
+            const row = event.target.closest('tr.virtual-row');
+            if (!button || !row) return;
+
+            const contactId = row.dataset.contactId;
+            if (button.classList.contains('view-btn')) {
+                if (onViewContactCallback) onViewContactCallback(contactId);
+            } else if (button.classList.contains('edit-btn')) {
+                if (onEditContactCallback) onEditContactCallback(contactId);
+            } else if (button.classList.contains('delete-btn')) {
+                if (onDeleteContactCallback) onDeleteContactCallback(contactId);
+            }
+        });
+
+        contactListBody.addEventListener('change', (event) => {
+            if (!event.target.classList.contains('row-checkbox')) return;
+
+            const contactId = parseInt(event.target.dataset.id);
+            if (event.target.checked) {
+                selectedContactIds.add(contactId);
+            } else {
+                selectedContactIds.delete(contactId);
+            }
+            event.target.closest('tr').classList.toggle('selected-row-highlight', event.target.checked);
+            notifySelectionChange();
+        });
+    }
+
+    window.addEventListener('resize', scheduleVisibleRowsRender);
+
     // Infinite scrolling logic
     if (tableScrollContainer) {
         tableScrollContainer.addEventListener('scroll', () => {
+            scheduleVisibleRowsRender();
             const { scrollTop, scrollHeight, clientHeight } = tableScrollContainer;
             // Check if user scrolled to the bottom (within a small threshold)
             if (scrollTop + clientHeight >= scrollHeight - 5 && !isLoading && hasMoreData) {
@@ -206,7 +239,7 @@ export function populateColumnVisibilityDropdown() {
                 }
             }
             localStorage.setItem('columnVisibility', JSON.stringify(columnVisibility));
-            renderContacts(currentDisplayedContacts); // Re-render with current data to apply visibility
+            applyColumnVisibility(); // Toggle the column classes on the table
         });
     }
 
@@ -233,7 +266,7 @@ export function populateColumnVisibilityDropdown() {
             const columnKey = event.target.dataset.columnKey;
             columnVisibility[columnKey] = event.target.checked;
             localStorage.setItem('columnVisibility', JSON.stringify(columnVisibility)); // Save state
-            renderContacts(currentDisplayedContacts); // Re-render with current data to apply changes
+            applyColumnVisibility(); // Toggle the column classes on the table
             updateToggleAllCheckboxState(); // Update the master checkbox
         });
     });
@@ -273,163 +306,269 @@ export function updateToggleAllCheckboxState() {
 }
 
 
+// Build the stylesheet that drives column visibility. Each data cell and header carries a
+// `col-<key>` class; hiding a column is a single class toggle on the table instead of a
+// style update on every cell of every row.
+function ensureColumnVisibilityStylesheet() {
+    if (document.getElementById('contactColumnVisibilityStyles')) return;
+
+    const styleElement = document.createElement('style');
+    styleElement.id = 'contactColumnVisibilityStyles';
+    styleElement.textContent = Object.keys(columnMap)
+        .map(key => `#contactList.hide-col-${key} .col-${key} { display: none; }`)
+        .join('\n');
+    document.head.appendChild(styleElement);
+}
+
 // Apply column visibility to the table
 export function applyColumnVisibility() {
     if (!tableHeaders || !contactListBody) return;
 
-    tableHeaders.forEach(header => {
-        const sortableButton = header.querySelector('.sortable-header');
-        let actualColumnKey = null;
+    const table = contactListBody.closest('table');
+    if (!table) return;
 
-        if (sortableButton) {
-            actualColumnKey = sortableButton.dataset.sort;
-        }
+    ensureColumnVisibilityStylesheet();
 
-        // Always show checkbox, actions, and explicitly 'full_name' and 'main_company'
-        if (header.querySelector('#selectAllCheckbox') || actualColumnKey === 'full_name' || actualColumnKey === 'main_company') {
-            header.style.display = '';
-        } else if (header.dataset.columnType === 'actions') { // The actions column
-            header.style.display = '';
-        }
-        else if (actualColumnKey && columnVisibility[actualColumnKey]) {
-            header.style.display = ''; // Show header
-        } else if (actualColumnKey) {
-            header.style.display = 'none'; // Hide header
+    // Tag headers once so the stylesheet rules match them as well
+    tableHeaders.forEach(header => {
+        const sortableButton = header.querySelector('.sortable-header');
+        if (sortableButton && sortableButton.dataset.sort) {
+            header.classList.add(`col-${sortableButton.dataset.sort}`);
         }
     });
 
-    // Loop through all rows and hide/show cells
-    document.querySelectorAll('#contactList tbody tr').forEach(row => {
-        const cells = row.querySelectorAll('td');
-        let cellIndex = 0;
+    for (const key in columnMap) {
+        // 'full_name' and 'main_company' are always visible
+        const isVisible = key === 'full_name' || key === 'main_company' || columnVisibility[key];
+        table.classList.toggle(`hide-col-${key}`, !isVisible);
+    }
+}
+
+
+// --- Virtualized rendering ---
+// Only the rows inside the visible window (plus a buffer) exist in the DOM. Two spacer rows
+// keep the scrollbar sized to the full list, and row elements are recycled from a pool.
+const bufferRows = 10; // Extra rows rendered above and below the viewport
+const defaultRowHeight = 49; // Used until a real row has been measured
+let rowHeight = 0;
+let rowPool = [];
+let topSpacerRow = null;
+let bottomSpacerRow = null;
+let emptyStateRow = null;
+let renderedRange = { start: 0, end: 0 };
+let scrollFramePending = false;
+let selectedContactIds = new Set(); // Selection survives row recycling
+let onSelectionChangeCallback = null;
+
+const actionButtonsHtml = `
+    <button class="text-blue-500 hover:text-blue-700 mx-1 view-btn" title="مشاهده">
+        <svg xmlns="http://www.w3.org/2000/svg" class="h-5 w-5" viewBox="0 0 20 20" fill="currentColor">
+            <path d="M10 12a2 2 0 100-4 2 2 0 000 4z" />
+            <path fill-rule="evenodd" d="M.458 10C1.732 5.943 5.522 3 10 3s8.268 2.943 9.542 7c-1.274 4.057-5.064 7-9.542 7S1.732 14.057.458 10zM14 10a4 4 0 11-8 0 4 4 0 018 0z" clip-rule="evenodd" />
+        </svg>
+    </button>
+    <button class="text-yellow-500 hover:text-yellow-700 mx-1 edit-btn" title="ویرایش">
+        <svg xmlns="http://www.w3.org/2000/svg" class="h-5 w-5" viewBox="0 0 20 20" fill="currentColor">
+            <path d="M17.414 2.586a2 2 0 00-2.828 0L7 10.172V13h2.828l7.586-7.586a2 2 0 000-2.828z" />
+            <path fill-rule="evenodd" d="M2 6a2 2 0 012-2h4a1 1 0 010 2H4v10h10v-4a1 1 0 112 0v4a2 2 0 01-2 2H4a2 2 0 01-2-2V6z" clip-rule="evenodd" />
+        </svg>
+    </button>
+    <button class="text-red-500 hover:text-red-700 mx-1 delete-btn" title="حذف">
+        <svg xmlns="http://www.w3.org/2000/svg" class="h-5 w-5" viewBox="0 0 20 20" fill="currentColor">
+            <path fill-rule="evenodd" d="M9 2a1 1 0 00-.894.553L7.382 4H4a1 1 0 000 2v10a2 2 0 002 2h8a2 2 0 002-2V6a1 1 0 100-2h-3.382l-.724-1.447A1 1 0 0011 2H9zM7 8a1 1 0 012 0v6a1 1 0 11-2 0V8zm5-1a1 1 0 00-1 1v6a1 1 0 102 0V8a1 1 0 00-1-1z" clip-rule="evenodd" />
+        </svg>
+    </button>
+`;
+
+function createSpacerRow() {
+    const spacer = document.createElement('tr');
+    spacer.className = 'virtual-spacer';
+    spacer.setAttribute('aria-hidden', 'true');
+    spacer.innerHTML = '<td colspan="26"></td>';
+    return spacer;
+}
+
+// Create a row skeleton once; its cells are refilled whenever the row is recycled
+function createPooledRow() {
+    const row = document.createElement('tr');
+    row.className = 'virtual-row border-b border-gray-200 hover:bg-gray-100';
+
+    const checkboxCell = document.createElement('td');
+    checkboxCell.className = 'py-3 px-6 text-center';
+    checkboxCell.innerHTML = '<input type="checkbox" class="row-checkbox form-checkbox text-blue-600 rounded">';
+    row.appendChild(checkboxCell);
+
+    for (const key in columnMap) {
+        const cell = document.createElement('td');
+        // Add 'phone-number-column' class to relevant cells
+        const extraClass = phoneNumberKeys.includes(key) ? ' phone-number-column' : '';
+        cell.className = `py-3 px-6 text-right col-${key}${extraClass}`;
+        row.appendChild(cell);
+    }
+
+    const actionsCell = document.createElement('td');
+    actionsCell.className = 'py-3 px-6 text-center whitespace-nowrap';
+    actionsCell.innerHTML = actionButtonsHtml;
+    row.appendChild(actionsCell);
 
-        // Checkbox column (index 0) - always visible
-        if (cells[cellIndex]) {
-            cells[cellIndex++].style.display = '';
+    return row;
+}
+
+function fillRow(row, contact) {
+    const cells = row.children;
+    const isSelected = selectedContactIds.has(contact.id);
+
+    row.dataset.contactId = contact.id; // Store contact ID on the row
+    row.classList.toggle('selected-row-highlight', isSelected);
+
+    const checkbox = cells[0].firstElementChild;
+    checkbox.dataset.id = contact.id;
+    checkbox.checked = isSelected;
+
+    let cellIndex = 1;
+    for (const key in columnMap) {
+        const value = contact[key] || '';
+        if (cells[cellIndex].textContent !== value) {
+            cells[cellIndex].textContent = value;
         }
+        cellIndex++;
+    }
+}
 
+function getBodyOffsetTop() {
+    // Distance between the top of the scroll container's content and the first body row (the header height)
+    return topSpacerRow ? topSpacerRow.offsetTop : 0;
+}
 
-        // Data columns based on columnMap
-        for (const key in columnMap) {
-            if (cells[cellIndex]) { // Ensure cell exists
-                // Explicitly ensure 'full_name' and 'main_company' are always visible in rows
-                if (key === 'full_name' || key === 'main_company' || columnVisibility[key]) {
-                    cells[cellIndex].style.display = ''; // Show cell
-                } else {
-                    cells[cellIndex].style.display = 'none'; // Hide cell
-                }
+function measureRowHeight() {
+    if (rowHeight || rowPool.length === 0 || !rowPool[0].isConnected) return;
+    const measured = rowPool[0].getBoundingClientRect().height;
+    if (measured > 0) {
+        rowHeight = measured;
+    }
+}
+
+function renderVisibleRows(force = false) {
+    if (!contactListBody || !topSpacerRow) return;
+
+    const total = currentDisplayedContacts.length;
+    const height = rowHeight || defaultRowHeight;
+    const viewportHeight = tableScrollContainer ? tableScrollContainer.clientHeight : 600;
+    const scrollTop = tableScrollContainer ? Math.max(0, tableScrollContainer.scrollTop - getBodyOffsetTop()) : 0;
+
+    const start = Math.max(0, Math.floor(scrollTop / height) - bufferRows);
+    const end = Math.min(total, Math.ceil((scrollTop + viewportHeight) / height) + bufferRows);
+
+    if (!force && start === renderedRange.start && end === renderedRange.end) return;
+
+    const needed = end - start;
+    while (rowPool.length < needed) {
+        const row = createPooledRow();
+        rowPool.push(row);
+    }
+
+    // Attach the rows needed for this window, detach the surplus (kept in the pool for reuse)
+    for (let i = 0; i < rowPool.length; i++) {
+        const row = rowPool[i];
+        if (i < needed) {
+            fillRow(row, currentDisplayedContacts[start + i]);
+            if (row.parentNode !== contactListBody) {
+                contactListBody.insertBefore(row, bottomSpacerRow);
             }
-            cellIndex++;
+        } else if (row.parentNode) {
+            row.parentNode.removeChild(row);
         }
-        // Actions column - always visible
-        if (cells[cellIndex]) { // Check if actions column exists
-            cells[cellIndex].style.display = '';
+    }
+
+    topSpacerRow.firstElementChild.style.height = `${start * height}px`;
+    bottomSpacerRow.firstElementChild.style.height = `${(total - end) * height}px`;
+    renderedRange = { start, end };
+
+    if (!rowHeight && needed > 0) {
+        measureRowHeight();
+        if (rowHeight && rowHeight !== defaultRowHeight) {
+            renderVisibleRows(true); // Re-layout with the real row height
         }
+    }
+}
+
+function scheduleVisibleRowsRender() {
+    if (scrollFramePending) return;
+    scrollFramePending = true;
+    requestAnimationFrame(() => {
+        scrollFramePending = false;
+        renderVisibleRows();
     });
 }
 
+function notifySelectionChange() {
+    updateSelectAllCheckboxState();
+    if (onSelectionChangeCallback) onSelectionChangeCallback();
+}
+
+// Return the ids of all selected contacts, including rows scrolled out of view
+export function getSelectedContactIds() {
+    return Array.from(selectedContactIds);
+}
+
+// Select or deselect every loaded contact
+export function setAllContactsSelected(isSelected) {
+    if (isSelected) {
+        currentDisplayedContacts.forEach(contact => selectedContactIds.add(contact.id));
+    } else {
+        selectedContactIds.clear();
+    }
+    renderVisibleRows(true);
+    notifySelectionChange();
+}
 
 // Function to render contacts into the table
 export function renderContacts(contactsToRender, append = false) {
     if (!contactListBody) return; // Ensure element exists
 
     if (!append) {
-        contactListBody.innerHTML = ''; // Clear existing rows if not appending
         currentDisplayedContacts = []; // Reset displayed contacts
+        selectedContactIds.clear();
+        renderedRange = { start: 0, end: 0 };
     }
 
-    if (contactsToRender.length === 0 && !append) {
-        const noContactsRow = document.createElement('tr');
-        noContactsRow.innerHTML = `<td colspan="26" class="py-3 px-6 text-center text-gray-500">هیچ مخاطبی یافت نشد.</td>`;
-        contactListBody.appendChild(noContactsRow);
-        return;
+    if (!topSpacerRow || !topSpacerRow.isConnected) {
+        contactListBody.innerHTML = '';
+        topSpacerRow = createSpacerRow();
+        bottomSpacerRow = createSpacerRow();
+        contactListBody.appendChild(topSpacerRow);
+        contactListBody.appendChild(bottomSpacerRow);
     }
 
-    contactsToRender.forEach(contact => {
-        const row = document.createElement('tr');
-        row.className = 'border-b border-gray-200 hover:bg-gray-100';
-        row.dataset.contactId = contact.id; // Store contact ID on the row
+    if (emptyStateRow && emptyStateRow.parentNode) {
+        emptyStateRow.parentNode.removeChild(emptyStateRow);
+    }
 
-        let rowHtml = `
-            <td class="py-3 px-6 text-center">
-                <input type="checkbox" class="row-checkbox form-checkbox text-blue-600 rounded" data-id="${contact.id}">
-            </td>
-        `;
-        for (const key in columnMap) {
-            // Add 'phone-number-column' class to relevant cells
-            const isPhoneNumberColumn = phoneNumberKeys.includes(key);
-            const extraClass = isPhoneNumberColumn ? 'phone-number-column' : '';
-            rowHtml += `<td class="py-3 px-6 text-right ${extraClass}">${contact[key] || ''}</td>`;
-        }
+    currentDisplayedContacts.push(...contactsToRender);
 
-        rowHtml += `
-            <td class="py-3 px-6 text-center whitespace-nowrap">
-                <button class="text-blue-500 hover:text-blue-700 mx-1 view-btn" data-id="${contact.id}" title="مشاهده">
-                    <svg xmlns="http://www.w3.org/2000/svg" class="h-5 w-5" viewBox="0 0 20 20" fill="currentColor">
-                        <path d="M10 12a2 2 0 100-4 2 2 0 000 4z" />
-                        <path fill-rule="evenodd" d="M.458 10C1.732 5.943 5.522 3 10 3s8.268 2.943 9.542 7c-1.274 4.057-5.064 7-9.542 7S1.732 14.057.458 10zM14 10a4 4 0 11-8 0 4 4 0 018 0z" clip-rule="evenodd" />
-                    </svg>
-                </button>
-                <button class="text-yellow-500 hover:text-yellow-700 mx-1 edit-btn" data-id="${contact.id}" title="ویرایش">
-                    <svg xmlns="http://www.w3.org/2000/svg" class="h-5 w-5" viewBox="0 0 20 20" fill="currentColor">
-                        <path d="M17.414 2.586a2 2 0 00-2.828 0L7 10.172V13h2.828l7.586-7.586a2 2 0 000-2.828z" />
-                        <path fill-rule="evenodd" d="M2 6a2 2 0 012-2h4a1 1 0 010 2H4v10h10v-4a1 1 0 112 0v4a2 2 0 01-2 2H4a2 2 0 01-2-2V6z" clip-rule="evenodd" />
-                    </svg>
-                </button>
-                <button class="text-red-500 hover:text-red-700 mx-1 delete-btn" data-id="${contact.id}" title="حذف">
-                    <svg xmlns="http://www.w3.org/2000/svg" class="h-5 w-5" viewBox="0 0 20 20" fill="currentColor">
-                        <path fill-rule="evenodd" d="M9 2a1 1 0 00-.894.553L7.382 4H4a1 1 0 000 2v10a2 2 0 002 2h8a2 2 0 002-2V6a1 1 0 100-2h-3.382l-.724-1.447A1 1 0 0011 2H9zM7 8a1 1 0 012 0v6a1 1 0 11-2 0V8zm5-1a1 1 0 00-1 1v6a1 1 0 102 0V8a1 1 0 00-1-1z" clip-rule="evenodd" />
-                    </svg>
-                </button>
-            </td>
-        `;
-        row.innerHTML = rowHtml;
-        contactListBody.appendChild(row);
-        currentDisplayedContacts.push(contact); // Add to currently displayed
-    });
+    if (currentDisplayedContacts.length === 0) {
+        if (!emptyStateRow) {
+            emptyStateRow = document.createElement('tr');
+            emptyStateRow.innerHTML = `<td colspan="26" class="py-3 px-6 text-center text-gray-500">هیچ مخاطبی یافت نشد.</td>`;
+        }
+        contactListBody.insertBefore(emptyStateRow, bottomSpacerRow);
+    }
 
-    // Re-apply column visibility after rendering new rows
     applyColumnVisibility();
-    updateSelectAllCheckboxState(); // Update select all checkbox after rendering
-
-    // Add event listeners for view, edit, and delete buttons
-    document.querySelectorAll('.view-btn').forEach(button => {
-        button.addEventListener('click', (event) => {
-            const contactId = event.target.closest('button').dataset.id;
-            if (onViewContactCallback) onViewContactCallback(contactId);
-        });
-    });
-
-    document.querySelectorAll('.edit-btn').forEach(button => {
-        button.addEventListener('click', (event) => {
-            const contactId = event.target.closest('button').dataset.id;
-            if (onEditContactCallback) onEditContactCallback(contactId);
-        });
-    });
-
-    document.querySelectorAll('.delete-btn').forEach(button => {
-        button.addEventListener('click', (event) => {
-            const contactId = event.target.closest('button').dataset.id;
-            if (onDeleteContactCallback) onDeleteContactCallback(contactId);
-        });
-    });
-
-    // Add event listeners for individual row checkboxes
-    document.querySelectorAll('.row-checkbox').forEach(checkbox => {
-        checkbox.addEventListener('change', updateSelectAllCheckboxState);
-    });
+    renderVisibleRows(true);
+    notifySelectionChange();
 }
 
-// Function to update Select All Checkbox state based on individual row checkboxes
+// Function to update Select All Checkbox state based on the selected contacts
 export function updateSelectAllCheckboxState() {
     if (!selectAllCheckbox) return;
 
-    const allCheckboxes = document.querySelectorAll('.row-checkbox');
-    const checkedCheckboxes = document.querySelectorAll('.row-checkbox:checked');
-    if (allCheckboxes.length > 0 && allCheckboxes.length === checkedCheckboxes.length) {
+    const totalCount = currentDisplayedContacts.length;
+    const selectedCount = selectedContactIds.size;
+    if (totalCount > 0 && selectedCount === totalCount) {
         selectAllCheckbox.checked = true;
         selectAllCheckbox.indeterminate = false;
-    } else if (checkedCheckboxes.length > 0) {
+    } else if (selectedCount > 0) {
         selectAllCheckbox.checked = false;
         selectAllCheckbox.indeterminate = true;
     } else {
@@ -457,6 +596,14 @@ export async function fetchContacts(term = '', offset = 0, limit = itemsPerPage,
             sort_direction: sortDir
         });
         const response = await fetch(`/api/contacts/search?${params.toString()}`);
+        if (response.status === 422) {
+            // The search hit its query time budget on the server
+            if (contactListBody && offset === 0) {
+                contactListBody.innerHTML = `<td colspan="26" class="py-3 px-6 text-center text-red-500">این جستجو بیش از حد سنگین است. لطفاً عبارت جستجو را دقیق‌تر کنید.</td>`;
+            }
+            hasMoreData = false;
+            return;
+        }
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
@@ -7,10 +7,10 @@ import {
     getAllContactsForExport,
     getCurrentSearchAndSortParams,
     setContactCallbacks,
+    getSelectedContactIds,
     columnMap // columnMap is needed for export functionality
     // Removed renderContactTable as it's not exported by contactTable.js based on the error
 } from './contactTable.js';
-import { fetchAllCompanies } from './companyData.js'; // This now also handles fetching all companies data
 import { initContactModals, viewContactDetails, editContactDetails, showDeleteConfirmModal } from './contactModals.js';
 import { debounce, showWarningModal } from './utils.js';
 
@@ -47,7 +47,9 @@ document.addEventListener('DOMContentLoaded', async () => {
     const autosuggestDropdown = document.getElementById('autosuggestDropdown');
 
     // Edit Contact Modal specific elements (for passing to contactModals.js)
-    const editMainCompanySelect = document.getElementById('editMainCompany');
+    const editMainCompanyInput = document.getElementById('editMainCompany');
+    const editMainCompanyOptions = document.getElementById('editMainCompanyOptions');
+    const editAddNewCompanyBtn = document.getElementById('editAddNewCompanyBtn');
     const addCompanyModal = document.getElementById('addCompanyModal');
     const companyFormModal = document.getElementById('addCompanyModal').querySelector('form');
     const modalCompanyNameInput = document.getElementById('modalCompanyName');
@@ -63,7 +65,6 @@ document.addEventListener('DOMContentLoaded', async () => {
     // --- State Variables (managed by contactTable.js, but referenced here) ---
     let currentSortColumn = null;
     let currentSortDirection = 'asc'; // 'asc' or 'desc'
-    let allCompaniesData = []; // This will store all companies for the tree view
 
 
     // --- Helper function to render the company tree ---
@@ -158,19 +159,11 @@ document.addEventListener('DOMContentLoaded', async () => {
         companyTreeContainer.style.display = 'block';
     }
 
-    // --- Function to update bulk actions visibility and row highlights ---
+    // --- Function to update bulk actions visibility ---
+    // Row highlights and the select-all checkbox are maintained by contactTable.js,
+    // since rows outside the visible window are not in the DOM.
     function updateBulkActionsAndHighlights() {
-        const checkboxes = document.querySelectorAll('.row-checkbox');
-        let checkedCount = 0;
-        checkboxes.forEach(checkbox => {
-            const row = checkbox.closest('tr');
-            if (checkbox.checked) {
-                checkedCount++;
-                row.classList.add('selected-row-highlight');
-            } else {
-                row.classList.remove('selected-row-highlight');
-            }
-        });
+        const checkedCount = getSelectedContactIds().length;
 
         if (checkedCount > 0) {
             bulkActionsContainer.classList.remove('hidden');
@@ -179,33 +172,26 @@ document.addEventListener('DOMContentLoaded', async () => {
             bulkActionsContainer.classList.add('hidden');
             bulkActionsContainer.classList.remove('flex');
         }
-
-        // Update selectAllCheckbox state
-        selectAllCheckbox.checked = checkedCount === checkboxes.length && checkboxes.length > 0;
-        selectAllCheckbox.indeterminate = checkedCount > 0 && checkedCount < checkboxes.length;
     }
 
 
     // --- Initialization Functions ---
 
-    // 1. Fetch all companies early for dropdowns and tree diagrams
-    allCompaniesData = await fetchAllCompanies(); // Store fetched companies globally
-
-    // 2. Initialize Contact Table functionality
+    // 1. Initialize Contact Table functionality
     initContactTable(
         contactListBody, tableHeaders, tableScrollContainer, loadingIndicator, selectAllCheckbox,
         columnVisibilityDropdown, toggleColumnsBtn, updateBulkActionsAndHighlights // Pass the new callback
     );
 
-    // 3. Initialize Contact Modals functionality
-    // Pass renderCompanyTree and allCompaniesData to initContactModals
+    // 2. Initialize Contact Modals functionality
+    // Companies are fetched on demand: name suggestions while typing, a single hierarchy for the tree
     initContactModals({
         viewContactModal, editContactModal, deleteConfirmModal,
-        companyTreeContainer, companyTreeDiv, editMainCompanySelect,
+        companyTreeContainer, companyTreeDiv, editMainCompanyInput,
+        editMainCompanyOptions, editAddNewCompanyBtn,
         addCompanyModal, companyFormModal, modalCompanyNameInput,
         modalSubCompany1Input, modalSubCompany2Input, confirmDeleteBtn,
-        renderCompanyTreeCallback: renderCompanyTree, // Pass the render function
-        allCompanies: allCompaniesData // Pass all companies data
+        renderCompanyTreeCallback: renderCompanyTree // Pass the render function
     }, () => {
         initiateSearchOrLoadMore('', currentSortColumn, currentSortDirection);
         // Ensure updateBulkActionsAndHighlights is called after table refresh
@@ -213,32 +199,16 @@ document.addEventListener('DOMContentLoaded', async () => {
         updateBulkActionsAndHighlights();
     }); // Pass refresh callback
 
-    // 4. Set callbacks for actions from contactTable.js (buttons in table rows)
+    // 3. Set callbacks for actions from contactTable.js (buttons in table rows)
     setContactCallbacks(viewContactDetails, editContactDetails, showDeleteConfirmModal);
 
 
-    // 5. Initial fetch of contacts for the table
+    // 4. Initial fetch of contacts for the table
     initiateSearchOrLoadMore('', currentSortColumn, currentSortDirection);
 
 
     // --- Event Listeners ---
 
-    // Event listener for individual row checkboxes (delegated to contactListBody)
-    contactListBody.addEventListener('change', (event) => {
-        if (event.target.classList.contains('row-checkbox')) {
-            updateBulkActionsAndHighlights();
-        }
-    });
-
-    // Event listener for select all checkbox
-    selectAllCheckbox.addEventListener('change', () => {
-        const isChecked = selectAllCheckbox.checked;
-        document.querySelectorAll('.row-checkbox').forEach(checkbox => {
-            checkbox.checked = isChecked;
-        });
-        updateBulkActionsAndHighlights();
-    });
-
     // Debounced search input handler for main table search
     const debouncedTableSearch = debounce(() => initiateSearchOrLoadMore(searchInput.value.trim().toLowerCase(), currentSortColumn, currentSortDirection), 300);
 
@@ -372,8 +342,7 @@ document.addEventListener('DOMContentLoaded', async () => {
 
     // Export to Excel functionality
     exportExcelBtn.addEventListener('click', async () => {
-        const selectedContactIds = Array.from(document.querySelectorAll('.row-checkbox:checked'))
-                                       .map(checkbox => parseInt(checkbox.dataset.id));
+        const selectedContactIds = getSelectedContactIds();
 
         let dataToExport = [];
         if (selectedContactIds.length > 0) {
@@ -391,6 +360,10 @@ document.addEventListener('DOMContentLoaded', async () => {
                     export_all: 'true' // Indicate to backend to send all data
                 });
                 const response = await fetch(`/api/contacts/search?${params.toString()}`);
+                if (response.status === 422) {
+                    showWarningModal('خروجی این جستجو بیش از حد سنگین است. لطفاً عبارت جستجو را دقیق‌تر کنید.');
+                    return;
+                }
                 if (!response.ok) throw new Error('Failed to fetch all contacts for export.');
                 const result = await response.json();
                 dataToExport = result.contacts;
@@ -426,8 +399,7 @@ document.addEventListener('DOMContentLoaded', async () => {
 
     // Delete Selected Contacts functionality
     deleteSelectedBtn.addEventListener('click', async () => {
-        const selectedContactIds = Array.from(document.querySelectorAll('.row-checkbox:checked'))
-                                       .map(checkbox => parseInt(checkbox.dataset.id));
+        const selectedContactIds = getSelectedContactIds();
 
         if (selectedContactIds.length === 0) {
             showWarningModal('هیچ مخاطبی برای حذف انتخاب نشده است.');
@@ -471,22 +443,30 @@ document.addEventListener('DOMContentLoaded', async () => {
             let errorCount = 0;
             const errors = [];
 
-            for (const id of selectedContactIds) {
-                try {
-                    const response = await fetch(`/api/contacts/${id}`, {
-                        method: 'DELETE',
+            // All selected contacts are deleted in a single request and transaction
+            try {
+                const response = await fetch('/api/contacts/bulk_delete', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ ids: selectedContactIds })
+                });
+                const result = await response.json();
+                if (response.ok) {
+                    result.results.forEach(outcome => {
+                        if (outcome.status === 'deleted') {
+                            successCount++;
+                        } else {
+                            errors.push(`خطا در حذف مخاطب با شناسه ${outcome.id}: مخاطب یافت نشد`);
+                            errorCount++;
+                        }
                     });
-                    if (response.ok) {
-                        successCount++;
-                    } else {
-                        const result = await response.json();
-                        errors.push(`خطا در حذف مخاطب با شناسه ${id}: ${result.error || 'خطای ناشناخته'}`);
-                        errorCount++;
-                    }
-                } catch (error) {
-                    errors.push(`خطا در حذف مخاطب با شناسه ${id}: ${error.message}`);
-                    errorCount++;
+                } else {
+                    errors.push(`خطا در حذف گروهی: ${result.error || 'خطای ناشناخته'}`);
+                    errorCount = selectedContactIds.length;
                 }
+            } catch (error) {
+                errors.push(`خطا در حذف گروهی: ${error.message}`);
+                errorCount = selectedContactIds.length;
             }
 
             loadingIndicator.style.display = 'none';
@@ -578,6 +558,8 @@ document.addEventListener('DOMContentLoaded', async () => {
 
                     const formData = new FormData();
                     formData.append('file', file);
+                    // Re-importing a corrected sheet updates existing contacts instead of duplicating them
+                    formData.append('mode', 'upsert');
 
                     const response = await fetch('/api/contacts/import', {
                         method: 'POST',
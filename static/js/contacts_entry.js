@@ -1,14 +1,16 @@
 // JavaScript for contacts_entry.html
 // This file will handle form submission for adding new contact data,
-// company dropdown population, adding new companies via modal, and sidebar highlighting.
+// company name suggestions, adding new companies via modal, and sidebar highlighting.
 
 import { showWarningModal } from './utils.js'; // Import the shared warning modal
+import { attachCompanySuggestions } from './companyData.js';
 
 document.addEventListener('DOMContentLoaded', () => {
     console.log('Contacts Entry page loaded.');
 
     const contactForm = document.getElementById('contactForm');
-    const mainCompanySelect = document.getElementById('mainCompany');
+    const mainCompanyInput = document.getElementById('mainCompany');
+    const mainCompanyOptions = document.getElementById('mainCompanyOptions');
     const addNewCompanyBtn = document.getElementById('addNewCompanyBtn');
 
     // Add Company Modal elements
@@ -22,8 +24,6 @@ document.addEventListener('DOMContentLoaded', () => {
     const warningModal = document.getElementById('warningModal'); // Keep reference for closing via window click
     // No longer need to reference warningMessage directly here as showWarningModal handles it.
 
-    let allCompaniesData = []; // To store all fetched companies
-
     // Function to highlight the active link in the sidebar
     function highlightActiveSidebarLink() {
         const sidebarLinks = document.querySelectorAll('.sidebar-link');
@@ -45,45 +45,6 @@ document.addEventListener('DOMContentLoaded', () => {
     // Call the function when the page loads
     highlightActiveSidebarLink();
 
-    // Function to fetch all companies and populate the dropdown
-    async function fetchAndPopulateCompanies() {
-        try {
-            const response = await fetch('/api/companies');
-            allCompaniesData = await response.json();
-            populateCompanyDropdown(allCompaniesData);
-        } catch (error) {
-            console.error('Error fetching companies:', error);
-            showWarningModal('خطا در بارگذاری لیست شرکت‌ها.'); // Use imported modal
-        }
-    }
-
-    // Function to populate the company dropdown
-    function populateCompanyDropdown(companies) {
-        mainCompanySelect.innerHTML = ''; // Clear existing options
-
-        const defaultOption = document.createElement('option');
-        defaultOption.value = "";
-        defaultOption.textContent = "انتخاب کنید...";
-        mainCompanySelect.appendChild(defaultOption);
-
-        // Collect all unique company and subsidiary names
-        const allNames = new Set();
-        companies.forEach(company => {
-            if (company.company_name) allNames.add(company.company_name);
-            if (company.sub_company1) allNames.add(company.sub_company1);
-            if (company.sub_company2) allNames.add(company.sub_company2);
-        });
-
-        const sortedNames = Array.from(allNames).sort((a, b) => a.localeCompare(b, 'fa', { sensitivity: 'base' }));
-
-        sortedNames.forEach(name => {
-            const option = document.createElement('option');
-            option.value = name;
-            option.textContent = name;
-            mainCompanySelect.appendChild(option);
-        });
-    }
-
     // Event listener for "Add New Company" button
     if (addNewCompanyBtn) {
         addNewCompanyBtn.addEventListener('click', () => {
@@ -118,8 +79,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 if (response.ok) {
                     showWarningModal('شرکت با موفقیت اضافه شد!', 'success'); // Use imported modal
                     addCompanyModal.style.display = 'none'; // Close modal
-                    await fetchAndPopulateCompanies(); // Re-fetch and re-populate dropdown
-                    mainCompanySelect.value = companyData.companyName; // Select the newly added company
+                    mainCompanyInput.value = companyData.companyName; // Select the newly added company
                 } else {
                     showWarningModal(`خطا: ${result.error || 'افزودن شرکت با شکست مواجه شد.'}`); // Use imported modal
                 }
@@ -213,6 +173,6 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
-    // Initial fetch of companies when the page loads
-    fetchAndPopulateCompanies();
+    // Company names are suggested from the server as the user types
+    attachCompanySuggestions(mainCompanyInput, mainCompanyOptions);
 });
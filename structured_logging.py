@@ -0,0 +1,167 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+from flask import has_request_context, request, session
+
+from metrics import REGISTRY
+
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    "phonedash_log_records_dropped_total",
+    "Log records dropped because the log queue was full.",
+)
+LOG_RECORDS_SAMPLED = REGISTRY.counter(
+    "phonedash_log_records_sampled_total",
+    "Log records suppressed by high-frequency message sampling.",
+)
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_STANDARD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, including extra= fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S")
+            + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through at most ``limit`` records per message template per window.
+
+    Only records below WARNING are sampled. Records are grouped by logger and
+    unformatted message, so messages logged with %-style arguments share a
+    template. The next record of a template that passes carries the number of
+    suppressed ones in its ``sampled`` field.
+    """
+
+    def __init__(self, limit, window):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._counts = {}
+        self._suppressed = {}
+
+    def filter(self, record):
+        if self.limit <= 0 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg if isinstance(record.msg, str) else id(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            if now - self._window_start >= self.window:
+                # Starting a fresh window also bounds the memory used by unique messages
+                self._window_start = now
+                self._counts.clear()
+            count = self._counts.get(key, 0) + 1
+            self._counts[key] = count
+            if count > self.limit:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                LOG_RECORDS_SAMPLED.inc()
+                return False
+            suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            record.sampled = suppressed
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread without formatting or blocking.
+
+    The message itself is formatted later by the listener; only what depends on
+    the request thread (request context, exception traceback) is captured here.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self._dropped = 0
+        self._exception_formatter = logging.Formatter()
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+        # Traceback frames must not outlive the request thread's use of them
+        record.exc_info = None
+        if has_request_context():
+            record.method = request.method
+            record.path = request.path
+            record.user_id = session.get("user_id")
+        return record
+
+    def enqueue(self, record):
+        if self._dropped:
+            record.dropped = self._dropped
+        try:
+            self.queue.put_nowait(record)
+            self._dropped = 0
+        except queue.Full:
+            self._dropped += 1
+            LOG_RECORDS_DROPPED.inc()
+
+
+def setup_queue_logging(
+    level, logger_levels, log_format, log_file, queue_size, sample_limit, sample_window
+):
+    """Routes every log record through a queue to a background listener thread."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    if log_format == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        handlers.append(
+            logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=10 * 1024 * 1024, backupCount=5, encoding="utf-8"
+            )
+        )
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_limit, sample_window))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    for name, logger_level in logger_levels.items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+    # Flush whatever is still queued when the process exits
+    atexit.register(_listener.stop)
+    return _listener
@@ -0,0 +1,288 @@
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+from flask import g, has_request_context, jsonify
+
+from config import (
+    WRITE_BATCH_MAX,
+    WRITE_BATCH_WINDOW,
+    WRITE_COORDINATOR,
+    WRITE_QUEUE_TIMEOUT,
+)
+from database import get_db_connection
+from metrics import REGISTRY
+from query_budget import current_query_budget, install_query_budget
+
+logger = logging.getLogger("phonedash.writer")
+
+WRITE_BATCHES = REGISTRY.counter(
+    "phonedash_write_batches_total",
+    "Transactions committed by the write coordinator, by outcome.",
+    ("outcome",),
+)
+WRITE_BATCH_SIZE = REGISTRY.histogram(
+    "phonedash_write_batch_size",
+    "Writes committed together in one transaction.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+WRITE_QUEUE_WAIT = REGISTRY.histogram(
+    "phonedash_write_queue_wait_seconds",
+    "Time writes waited for the writer thread, in seconds.",
+)
+WRITE_QUEUE_DEPTH = REGISTRY.gauge(
+    "phonedash_write_queue_depth",
+    "Writes waiting for the writer thread.",
+)
+
+
+class WriteQueueTimeout(Exception):
+    """Raised when a write could not start within WRITE_QUEUE_TIMEOUT; it was not applied."""
+
+
+def write_busy_response():
+    """The 503 response returned when a write timed out waiting for the writer thread."""
+    return (
+        jsonify({"error": "Server is busy, please try again shortly"}),
+        503,
+        {"Retry-After": str(max(1, int(WRITE_QUEUE_TIMEOUT)))},
+    )
+
+
+class WriteOperation:
+    """One request's write: ``func(cursor, *args)`` and, once committed, its outcome."""
+
+    __slots__ = (
+        "func",
+        "args",
+        "exclusive",
+        "budget",
+        "queued_at",
+        "run_seconds",
+        "state",
+        "result",
+        "error",
+        "lock",
+        "done",
+    )
+
+    def __init__(self, func, args, exclusive, budget=None):
+        self.func = func
+        self.args = args
+        self.exclusive = exclusive
+        # The submitting request's QueryBudget; its SQL deadline also binds the write
+        self.budget = budget
+        self.queued_at = time.monotonic()
+        # Time spent in ``func`` on the writer thread, across retries
+        self.run_seconds = 0.0
+        self.state = "queued"
+        self.result = None
+        self.error = None
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    def claim(self):
+        """Marks the operation as started; False if its request already gave up on it."""
+        with self.lock:
+            if self.state != "queued":
+                return False
+            self.state = "running"
+            return True
+
+    def cancel(self):
+        """Withdraws a queued operation; False if the writer has already started it."""
+        with self.lock:
+            if self.state != "queued":
+                return False
+            self.state = "cancelled"
+            return True
+
+
+class WriteCoordinator:
+    """Applies writes on a single thread, committing concurrent writes together.
+
+    Each batch is one transaction, so a burst of N writes costs one lock
+    acquisition and one fsync instead of N, and writers of this process never
+    compete for SQLite's write lock. Every write runs in its own savepoint: a
+    failing write is rolled back and reports its own error while the rest of
+    the batch commits. Results are handed back only after the commit.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._carry = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=10):
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def submit(self, func, args, exclusive=False):
+        operation = WriteOperation(func, args, exclusive, current_query_budget())
+        self._queue.put(operation)
+        WRITE_QUEUE_DEPTH.inc()
+        if not operation.done.wait(WRITE_QUEUE_TIMEOUT):
+            if operation.cancel():
+                WRITE_QUEUE_DEPTH.dec()
+                raise WriteQueueTimeout("Write did not start within the queue timeout")
+            # Already running; its transaction is about to finish
+            operation.done.wait()
+        if has_request_context():
+            # The request's profile and SQL timings cannot see the writer thread
+            g.write_seconds = g.get("write_seconds", 0.0) + operation.run_seconds
+        if operation.error is not None:
+            raise operation.error
+        return operation.result
+
+    def _next_batch(self):
+        first = self._carry or self._queue.get()
+        self._carry = None
+        if first is None:
+            return None
+        batch = [first]
+        if first.exclusive:
+            return batch
+        deadline = time.monotonic() + WRITE_BATCH_WINDOW
+        while len(batch) < WRITE_BATCH_MAX:
+            try:
+                operation = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if operation is None:
+                # Shutdown: finish this batch first
+                self._queue.put(None)
+                break
+            if operation.exclusive:
+                # Exclusive writes (imports) get the next transaction to themselves
+                self._carry = operation
+                break
+            batch.append(operation)
+        return batch
+
+    def _run(self):
+        conn = get_db_connection()
+        # Transactions are managed explicitly
+        conn.isolation_level = None
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+                try:
+                    self._apply(conn, batch)
+                except Exception as e:
+                    logger.error("Write coordinator error: %s", e, exc_info=True)
+                    if conn.in_transaction:
+                        conn.rollback()
+        finally:
+            conn.close()
+
+    def _apply(self, conn, batch):
+        claimed = [operation for operation in batch if operation.claim()]
+        WRITE_QUEUE_DEPTH.dec(amount=len(claimed))
+        if not claimed:
+            return
+        now = time.monotonic()
+        for operation in claimed:
+            WRITE_QUEUE_WAIT.observe(now - operation.queued_at)
+
+        try:
+            pending = claimed
+            while pending:
+                pending = self._transaction(conn, pending)
+        finally:
+            for operation in claimed:
+                operation.done.set()
+
+    def _transaction(self, conn, operations):
+        """Applies ``operations`` in one transaction.
+
+        An operation that overruns its request's query budget is interrupted,
+        and SQLite then rolls back the whole transaction rather than the
+        savepoint. The other operations are returned to be applied again in a
+        new transaction; otherwise the result is empty.
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for index, operation in enumerate(operations):
+                cursor.execute("SAVEPOINT write_operation")
+                install_query_budget(conn, operation.budget)
+                started = time.perf_counter()
+                try:
+                    operation.result = operation.func(cursor, *operation.args)
+                except Exception as e:
+                    operation.error = e
+                    if not conn.in_transaction:
+                        logger.warning(
+                            "Write transaction rolled back by SQLite (%s); retrying %d other writes",
+                            e,
+                            len(operations) - 1,
+                        )
+                        for earlier in operations[:index]:
+                            earlier.result, earlier.error = None, None
+                        return operations[:index] + operations[index + 1 :]
+                    cursor.execute("ROLLBACK TO write_operation")
+                finally:
+                    operation.run_seconds += time.perf_counter() - started
+                    conn.set_progress_handler(None, 0)
+                cursor.execute("RELEASE write_operation")
+            cursor.execute("COMMIT")
+            WRITE_BATCHES.inc(("committed",))
+            WRITE_BATCH_SIZE.observe(len(operations))
+        except sqlite3.Error as e:
+            # The whole transaction is lost; every write in it reports the failure
+            logger.error("Write batch of %d failed: %s", len(operations), e, exc_info=True)
+            if conn.in_transaction:
+                conn.rollback()
+            WRITE_BATCHES.inc(("failed",))
+            for operation in operations:
+                operation.result, operation.error = None, operation.error or e
+        return []
+
+
+_coordinator = None
+
+
+def run_write(func, *args, exclusive=False):
+    """Runs ``func(cursor, *args)`` in a write transaction and returns its result once committed.
+
+    With the write coordinator running, the call is applied by the writer
+    thread, possibly in one transaction with other requests' writes; ``func``
+    must therefore not touch the request context and must not commit. An
+    exception raised by ``func`` rolls back its own changes only and is
+    re-raised here. ``exclusive`` writes (large imports) run in a transaction
+    of their own. Raises WriteQueueTimeout if the write could not start in time.
+    """
+    if _coordinator is not None:
+        return _coordinator.submit(func, args, exclusive)
+
+    conn = get_db_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        result = func(conn.cursor(), *args)
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def init_write_coordinator(app):
+    """Starts the writer thread if enabled in the configuration."""
+    global _coordinator
+    if not WRITE_COORDINATOR:
+        return
+    _coordinator = WriteCoordinator()
+    _coordinator.start()